@@ -1,7 +1,7 @@
 # -*- mode: python ; coding: utf-8 -*-
 from PyInstaller.utils.hooks import collect_all
 
-datas = [('icon.png', '.'), ('icon.ico', '.')]
+datas = [('icon.png', '.'), ('icon.ico', '.'), ('icon_32.png', '.')]
 binaries = []
 hiddenimports = ['keyboard', 'mouse', 'PIL', 'clicker_core']
 tmp_ret = collect_all('customtkinter')
@@ -0,0 +1,308 @@
+import time
+import asyncio
+import threading
+
+from input_backend import default_backend, begin_timer_period, end_timer_period, enable_dpi_awareness
+from macro import OP_CLICK, OP_DOUBLE_CLICK, OP_PRESS, OP_RELEASE, KEY_OPS
+from events import BUTTON_NAMES, key_label
+from playback import PlaybackStats, MIN_SPEED, MAX_SPEED
+from timing_stats import IntervalHistogram
+
+# --- Concurrent playback ---
+# Many macros on one asyncio event loop instead of one sleeping thread each.
+# Every macro is a coroutine that awaits its next op's absolute deadline, so
+# the loop's timer heap does the scheduling: a wake-up costs O(log n) in the
+# number of running macros and the thread count stays at one. Due ops don't
+# touch the backend themselves; they go onto one output queue that a single
+# injector drains in order, so input from different macros is serialized,
+# the cursor position is tracked in one place, and clicks that fall due
+# together go out as one send_batch() call.
+
+PENDING = 'pending'
+RUNNING = 'running'
+PAUSED = 'paused'
+DONE = 'done'
+CANCELLED = 'cancelled'
+
+class PlaybackTask:
+    """
+    One macro running on an AsyncMacroPlayer. pause(), resume() and cancel()
+    may be called from any thread. A pause shifts all later deadlines by its
+    length, so the rest of the macro keeps its recorded timing.
+    """
+    def __init__(self, player, macro, speed=1.0, repeat=1, name=None):
+        self.player = player
+        self.macro = macro
+        self.speed = min(MAX_SPEED, max(MIN_SPEED, float(speed)))
+        self.repeat = repeat
+        self.name = name
+        self.state = PENDING
+        self.finished = threading.Event()
+        self.iterations = 0
+        self.ops_done = 0
+        self.start_time = None
+        self.end_time = None
+        self.lateness = IntervalHistogram() # due time -> queued, seconds
+        self._task = None
+        self._resumed = None
+        self._paused_at = None
+        self._pause_offset = 0.0
+
+    # --- Control (any thread) ---
+    def pause(self):
+        self.player._call(self._pause)
+
+    def resume(self):
+        self.player._call(self._resume)
+
+    def cancel(self):
+        self.player._call(self._cancel)
+
+    def wait(self, timeout=None):
+        return self.finished.wait(timeout)
+
+    # --- Loop thread ---
+    def _pause(self):
+        if self.state == RUNNING:
+            self.state = PAUSED
+            self._paused_at = self.player.loop.time()
+            self._resumed.clear()
+
+    def _resume(self):
+        if self.state == PAUSED:
+            self._pause_offset += self.player.loop.time() - self._paused_at
+            self._paused_at = None
+            self.state = RUNNING
+            self._resumed.set()
+
+    def _cancel(self):
+        if self.state in (DONE, CANCELLED):
+            return
+        self.state = CANCELLED
+        if self._task is not None and not self._task.done():
+            self._task.cancel()
+        else:
+            self._finish()
+
+    def _finish(self):
+        self.end_time = time.perf_counter()
+        self.finished.set()
+
+    def snapshot(self):
+        start_time = self.start_time
+        if start_time is None:
+            return PlaybackStats(False, 0, 0.0, 0.0)
+        end_time = self.end_time
+        elapsed = (end_time or time.perf_counter()) - start_time
+        per_minute = self.iterations / elapsed * 60.0 if elapsed > 0 else 0.0
+        return PlaybackStats(end_time is None, self.iterations, elapsed, per_minute)
+
+class AsyncMacroPlayer:
+    """
+    Runs any number of macros concurrently on one event loop thread. add()
+    returns a PlaybackTask; the backend is only ever called from the
+    injector, one queue drain at a time.
+    """
+    def __init__(self, backend=None):
+        self.backend = backend if backend is not None else default_backend()
+        self.loop = None
+        self.thread = None
+        self.tasks = []
+        self._queue = None
+        self._ready = threading.Event()
+        self._cursor = (-1, -1)
+        self._timer_set = False
+
+        # Stats
+        self.injected = 0
+        self.batches = 0
+        self.errors = 0
+        self.cpu_time = 0.0
+
+    # --- Control (any thread) ---
+    def start(self):
+        if self.thread is not None:
+            return
+        enable_dpi_awareness()
+        self._timer_set = begin_timer_period(1)
+        self._ready.clear()
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+        self._ready.wait()
+
+    def stop(self, timeout=1.0):
+        """ Cancels every task still running and shuts the loop down. """
+        if self.thread is None:
+            return
+        self.loop.call_soon_threadsafe(self._shutdown)
+        self.thread.join(timeout)
+        self.thread = None
+        if self._timer_set:
+            end_timer_period(1)
+            self._timer_set = False
+
+    def add(self, macro, speed=1.0, repeat=1, name=None):
+        """ Schedules `macro` to start now; repeat=0 plays until cancelled. """
+        task = PlaybackTask(self, macro, speed, repeat, name)
+        self.tasks.append(task)
+        self._call(self._spawn, task)
+        return task
+
+    def wait(self, timeout=None):
+        """ Waits for every task added so far. Returns False on timeout. """
+        deadline = None if timeout is None else time.perf_counter() + timeout
+        for task in list(self.tasks):
+            remaining = None if deadline is None else max(0.0, deadline - time.perf_counter())
+            if not task.wait(remaining):
+                return False
+        return True
+
+    def _call(self, func, *args):
+        if self.loop is None:
+            raise RuntimeError("AsyncMacroPlayer is not running")
+        self.loop.call_soon_threadsafe(func, *args)
+
+    def report(self):
+        lateness = IntervalHistogram()
+        for task in self.tasks:
+            lateness.merge(task.lateness)
+        return {
+            'tasks': len(self.tasks),
+            'running': sum(1 for t in self.tasks if t.state in (RUNNING, PAUSED)),
+            'threads': 1 if self.thread is not None else 0,
+            'injected': self.injected,
+            'ops_per_batch': self.injected / self.batches if self.batches else 0.0,
+            'lateness_p50_us': lateness.percentile(50) * 1e6,
+            'lateness_p99_us': lateness.percentile(99) * 1e6,
+            'lateness_max_us': lateness.max * 1e6,
+            'cpu_us_per_op': self.cpu_time / self.injected * 1e6 if self.injected else 0.0,
+            'errors': self.errors,
+        }
+
+    # --- Loop thread ---
+    def _run(self):
+        loop = asyncio.new_event_loop()
+        self.loop = loop
+        asyncio.set_event_loop(loop)
+        self._queue = asyncio.Queue()
+        cpu_start = time.thread_time()
+        injector = loop.create_task(self._inject_loop())
+        self._ready.set()
+        try:
+            loop.run_forever()
+        finally:
+            injector.cancel()
+            loop.run_until_complete(asyncio.gather(injector, return_exceptions=True))
+            self.cpu_time = time.thread_time() - cpu_start
+            loop.close()
+
+    def _shutdown(self):
+        for task in self.tasks:
+            task._cancel()
+        pending = [task._task for task in self.tasks if task._task is not None]
+
+        async def drain():
+            await asyncio.gather(*pending, return_exceptions=True)
+            self.loop.stop()
+        self.loop.create_task(drain())
+
+    def _spawn(self, task):
+        if task.state != PENDING:
+            return
+        task.state = RUNNING
+        task._resumed = asyncio.Event()
+        task._resumed.set()
+        task._task = self.loop.create_task(self._play(task))
+
+    async def _play(self, task):
+        loop = self.loop
+        put = self._queue.put_nowait
+        macro = task.macro
+        ops, buttons, xs, ys, times = macro.ops, macro.buttons, macro.xs, macro.ys, macro.times
+        scale = 1.0 / task.speed
+        span = macro.duration() * scale
+        task.start_time = time.perf_counter()
+        start = loop.time()
+        try:
+            while len(ops) and (task.repeat <= 0 or task.iterations < task.repeat):
+                for i in range(len(ops)):
+                    offset = times[i] * scale
+                    while True:
+                        delay = start + task._pause_offset + offset - loop.time()
+                        if delay > 0:
+                            await asyncio.sleep(delay)
+                        elif task.state == PAUSED:
+                            await task._resumed.wait()
+                        else:
+                            break
+                    task.lateness.record(-delay)
+                    op = ops[i]
+                    if op in KEY_OPS:
+                        put((task, op, key_label(buttons[i], xs[i]), 0, 0))
+                    else:
+                        put((task, op, BUTTON_NAMES.get(buttons[i]), xs[i], ys[i]))
+                    task.ops_done += 1
+                task.iterations += 1
+                start = max(start + span, loop.time() - task._pause_offset)
+            # Done once the injector gets here, i.e. after the task's last op went out
+            put((task, None, None, 0, 0))
+        except asyncio.CancelledError:
+            task.state = CANCELLED
+            task._finish()
+
+    async def _inject_loop(self):
+        queue = self._queue
+        while True:
+            items = [await queue.get()]
+            while not queue.empty():
+                items.append(queue.get_nowait())
+            try:
+                self._inject(items)
+            except Exception as e:
+                self.errors += 1
+                print(f"Playback Error: {e}")
+
+    def _inject(self, items):
+        backend = self.backend
+        cursor = self._cursor
+        clicks = []
+        try:
+            for task, op, arg, x, y in items:
+                if op is None or task.state == CANCELLED:
+                    continue
+                self.injected += 1
+                if op == OP_CLICK:
+                    # Runs of clicks, from any macros, become one injection
+                    clicks.append((arg, None, None) if (x, y) == cursor else (arg, x, y))
+                    cursor = (x, y)
+                    continue
+                if clicks:
+                    backend.send_batch(clicks)
+                    self.batches += 1
+                    clicks = []
+                self.batches += 1
+                if op in KEY_OPS:
+                    if KEY_OPS[op] == 'press':
+                        backend.key_press(arg)
+                    else:
+                        backend.key_release(arg)
+                    continue
+                if (x, y) != cursor:
+                    backend.move(x, y)
+                    cursor = (x, y)
+                if op == OP_DOUBLE_CLICK:
+                    backend.double_click(arg)
+                elif op == OP_PRESS:
+                    backend.press(arg)
+                elif op == OP_RELEASE:
+                    backend.release(arg)
+            if clicks:
+                backend.send_batch(clicks)
+                self.batches += 1
+        finally:
+            self._cursor = cursor
+            # End markers: finish tasks even if the backend failed, so wait() returns
+            for task, op, _, _, _ in items:
+                if op is None and task.state != CANCELLED:
+                    task.state = DONE
+                    task._finish()
@@ -0,0 +1,107 @@
+import os
+import sys
+import time
+import argparse
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from cli import convert_raw, write_output, MACRO_EXT
+from raw_format import RAW_EXT
+
+# --- Batch conversion ---
+# Regenerates scripts from a directory of saved raw recordings (the
+# recorder's raw_format files), one recording per task across a process
+# pool. Each worker reads, filters and writes its own output, so only a
+# small result tuple crosses the process boundary and finished files land
+# on disk as they complete.
+
+BatchResult = namedtuple('BatchResult', ['raw_path', 'output_path', 'ops', 'seconds', 'error'])
+
+def find_recordings(directory):
+    """ Raw recordings in `directory`, largest first so big files don't trail at the end. """
+    paths = [os.path.join(directory, name) for name in os.listdir(directory)
+             if name.lower().endswith(RAW_EXT)]
+    return sorted(paths, key=os.path.getsize, reverse=True)
+
+def output_path_for(raw_path, output_dir, ext='.py'):
+    name = os.path.splitext(os.path.basename(raw_path))[0] + ext
+    return os.path.join(output_dir, name)
+
+def convert_file(raw_path, output_path, move_threshold=5, path_tolerance=3.0):
+    """ Worker: one recording in, one script out. Never raises. """
+    t = time.perf_counter()
+    try:
+        macro = convert_raw(raw_path, move_threshold, path_tolerance)
+        if macro is None:
+            return BatchResult(raw_path, None, 0, time.perf_counter() - t, None)
+        write_output(output_path, macro)
+        return BatchResult(raw_path, output_path, len(macro), time.perf_counter() - t, None)
+    except Exception as e:
+        return BatchResult(raw_path, None, 0, time.perf_counter() - t, f"{type(e).__name__}: {e}")
+
+def batch_convert(raw_paths, output_dir, ext='.py', move_threshold=5, path_tolerance=3.0,
+                  workers=None, on_result=None):
+    """
+    Converts every recording in `raw_paths` into `output_dir`. `on_result`
+    is called in this process with (done, total, BatchResult) as each one
+    finishes. workers=1 runs in-process. Returns the results in
+    completion order.
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    jobs = [(path, output_path_for(path, output_dir, ext), move_threshold, path_tolerance)
+            for path in raw_paths]
+    results = []
+
+    def finished(result):
+        results.append(result)
+        if on_result is not None:
+            on_result(len(results), len(jobs), result)
+
+    workers = workers or os.cpu_count() or 1
+    if workers == 1 or len(jobs) <= 1:
+        for job in jobs:
+            finished(convert_file(*job))
+        return results
+    with ProcessPoolExecutor(max_workers=min(workers, len(jobs))) as pool:
+        futures = [pool.submit(convert_file, *job) for job in jobs]
+        for future in as_completed(futures):
+            finished(future.result())
+    return results
+
+def print_progress(done, total, result):
+    name = os.path.basename(result.raw_path)
+    if result.error:
+        status = f"失败: {result.error}"
+    elif result.output_path is None:
+        status = "没有可转换的操作"
+    else:
+        status = f"{result.ops} 步, {result.seconds:.2f}s"
+    print(f"[{done}/{total}] {name}: {status}", flush=True)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='batch_convert.py', description="批量把原始录制转换为脚本")
+    parser.add_argument('input_dir', help=f"包含 {RAW_EXT} 原始录制的目录")
+    parser.add_argument('output_dir', nargs='?', help="输出目录 (默认同输入目录)")
+    parser.add_argument('--format', choices=('py', MACRO_EXT.lstrip('.')), default='py')
+    parser.add_argument('--move-threshold', type=int, default=5)
+    parser.add_argument('--path-tolerance', type=float, default=3.0, help="路径简化容差 (px), 0 = 不简化")
+    parser.add_argument('-j', '--workers', type=int, default=0, help="进程数 (默认 CPU 核数)")
+    args = parser.parse_args(argv)
+
+    raw_paths = find_recordings(args.input_dir)
+    if not raw_paths:
+        print(f"{args.input_dir}: 没有 {RAW_EXT} 文件")
+        return 1
+    start = time.perf_counter()
+    results = batch_convert(raw_paths, args.output_dir or args.input_dir, '.' + args.format,
+                            args.move_threshold, None if args.path_tolerance <= 0 else args.path_tolerance,
+                            args.workers or None, print_progress)
+    elapsed = time.perf_counter() - start
+    failed = sum(1 for r in results if r.error)
+    size = sum(os.path.getsize(p) for p in raw_paths)
+    print(f"{len(results)} 个文件, {failed} 个失败, {elapsed:.2f}s "
+          f"({len(results) / elapsed:.1f} 文件/s, {size / elapsed / 1e6:.1f} MB/s)")
+    return 1 if failed else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
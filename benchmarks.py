@@ -0,0 +1,323 @@
+import os
+import sys
+import json
+import time
+import heapq
+import random
+import argparse
+import platform
+import tracemalloc
+from collections import namedtuple
+from operator import itemgetter
+
+from events import EVENT_MOVE, EVENT_DOWN, EVENT_UP, EVENT_KEY_DOWN, EVENT_KEY_UP, BUTTON_NONE, BUTTON_CODES, KEY_CODES
+from recorder import make_pipeline
+from pipeline import process_events
+from codegen import events_to_macro
+from clicker_core import HighResClicker
+from input_backend import RecordingInputBackend
+from highlighter import tokenize_lines, CHUNK_LINES
+from macro import Macro, OP_CLICK
+from async_playback import AsyncMacroPlayer
+
+# --- Benchmarks ---
+# Synthetic recordings through the filter pipeline and codegen, clicker
+# timing against a recording sink, concurrent playback on the asyncio
+# player, and highlighter tokenizing on large buffers. Results are
+# compared with a stored baseline; any metric worse than the baseline by
+# more than the threshold fails the run.
+#
+#   python benchmarks.py                   # run and compare; fails without a baseline
+#   python benchmarks.py --update-baseline # accept the current numbers
+#   python benchmarks.py --quick --only pipeline
+
+BASELINE_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'benchmarks_baseline.json')
+DEFAULT_THRESHOLD = 0.25
+REPEAT = 3 # throughput runs keep the best of this many
+
+# `floor` is the smallest baseline a regression is measured against, so
+# near-zero metrics (e.g. timing error) don't fail on noise
+Metric = namedtuple('Metric', ['name', 'value', 'unit', 'better', 'floor'])
+
+LEFT = BUTTON_CODES['left']
+
+# --- Synthetic recordings ---
+# Event tuples as the recorder produces them, with a fixed seed so every
+# run sees the same input.
+def gen_drags(drags=200, points=1000, seed=1):
+    """ Press, a long wandering drag sampled every 4 ms, release. """
+    rng = random.Random(seed)
+    t = 1000.0
+    x, y = 500, 500
+    for _ in range(drags):
+        yield (EVENT_DOWN, LEFT, x, y, t)
+        dx, dy = rng.uniform(-3, 3), rng.uniform(-3, 3)
+        for _ in range(points):
+            t += 0.004
+            dx += rng.uniform(-0.5, 0.5)
+            dy += rng.uniform(-0.5, 0.5)
+            x, y = int(x + dx), int(y + dy)
+            yield (EVENT_MOVE, BUTTON_NONE, x, y, t)
+        t += 0.01
+        yield (EVENT_UP, LEFT, x, y, t)
+        t += rng.uniform(0.2, 1.0)
+
+def gen_click_storm(clicks=50000, seed=2):
+    """ Rapid clicks with only small hops in between, double clicks included. """
+    rng = random.Random(seed)
+    t = 1000.0
+    x, y = 800, 400
+    for _ in range(clicks):
+        if rng.random() < 0.3:
+            x, y = x + rng.randint(-20, 20), y + rng.randint(-20, 20)
+            t += 0.005
+            yield (EVENT_MOVE, BUTTON_NONE, x, y, t)
+        t += rng.uniform(0.02, 0.12)
+        yield (EVENT_DOWN, LEFT, x, y, t)
+        t += rng.uniform(0.01, 0.05)
+        yield (EVENT_UP, LEFT, x, y, t)
+
+def gen_idle(hours=3.0, seed=3):
+    """ A multi-hour capture that is mostly idle: jiggles every few seconds, rare clicks. """
+    rng = random.Random(seed)
+    t = 1000.0
+    end = t + hours * 3600
+    x, y = 960, 540
+    while t < end:
+        t += rng.uniform(1.0, 5.0)
+        x, y = x + rng.randint(-8, 8), y + rng.randint(-8, 8)
+        yield (EVENT_MOVE, BUTTON_NONE, x, y, t)
+        if rng.random() < 0.02:
+            yield (EVENT_DOWN, LEFT, x, y, t + 0.05)
+            yield (EVENT_UP, LEFT, x, y, t + 0.1)
+
+def gen_typing(keys=20000, seed=5):
+    """ Keystrokes at typing speed. """
+    rng = random.Random(seed)
+    t = 1000.0
+    names = [KEY_CODES[c] for c in "abcdefghijklmnopqrstuvwxyz"] + [KEY_CODES['space']]
+    for _ in range(keys):
+        t += rng.uniform(0.02, 0.15)
+        key = rng.choice(names)
+        yield (EVENT_KEY_DOWN, key, 30, 0, t)
+        t += rng.uniform(0.03, 0.12)
+        yield (EVENT_KEY_UP, key, 30, 0, t)
+
+def gen_mixed(scale):
+    """ Drags and typing merged by time, as the recorder merges its device streams. """
+    return heapq.merge(gen_drags(drags=max(1, int(50 * scale))), gen_typing(keys=max(1, int(20000 * scale))),
+                       key=itemgetter(4))
+
+SCENARIOS = {
+    'drags': lambda scale: gen_drags(drags=max(1, int(200 * scale))),
+    'storm': lambda scale: gen_click_storm(clicks=max(1, int(50000 * scale))),
+    'idle': lambda scale: gen_idle(hours=3.0 * scale),
+    'mixed': gen_mixed,
+}
+
+# --- Measuring ---
+def best_time(func, repeat=REPEAT):
+    best = None
+    for _ in range(repeat):
+        t = time.perf_counter()
+        result = func()
+        elapsed = time.perf_counter() - t
+        best = elapsed if best is None else min(best, elapsed)
+    return best, result
+
+def peak_memory_kb(func):
+    tracemalloc.start()
+    try:
+        func()
+        return tracemalloc.get_traced_memory()[1] / 1024
+    finally:
+        tracemalloc.stop()
+
+def _drain(iterable):
+    n = 0
+    for _ in iterable:
+        n += 1
+    return n
+
+def bench_pipeline(scale):
+    metrics = []
+    for name, gen in SCENARIOS.items():
+        events = list(gen(scale))
+        filtered = list(process_events(iter(events), make_pipeline()))
+        elapsed, _ = best_time(lambda: _drain(process_events(iter(events), make_pipeline())))
+        metrics.append(Metric(f'filter.{name}.events_per_s', len(events) / elapsed, 'ev/s', 'higher', 0))
+        elapsed, macro = best_time(lambda: events_to_macro(iter(filtered)))
+        metrics.append(Metric(f'codegen.{name}.events_per_s', len(filtered) / elapsed, 'ev/s', 'higher', 0))
+        elapsed, n_lines = best_time(lambda: _drain(macro.iter_lines()))
+        metrics.append(Metric(f'export.{name}.lines_per_s', n_lines / elapsed, 'lines/s', 'higher', 0))
+        # Streaming end to end from the generator: memory must not grow with the capture
+        kb = peak_memory_kb(lambda: events_to_macro(process_events(gen(scale), make_pipeline())))
+        metrics.append(Metric(f'pipeline.{name}.peak_kb', kb, 'KB', 'lower', 1024))
+        metrics.append(Metric(f'pipeline.{name}.reduction', len(events) / max(1, len(macro)), 'x', 'higher', 0))
+    return metrics
+
+def clicker_run(cps, seconds):
+    """ One timed clicker run against a recording sink: rate error, jitter and CPU. """
+    sink = RecordingInputBackend()
+    clicker = HighResClicker(sink)
+    clicker.cps = cps
+    clicker.limit_mode = 'time'
+    clicker.limit_value = seconds
+    clicker.start()
+    clicker.thread.join()
+    times = sink.press_times()
+    achieved = (len(times) - 1) / (times[-1] - times[0]) if len(times) > 1 else 0.0
+    report = clicker.timing_report()
+    return {
+        'rate_error_pct': abs(achieved - cps) / cps * 100,
+        'jitter_p99_us': clicker.interval_stats()['jitter_p99_us'],
+        'cpu_pct': report['cpu_fraction'] * 100 if report is not None else 0.0,
+    }
+
+def bench_clicker(scale):
+    # Timing is at the mercy of the scheduler: keep the best of REPEAT runs per metric
+    metrics = []
+    for cps in (100, 1000):
+        runs = [clicker_run(cps, max(0.5, 2.0 * scale)) for _ in range(REPEAT)]
+        for key, unit, floor in (('rate_error_pct', '%', 1.0), ('jitter_p99_us', 'us', 500), ('cpu_pct', '%', 5.0)):
+            metrics.append(Metric(f'clicker.{cps}cps.{key}', min(run[key] for run in runs), unit, 'lower', floor))
+    return metrics
+
+def bench_async(scale):
+    # Per-op cost should fall, not grow, as more macros share the loop
+    metrics = []
+    seconds = max(0.5, 2.0 * scale)
+    for n in (10, 100):
+        player = AsyncMacroPlayer(RecordingInputBackend())
+        player.start()
+        for k in range(n):
+            macro = Macro()
+            for i in range(int(seconds / 0.01)):
+                macro.append(OP_CLICK, LEFT, k, 0, i * 0.01 + k * 0.0001)
+            player.add(macro)
+        player.wait()
+        player.stop()
+        report = player.report()
+        metrics.append(Metric(f'async.{n}macros.cpu_us_per_op', report['cpu_us_per_op'], 'us', 'lower', 20))
+        metrics.append(Metric(f'async.{n}macros.lateness_p99_us', report['lateness_p99_us'], 'us', 'lower', 2000))
+    return metrics
+
+def bench_highlighter(scale):
+    macro = events_to_macro(gen_drags(drags=max(1, int(400 * scale)), points=500))
+    lines = list(macro.iter_lines())
+    elapsed, _ = best_time(lambda: tokenize_lines(lines))
+    metrics = [Metric('highlight.full.lines_per_s', len(lines) / elapsed, 'lines/s', 'higher', 0),
+               Metric('highlight.full.ms', elapsed * 1e3, 'ms', 'lower', 50)]
+    # One worker job after an edit: a CHUNK_LINES slice from a random spot
+    rng = random.Random(4)
+    samples = []
+    for _ in range(20):
+        first = rng.randrange(max(1, len(lines) - CHUNK_LINES))
+        chunk = lines[first:first + CHUNK_LINES]
+        t = time.perf_counter()
+        tokenize_lines(chunk)
+        samples.append(time.perf_counter() - t)
+    samples.sort()
+    metrics.append(Metric('highlight.edit_chunk.p95_ms', samples[int(len(samples) * 0.95) - 1] * 1e3,
+                          'ms', 'lower', 5))
+    return metrics
+
+BENCHMARKS = {
+    'pipeline': bench_pipeline,
+    'clicker': bench_clicker,
+    'async': bench_async,
+    'highlighter': bench_highlighter,
+}
+
+# --- Baselines ---
+def load_baseline(path):
+    try:
+        with open(path, encoding='utf-8') as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+
+def save_results(path, metrics, scale):
+    data = {
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'scale': scale,
+        'created': time.strftime('%Y-%m-%d %H:%M:%S'),
+        'metrics': {m.name: {'value': m.value, 'unit': m.unit, 'better': m.better} for m in metrics},
+    }
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(data, f, indent=2, sort_keys=True)
+
+def regression(metric, baseline_value, threshold):
+    """ How much worse than the baseline `metric` is, as a fraction, if beyond `threshold`; else None. """
+    base = max(abs(baseline_value), metric.floor)
+    if not base:
+        return None
+    if metric.better == 'higher':
+        worse = (baseline_value - metric.value) / base
+    else:
+        worse = (metric.value - baseline_value) / base
+    return worse if worse > threshold else None
+
+def compare(metrics, baseline, threshold):
+    """ (metric, baseline value, how much worse) for every regression. """
+    failures = []
+    known = baseline.get('metrics', {})
+    for m in metrics:
+        if m.name in known:
+            base = known[m.name]['value']
+            worse = regression(m, base, threshold)
+            if worse is not None:
+                failures.append((m, base, worse))
+    return failures
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='benchmarks.py', description="性能基准测试")
+    parser.add_argument('--only', action='append', choices=sorted(BENCHMARKS), help="只运行指定的基准")
+    parser.add_argument('--quick', action='store_true', help="缩小输入规模 (1/10)")
+    parser.add_argument('--baseline', default=BASELINE_FILE)
+    parser.add_argument('--update-baseline', action='store_true', help="用本次结果覆盖基线")
+    parser.add_argument('--threshold', type=float, default=DEFAULT_THRESHOLD, help="允许的退化比例")
+    parser.add_argument('--output', help="把本次结果写入 JSON 文件")
+    args = parser.parse_args(argv)
+    scale = 0.1 if args.quick else 1.0
+
+    metrics = []
+    for name in args.only or BENCHMARKS:
+        t = time.perf_counter()
+        metrics.extend(BENCHMARKS[name](scale))
+        print(f"# {name}: {time.perf_counter() - t:.1f}s", flush=True)
+
+    baseline = load_baseline(args.baseline)
+    comparable = baseline is not None and baseline.get('scale') == scale
+    known = baseline.get('metrics', {}) if comparable else {}
+    for m in metrics:
+        line = f"{m.name:<40} {m.value:14.2f} {m.unit}"
+        if m.name in known:
+            line += f"   (baseline {known[m.name]['value']:.2f})"
+        print(line)
+    if args.output:
+        save_results(args.output, metrics, scale)
+
+    if args.update_baseline:
+        save_results(args.baseline, metrics, scale)
+        print(f"Baseline written to {args.baseline}")
+        return 0
+    # Nothing to compare against is a failure, or the gate could never trip
+    if baseline is None:
+        print(f"No baseline at {args.baseline}; run with --update-baseline to create one")
+        return 1
+    if not comparable:
+        print(f"Baseline was recorded at scale {baseline.get('scale')}, not {scale}; "
+              "run with --update-baseline to replace it")
+        return 1
+    failures = compare(metrics, baseline, args.threshold)
+    for m, base, worse in failures:
+        print(f"REGRESSION {m.name}: {m.value:.2f} {m.unit} vs baseline {base:.2f} ({worse * 100:.0f}% worse)")
+    if failures:
+        return 1
+    print(f"OK: no metric more than {args.threshold * 100:.0f}% worse than the baseline")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
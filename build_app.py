@@ -2,6 +2,8 @@ import PyInstaller.__main__
 import os
 import shutil
 
+from update_icons import build_icon_assets
+
 # Clean up previous build
 if os.path.exists('dist'):
     shutil.rmtree('dist')
@@ -11,6 +13,9 @@ if os.path.exists('build'):
 if os.path.exists('AutoScriptPro.spec'):
     os.remove('AutoScriptPro.spec')
 
+# Pre-sized window icon, bundled so the app needn't resize icon.png at startup
+build_icon_assets()
+
 print("Starting build process...")
 
 PyInstaller.__main__.run([
@@ -29,6 +34,7 @@ PyInstaller.__main__.run([
     # Data files (source;dest)
     '--add-data=icon.png;.',
     '--add-data=icon.ico;.',
+    '--add-data=icon_32.png;.',
     # Icon
     '--icon=icon.ico', 
 ])
@@ -0,0 +1,497 @@
+import sys
+import time
+import argparse
+import threading
+
+from clicker_core import HighResClicker
+from input_backend import default_backend
+from macro import Macro
+from playback import MacroPlayer, PlaybackRuntime, MIN_SPEED, MAX_SPEED
+from code_cache import CodeCache, default_cache_dir
+from recorder import StreamingRecorder, make_pipeline, iter_raw_path
+from pipeline import process_events
+from codegen import events_to_macro
+from timing import STRATEGIES
+from hotkey_dispatch import HotkeyDispatcher
+
+# --- Headless entry point ---
+# Clicker, recording, conversion and playback without Tk: this module must
+# never import main.py, customtkinter, tkinter or PIL. `keyboard` is only
+# imported by the commands that register hotkeys.
+#
+#   python cli.py click --cps 50 --count 1000
+#   python cli.py record out.py --raw out.raw
+#   python cli.py convert out.raw out.aspm
+#   python cli.py play out.aspm --speed 2 --repeat 0
+#   python cli.py daemon
+
+# Compiled macro timeline (Macro.to_bytes); any other extension is Python source
+MACRO_EXT = '.aspm'
+
+STATUS_INTERVAL = 0.5
+DEFAULT_HOTKEYS = {'clicker': 'F8', 'record': 'F9', 'play': 'F10'}
+BUTTONS = ('left', 'right', 'middle')
+
+def _status(text):
+    # Live status line on a terminal; silent when output is redirected
+    if sys.stdout.isatty():
+        sys.stdout.write('\r' + text + '\033[K')
+        sys.stdout.flush()
+
+def _wait(busy, stop):
+    """ Polls `busy()` until it is False; Ctrl+C calls `stop()` and keeps waiting. """
+    while True:
+        try:
+            while busy():
+                time.sleep(STATUS_INTERVAL)
+            return
+        except KeyboardInterrupt:
+            stop()
+
+def _add_stop_key(key, callback):
+    if not key:
+        return None
+    try:
+        import keyboard
+        return keyboard.add_hotkey(key, callback)
+    except Exception as e:
+        # No keyboard hook (e.g. no permission to read input devices): Ctrl+C still works
+        print(f"Warning: Could not register stop key {key}: {e}")
+        return None
+
+# --- Files ---
+def write_output(path, macro):
+    if path.lower().endswith(MACRO_EXT):
+        macro.save(path)
+    else:
+        with open(path, 'w', encoding='utf-8') as f:
+            for line in macro.iter_lines():
+                f.write(line + '\n')
+
+def load_playable(path, cache=None):
+    """ A Macro for .aspm files and straight-line scripts, else a code object. """
+    if path.lower().endswith(MACRO_EXT):
+        return Macro.load(path)
+    with open(path, encoding='utf-8') as f:
+        source = f.read()
+    cache = cache if cache is not None else CodeCache(default_cache_dir())
+    return cache.get(source)
+
+def convert_raw(raw_path, move_threshold=5, path_tolerance=3.0):
+    """ Runs a saved raw recording through the recorder's filters and codegen. """
+    events = process_events(iter_raw_path(raw_path), make_pipeline(move_threshold, path_tolerance))
+    return events_to_macro(events)
+
+def open_library():
+    from macro_library import MacroLibrary
+    return MacroLibrary()
+
+# --- Commands ---
+def make_clicker(args, backend=None):
+    clicker = HighResClicker(backend)
+    clicker.cps = args.cps
+    clicker.button = args.button
+    clicker.random_range = args.jitter
+    clicker.timing_mode = args.timing_mode
+    clicker.burst_mode = args.burst_mode
+    clicker.rate_control = args.rate_control
+    clicker.rate_tolerance = args.rate_tolerance
+    if args.count:
+        clicker.limit_mode, clicker.limit_value = 'count', args.count
+    elif args.duration:
+        clicker.limit_mode, clicker.limit_value = 'time', args.duration
+    return clicker
+
+def print_clicker_summary(clicker):
+    stats = clicker.snapshot()
+    print(f"{stats.clicks} 次点击, {stats.elapsed:.2f}s, "
+          f"平均 {stats.clicks / stats.elapsed if stats.elapsed else 0.0:.1f} CPS")
+    interval = clicker.interval_stats()
+    if interval['samples']:
+        print(f"抖动 p50 {interval['jitter_p50_us']:.0f}us, p99 {interval['jitter_p99_us']:.0f}us, "
+              f"max {interval['jitter_max_us']:.0f}us")
+    state = clicker.controller_state()
+    if state is not None:
+        print(f"速率控制: 实测 {state.achieved_cps:.1f} CPS (误差 {state.error * 100:+.1f}%), "
+              f"修正 x{state.correction:.3f}, 每次注入 {state.burst} 次, 调整 {state.updates} 次"
+              + ("" if state.within_tolerance else ", 未达到容差"))
+
+def cmd_click(args):
+    clicker = make_clicker(args)
+    _add_stop_key(args.stop_key, clicker.stop)
+    clicker.start()
+
+    def busy():
+        stats = clicker.snapshot()
+        _status(f"连点中: {stats.clicks} 次, {stats.elapsed:.1f}s, {stats.cps:.0f} CPS")
+        return clicker.running
+
+    _wait(busy, clicker.stop)
+    # `running` drops before the loop has wrapped up when the limit ends the
+    # run or the stop key's stop() is still joining on the hook thread
+    clicker.thread.join()
+    _status('')
+    print_clicker_summary(clicker)
+    return 0
+
+def cmd_record(args):
+    recorder = StreamingRecorder(raw_path=args.raw, keyboard=args.keyboard, ignore_keys=(args.stop_key,))
+    stopped = threading.Event()
+    _add_stop_key(args.stop_key, stopped.set)
+    try:
+        import mouse
+        initial_pos = mouse.get_position()
+    except Exception:
+        initial_pos = None
+    print(f"正在录制... 按 {args.stop_key or 'Ctrl+C'} 停止")
+    recorder.start(initial_pos)
+    deadline = time.perf_counter() + args.duration if args.duration else None
+
+    def busy():
+        _status(f"已录制 {recorder.raw_count} 个事件")
+        return not stopped.is_set() and (deadline is None or time.perf_counter() < deadline)
+
+    _wait(busy, stopped.set)
+    recorder.stop()
+    _status('')
+    try:
+        macro = events_to_macro(recorder.iter_filtered())
+        if macro is None:
+            print("没有录制到任何操作")
+            return 1
+        write_output(args.output, macro)
+        print(f"{recorder.raw_count} 个事件 -> {len(macro)} 步, 已保存到 {args.output}")
+        if args.library:
+            library = open_library()
+            try:
+                library.save(args.library, macro.to_source(), macro, recorder.raw_bytes(), args.tag)
+            finally:
+                library.close()
+    finally:
+        recorder.close()
+    return 0
+
+def cmd_convert(args):
+    macro = convert_raw(args.raw, args.move_threshold,
+                        None if args.path_tolerance <= 0 else args.path_tolerance)
+    if macro is None:
+        print(f"{args.raw}: 没有可转换的操作")
+        return 1
+    write_output(args.output, macro)
+    print(f"{args.raw} -> {args.output} ({len(macro)} 步, {macro.duration():.1f}s)")
+    return 0
+
+def resolve_playable(name, from_library):
+    """ A Macro or code object for a script path, or a library script name; None if not found. """
+    if not from_library:
+        return load_playable(name)
+    library = open_library()
+    try:
+        entries = [e for e in library.search(name) if e.name.lower() == name.lower()]
+        if not entries:
+            return None
+        playable = library.load_macro(entries[0].id)
+        if playable is None:
+            playable = CodeCache(default_cache_dir()).get(library.load_source(entries[0].id))
+        return playable
+    finally:
+        library.close()
+
+def cmd_play(args):
+    playables = []
+    for name in args.script:
+        playable = resolve_playable(name, args.library)
+        if playable is None:
+            print(f"脚本库中没有 {name}")
+            return 1
+        playables.append(playable)
+    if len(playables) > 1:
+        return play_many(args, playables)
+    playable = playables[0]
+
+    player = MacroPlayer(default_backend())
+    player.speed = args.speed
+    player.repeat = args.repeat
+    runtime = PlaybackRuntime()
+    _add_stop_key(args.stop_key, runtime.stop)
+    errors = []
+
+    def run():
+        try:
+            if isinstance(playable, Macro):
+                player.play(playable, runtime)
+            else:
+                player.run_script(playable, runtime)
+        except Exception as e:
+            errors.append(e)
+
+    # Playback runs on a worker so Ctrl+C in the main thread can stop it
+    thread = threading.Thread(target=run, daemon=True)
+    thread.start()
+
+    def busy():
+        stats = player.snapshot()
+        _status(f"播放中: 第 {stats.iterations + 1} 遍, {stats.elapsed:.1f}s")
+        return thread.is_alive()
+
+    _wait(busy, runtime.stop)
+    _status('')
+    if errors:
+        print(f"脚本执行出错: {errors[0]}")
+        return 1
+    stats = player.snapshot()
+    print(f"播放 {stats.iterations} 遍, {stats.elapsed:.2f}s")
+    if runtime.stopped:
+        print(runtime.report())
+    return 0
+
+def play_many(args, playables):
+    """ Several timeline macros at once, as coroutines on one AsyncMacroPlayer. """
+    from async_playback import AsyncMacroPlayer
+    for name, playable in zip(args.script, playables):
+        if not isinstance(playable, Macro):
+            print(f"{name} 不是时间线脚本, 无法并行播放")
+            return 1
+    player = AsyncMacroPlayer(default_backend())
+    player.start()
+    tasks = [player.add(macro, args.speed, args.repeat, name) for name, macro in zip(args.script, playables)]
+
+    def stop():
+        for task in tasks:
+            task.cancel()
+
+    _add_stop_key(args.stop_key, stop)
+
+    def busy():
+        running = sum(1 for task in tasks if not task.finished.is_set())
+        _status(f"并行播放中: {running}/{len(tasks)} 个脚本")
+        return running > 0
+
+    _wait(busy, stop)
+    player.stop()
+    _status('')
+    for task in tasks:
+        stats = task.snapshot()
+        print(f"{task.name}: {task.state}, 播放 {stats.iterations} 遍, {stats.elapsed:.2f}s")
+    report = player.report()
+    print(f"延迟 p50 {report['lateness_p50_us']:.0f}us, p99 {report['lateness_p99_us']:.0f}us, "
+          f"每批 {report['ops_per_batch']:.1f} 个操作")
+    return 0
+
+# --- Daemon ---
+class Daemon:
+    """
+    Long-running hotkey service: the GUI's three global hotkeys (clicker,
+    record, play) plus every library binding, with no window. Recordings are
+    kept for the play hotkey and, if a library is open, saved to it.
+    """
+    def __init__(self, args, backend=None, library=None):
+        self.backend = backend if backend is not None else default_backend()
+        self.hotkeys = {'clicker': args.clicker_key, 'record': args.record_key, 'play': args.play_key}
+        self.clicker = make_clicker(args, self.backend)
+        self.player = MacroPlayer(self.backend)
+        self.player.speed = args.speed
+        self.player.repeat = args.repeat
+        self.code_cache = CodeCache(default_cache_dir())
+        self.library = library
+        self.recorder = None
+        self.macro = None
+        self.runtime = None
+        self._lock = threading.Lock()
+        # Hotkeys only post commands; the handlers run on the dispatcher thread
+        self.dispatcher = HotkeyDispatcher()
+        self.dispatcher.register('clicker', self.toggle_clicker)
+        self.dispatcher.register('record', self.toggle_recording)
+        self.dispatcher.register('play', self.toggle_playback)
+        self.dispatcher.register('library', self.play_library)
+
+    def register(self):
+        import keyboard
+        self.dispatcher.start()
+        for command, hotkey in self.hotkeys.items():
+            keyboard.add_hotkey(hotkey, self.dispatcher.hotkey(command))
+        if self.library is not None:
+            reserved = set(self.hotkeys.values())
+            for hotkey, macro_id in self.library.bindings().items():
+                if hotkey not in reserved:
+                    keyboard.add_hotkey(hotkey, self.dispatcher.hotkey('library', macro_id))
+
+    def toggle_clicker(self):
+        if self.clicker.running:
+            self.clicker.stop() # joins the click thread
+            print_clicker_summary(self.clicker)
+        else:
+            self.clicker.start()
+            print(f"连点开始 ({self.clicker.cps:g} CPS)")
+
+    def toggle_recording(self):
+        with self._lock:
+            recorder = self.recorder
+            if recorder is None:
+                self.recorder = StreamingRecorder(ignore_keys=self.hotkeys.values())
+                self.recorder.start()
+                print("正在录制...")
+                return
+            self.recorder = None
+        # Convert off the dispatcher thread so other hotkeys stay responsive
+        threading.Thread(target=self._finish_recording, args=(recorder,), daemon=True).start()
+
+    def _finish_recording(self, recorder):
+        try:
+            recorder.stop()
+            macro = events_to_macro(recorder.iter_filtered())
+            if macro is None:
+                print("没有录制到任何操作")
+                return
+            self.macro = macro
+            print(f"录制完成: {recorder.raw_count} 个事件 -> {len(macro)} 步")
+            if self.library is not None:
+                name = time.strftime("录制 %Y-%m-%d %H:%M:%S")
+                self.library.save(name, macro.to_source(), macro, recorder.raw_bytes())
+                print(f"已保存到脚本库: {name}")
+        except Exception as e:
+            print(f"Processing Error: {e}")
+        finally:
+            recorder.close()
+
+    def toggle_playback(self):
+        if self.stop_playback() or self.macro is None:
+            return
+        self.start_playback(self.macro)
+
+    def play_library(self, macro_id):
+        if self.stop_playback():
+            return
+        macro = self.library.load_macro(macro_id)
+        self.start_playback(macro if macro is not None else self.library.load_source(macro_id))
+
+    def stop_playback(self):
+        runtime = self.runtime
+        if runtime is None or runtime.halt_time is not None:
+            return False
+        runtime.stop()
+        return True
+
+    def start_playback(self, playable):
+        self.runtime = runtime = PlaybackRuntime()
+        threading.Thread(target=self._play, args=(playable, runtime), daemon=True).start()
+
+    def _play(self, playable, runtime):
+        try:
+            prepared = playable if isinstance(playable, Macro) else self.code_cache.get(playable)
+            if isinstance(prepared, Macro):
+                self.player.play(prepared, runtime)
+            else:
+                self.player.run_script(prepared, runtime)
+            stats = self.player.snapshot()
+            print(f"播放结束: {stats.iterations} 遍, {stats.elapsed:.2f}s")
+        except Exception as e:
+            print(f"Script Error: {e}")
+        finally:
+            runtime.halt()
+
+    def shutdown(self):
+        self.dispatcher.stop()
+        report = self.dispatcher.format_report()
+        if report:
+            print(f"热键响应延迟:\n{report}")
+        if self.clicker.running:
+            self.clicker.stop()
+        self.stop_playback()
+        recorder = self.recorder
+        if recorder is not None:
+            recorder.stop()
+            recorder.close()
+
+def cmd_daemon(args):
+    try:
+        library = None if args.no_library else open_library()
+    except Exception as e:
+        print(f"Warning: Could not open macro library: {e}")
+        library = None
+    daemon = Daemon(args, library=library)
+    daemon.register()
+    print(f"后台运行中: 连点 {args.clicker_key}, 录制 {args.record_key}, 播放 {args.play_key}; Ctrl+C 退出")
+    try:
+        while True:
+            time.sleep(1.0)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        daemon.shutdown()
+        if library is not None:
+            library.close()
+    return 0
+
+# --- Arguments ---
+def _speed(value):
+    speed = float(value.rstrip('x'))
+    if not MIN_SPEED <= speed <= MAX_SPEED:
+        raise argparse.ArgumentTypeError(f"{MIN_SPEED:g}..{MAX_SPEED:g}")
+    return speed
+
+def _add_clicker_args(p):
+    p.add_argument('--cps', type=float, default=10.0, help="点击频率")
+    p.add_argument('--button', choices=BUTTONS, default='left')
+    p.add_argument('--jitter', type=float, default=0.0, help="随机间隔 (ms)")
+    p.add_argument('--count', type=int, default=0, help="点击次数上限")
+    p.add_argument('--duration', type=float, default=0.0, help="时长上限 (s)")
+    p.add_argument('--timing-mode', choices=STRATEGIES, default='hybrid')
+    p.add_argument('--burst-mode', choices=('off', 'auto', 'on'), default='auto')
+    p.add_argument('--rate-control', action='store_true', help="闭环速率控制: 按实测频率修正间隔")
+    p.add_argument('--rate-tolerance', type=float, default=0.02, help="速率控制容差 (比例)")
+
+def _add_playback_args(p):
+    p.add_argument('--speed', type=_speed, default=1.0, help=f"回放倍速 ({MIN_SPEED:g}-{MAX_SPEED:g})")
+    p.add_argument('--repeat', type=int, default=1, help="重复次数, 0 = 循环直到停止")
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog='cli.py', description="自动化脚本工具 Pro - 命令行/后台模式")
+    sub = parser.add_subparsers(dest='command', required=True)
+
+    p = sub.add_parser('click', help="运行连点器")
+    _add_clicker_args(p)
+    p.add_argument('--stop-key', help="停止热键 (默认仅 Ctrl+C)")
+    p.set_defaults(func=cmd_click)
+
+    p = sub.add_parser('record', help="录制鼠标和键盘操作")
+    p.add_argument('output', help=f"输出文件 (.py 脚本或 {MACRO_EXT})")
+    p.add_argument('--raw', help="同时保存原始事件")
+    p.add_argument('--duration', type=float, default=0.0, help="录制时长 (s)")
+    p.add_argument('--stop-key', default=DEFAULT_HOTKEYS['record'])
+    p.add_argument('--no-keyboard', dest='keyboard', action='store_false', help="只录制鼠标")
+    p.add_argument('--library', metavar='NAME', help="同时保存到脚本库")
+    p.add_argument('--tag', action='append', default=[])
+    p.set_defaults(func=cmd_record)
+
+    p = sub.add_parser('convert', help="把原始录制转换为脚本")
+    p.add_argument('raw')
+    p.add_argument('output')
+    p.add_argument('--move-threshold', type=int, default=5)
+    p.add_argument('--path-tolerance', type=float, default=3.0, help="路径简化容差 (px), 0 = 不简化")
+    p.set_defaults(func=cmd_convert)
+
+    p = sub.add_parser('play', help="回放脚本")
+    p.add_argument('script', nargs='+',
+                   help=f"脚本文件 (.py 或 {MACRO_EXT}), 或配合 --library 的脚本名; 多个脚本时并行播放")
+    p.add_argument('--library', action='store_true', help="从脚本库按名称加载")
+    p.add_argument('--stop-key', default=DEFAULT_HOTKEYS['play'])
+    _add_playback_args(p)
+    p.set_defaults(func=cmd_play)
+
+    p = sub.add_parser('daemon', help="后台热键服务")
+    _add_clicker_args(p)
+    _add_playback_args(p)
+    p.add_argument('--clicker-key', default=DEFAULT_HOTKEYS['clicker'])
+    p.add_argument('--record-key', default=DEFAULT_HOTKEYS['record'])
+    p.add_argument('--play-key', default=DEFAULT_HOTKEYS['play'])
+    p.add_argument('--no-library', action='store_true', help="不加载脚本库热键")
+    p.set_defaults(func=cmd_daemon)
+    return parser
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    return args.func(args)
+
+if __name__ == "__main__":
+    sys.exit(main())
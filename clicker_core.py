@@ -1,52 +1,21 @@
 import time
+import math
 import threading
-import ctypes
 import random
-from ctypes import wintypes
-
-# --- Win32 API Definitions ---
-user32 = ctypes.windll.user32
-winmm = ctypes.windll.winmm
-
-INPUT_MOUSE = 0
-MOUSEEVENTF_MOVE = 0x0001
-MOUSEEVENTF_LEFTDOWN = 0x0002
-MOUSEEVENTF_LEFTUP = 0x0004
-MOUSEEVENTF_RIGHTDOWN = 0x0008
-MOUSEEVENTF_RIGHTUP = 0x0010
-MOUSEEVENTF_MIDDLEDOWN = 0x0020
-MOUSEEVENTF_MIDDLEUP = 0x0040
-
-class MOUSEINPUT(ctypes.Structure):
-    _fields_ = [("dx", wintypes.LONG),
-                ("dy", wintypes.LONG),
-                ("mouseData", wintypes.DWORD),
-                ("dwFlags", wintypes.DWORD),
-                ("time", wintypes.DWORD),
-                ("dwExtraInfo", ctypes.POINTER(wintypes.ULONG))]
-
-class INPUT(ctypes.Structure):
-    _fields_ = [("type", wintypes.DWORD),
-                ("mi", MOUSEINPUT)]
-
-def _send_click(btn_down, btn_up):
-    extra = ctypes.c_ulong(0)
-    ii_down = INPUT()
-    ii_down.type = INPUT_MOUSE
-    ii_down.mi.dwFlags = btn_down
-    ii_down.mi.dwExtraInfo = ctypes.pointer(extra)
-
-    ii_up = INPUT()
-    ii_up.type = INPUT_MOUSE
-    ii_up.mi.dwFlags = btn_up
-    ii_up.mi.dwExtraInfo = ctypes.pointer(extra)
-
-    # Send input array to reduce system calls
-    inputs = (INPUT * 2)(ii_down, ii_up)
-    user32.SendInput(2, ctypes.pointer(inputs), ctypes.sizeof(INPUT))
+from collections import namedtuple
+
+from input_backend import default_backend, begin_timer_period, end_timer_period
+from timing import Pacer
+from timing_stats import IntervalHistogram, RateWindow
+from rate_control import RateController
+
+# Immutable view of the live counters, see HighResClicker.snapshot()
+ClickerStats = namedtuple('ClickerStats', ['running', 'clicks', 'elapsed', 'cps'])
 
 class HighResClicker:
-    def __init__(self):
+    def __init__(self, backend=None):
+        # Input sink (see input_backend.py); real SendInput on Windows by default
+        self.backend = backend if backend is not None else default_backend()
         self.running = False
         self.thread = None
         self._stop_event = threading.Event()
@@ -57,32 +26,116 @@ class HighResClicker:
         self.random_range = 0.0 # ms jitter
         self.limit_mode = 'none' # none, count, time
         self.limit_value = 0
+
+        # Burst mode: several down/up pairs per injection once the interval
+        # drops below what sleep() can reliably resolve
+        self.burst_mode = 'auto' # off, auto, on
+        self.burst_size = 0 # clicks per injection, 0 = derive from min_sleep
+        self.min_sleep = 0.002 # reliable sleep granularity (s)
+
+        # Timing strategy (see timing.py): sleep, hybrid, spin
+        self.timing_mode = 'hybrid'
+        self.cpu_budget = 0.05 # max fraction of each wait spent spinning
+        self.spin_window = 0.002 # absolute cap on the spin stretch (s)
+        # Late clicks are made up to keep the average rate on target, but a
+        # backlog older than this (e.g. after a stall) is dropped, not burst
+        self.max_lag = 0.1
+        self.pacer = None
+
+        # Closed-loop rate control (see rate_control.py): scales the scheduled
+        # rate until the achieved rate is within rate_tolerance of cps
+        self.rate_control = False
+        self.rate_tolerance = 0.02
+        self.controller = None
         
         # Stats
         self.total_clicks = 0
         self.start_time = 0
-        self.on_stats_update = None # Callback function
+        self.end_time = 0
+        self.inject_calls = 0
+        self.inject_time = 0.0 # seconds spent inside the backend
+        self.on_stats_update = None # Callback function, called once when a run ends
+
+        # Timing quality: per-click interval, deviation from the schedule
+        # (jitter) and the achieved rate over a sliding window
+        self.interval_hist = IntervalHistogram()
+        self.jitter_hist = IntervalHistogram()
+        self.rate_window = RateWindow(window=1.0)
         
         # Win32 Timer Resolution
         self.timer_resolution_set = False
 
     def _set_timer_resolution(self):
         if not self.timer_resolution_set:
-            winmm.timeBeginPeriod(1)
-            self.timer_resolution_set = True
+            self.timer_resolution_set = begin_timer_period(1)
 
     def _reset_timer_resolution(self):
         if self.timer_resolution_set:
-            winmm.timeEndPeriod(1)
+            end_timer_period(1)
             self.timer_resolution_set = False
 
-    def _get_click_flags(self):
-        if self.button == 'right':
-            return MOUSEEVENTF_RIGHTDOWN, MOUSEEVENTF_RIGHTUP
-        elif self.button == 'middle':
-            return MOUSEEVENTF_MIDDLEDOWN, MOUSEEVENTF_MIDDLEUP
-        else:
-            return MOUSEEVENTF_LEFTDOWN, MOUSEEVENTF_LEFTUP
+    def _clicks_per_wake(self, base_interval):
+        if self.burst_mode == 'off':
+            return 1
+        if self.burst_mode == 'auto' and base_interval >= self.min_sleep:
+            return 1
+        if self.burst_size > 0:
+            return int(self.burst_size)
+        return max(1, math.ceil(self.min_sleep / base_interval))
+
+    def burst_report(self):
+        """ Achieved rate and injection overhead of the current/last run. """
+        elapsed = time.time() - self.start_time if self.start_time else 0.0
+        calls = self.inject_calls
+        return {
+            'clicks': self.total_clicks,
+            'elapsed': elapsed,
+            'achieved_cps': self.total_clicks / elapsed if elapsed > 0 else 0.0,
+            'calls': calls,
+            'clicks_per_call': self.total_clicks / calls if calls else 0.0,
+            'per_call_us': self.inject_time / calls * 1e6 if calls else 0.0,
+            'per_click_us': self.inject_time / self.total_clicks * 1e6 if self.total_clicks else 0.0,
+        }
+
+    def timing_report(self):
+        """ CPU cost vs. remaining timing error of the current/last run. """
+        if self.pacer is None:
+            return None
+        return self.pacer.report()
+
+    def controller_state(self):
+        """ ControllerState of the current/last run, None if it ran open loop. """
+        controller = self.controller
+        if controller is None:
+            return None
+        return controller.state()
+
+    def snapshot(self):
+        """
+        Lock-free read of the counters the loop publishes. Meant to be polled
+        at display rate from any thread (e.g. the GUI) so stats cost nothing
+        in the click loop.
+        """
+        start_time = self.start_time
+        end_time = self.end_time
+        if not start_time:
+            return ClickerStats(False, 0, 0.0, 0.0)
+        elapsed = (end_time or time.time()) - start_time
+        cps = self.rate_window.rate(None if end_time else time.perf_counter())
+        return ClickerStats(self.running, self.total_clicks, elapsed, cps)
+
+    def interval_stats(self):
+        """ Jitter percentiles (us) and windowed rate of the current/last run. """
+        jitter = self.jitter_hist
+        return {
+            'samples': jitter.count,
+            'interval_p50_us': self.interval_hist.percentile(50) * 1e6,
+            'jitter_p50_us': jitter.percentile(50) * 1e6,
+            'jitter_p99_us': jitter.percentile(99) * 1e6,
+            'jitter_p999_us': jitter.percentile(99.9) * 1e6,
+            'jitter_max_us': jitter.max * 1e6,
+            'window_cps': self.rate_window.rate(),
+        }
 
     def start(self):
         if self.running:
@@ -91,7 +144,15 @@ class HighResClicker:
         self.running = True
         self._stop_event.clear()
         self.total_clicks = 0
+        self.inject_calls = 0
+        self.inject_time = 0.0
+        self.interval_hist.reset()
+        self.jitter_hist.reset()
+        self.rate_window.reset()
+        self.end_time = 0
         self.start_time = time.time()
+        self.controller = (RateController(self.rate_tolerance, allow_burst=self.burst_mode != 'off')
+                           if self.rate_control else None)
         
         self._set_timer_resolution()
         
@@ -107,10 +168,24 @@ class HighResClicker:
         self._reset_timer_resolution()
 
     def _loop(self):
-        down_flag, up_flag = self._get_click_flags()
-        next_click_time = time.perf_counter()
+        click = self.backend.click
+        click_burst = self.backend.click_burst
+        button = self.button
+        perf_counter = time.perf_counter
+        pacer = Pacer(self.timing_mode, self.cpu_budget, self.spin_window, self._stop_event)
+        self.pacer = pacer
+        wait_until = pacer.wait_until
+        max_lag = self.max_lag
+        record_interval = self.interval_hist.record
+        record_jitter = self.jitter_hist.record
+        record_rate = self.rate_window.record
+        controller = self.controller
+        next_click_time = perf_counter()
         
         clicks_done = 0
+        last_inject = None
+        scheduled = 0.0
+        last_n = 1
         
         while self.running:
             if self._stop_event.is_set():
@@ -122,40 +197,62 @@ class HighResClicker:
             if self.limit_mode == 'time' and (time.time() - self.start_time) >= self.limit_value:
                 break
 
-            # Perform Click
-            _send_click(down_flag, up_flag)
-            clicks_done += 1
+            cps = self.cps
+            if controller is not None:
+                cps *= controller.correction
+            base_interval = 1.0 / cps
+            n = self._clicks_per_wake(base_interval)
+            if controller is not None and controller.burst > n:
+                n = controller.burst
+            if self.limit_mode == 'count':
+                n = min(n, int(self.limit_value) - clicks_done)
+
+            # Perform Click(s)
+            t0 = perf_counter()
+            if n == 1:
+                click(button)
+            else:
+                click_burst(button, n)
+            self.inject_time += perf_counter() - t0
+            self.inject_calls += 1
+            clicks_done += n
             self.total_clicks = clicks_done
-            
-            # Update stats (throttled to avoid GUI lag)
-            if self.on_stats_update and clicks_done % 10 == 0:
-                 self.on_stats_update(clicks_done, time.time() - self.start_time)
 
-            # Calculate delay
-            base_interval = 1.0 / self.cps
+            # Timing stats; a burst's wake-up interval is spread over its clicks
+            if last_inject is not None:
+                actual = t0 - last_inject
+                record_interval(actual / last_n)
+                record_jitter(abs(actual - scheduled))
+            last_inject = t0
+            last_n = n
+            record_rate(t0, clicks_done)
+            if controller is not None:
+                controller.update(t0, clicks_done, self.cps)
+
+            # Calculate delay (one wake-up covers n clicks)
             jitter = 0
             if self.random_range > 0:
                 # Randomize within +/- range (converted to seconds)
                 jitter = random.uniform(-self.random_range/1000.0, self.random_range/1000.0)
             
-            target_delay = base_interval + jitter
+            target_delay = base_interval * n + jitter
             if target_delay < 0.001: target_delay = 0.001 # Hard floor for stability
 
-            # Precise sleep logic
-            current_time = time.perf_counter()
+            # Absolute schedule: lateness of one wake-up is absorbed by the
+            # following ones instead of accumulating as drift
             next_click_time += target_delay
-            
-            # If we fell behind, catch up but don't burst too hard
-            if next_click_time < current_time:
+            scheduled = target_delay
+            current_time = perf_counter()
+            if current_time - next_click_time > max_lag:
                 next_click_time = current_time
 
-            sleep_duration = next_click_time - current_time
-            if sleep_duration > 0:
-                time.sleep(sleep_duration)
+            wait_until(next_click_time)
 
+        pacer.finish()
+        self.end_time = time.time()
         self.running = False
         self._reset_timer_resolution()
         # Final update
         if self.on_stats_update:
-            self.on_stats_update(self.total_clicks, time.time() - self.start_time)
+            self.on_stats_update(self.total_clicks, self.end_time - self.start_time)
 
@@ -0,0 +1,139 @@
+import os
+import struct
+import marshal
+import hashlib
+import tempfile
+import threading
+import importlib.util
+from collections import OrderedDict
+
+from macro import Macro
+from playback import SCRIPT_FILENAME
+from paths import app_data_dir
+
+# --- Compiled script cache ---
+# Play-time preparation of a script is keyed by a hash of its source: a
+# straight-line script parses into a Macro, anything else compiles into a
+# code object. Results live in an in-memory LRU and in one file per key on
+# disk, so the same script is never parsed or compiled twice, across
+# restarts too.
+
+CACHE_MAGIC = b'ASPC'
+CACHE_VERSION = 1
+# magic, version, interpreter bytecode magic, kind
+CACHE_HEADER = struct.Struct('<4sH4sc')
+KIND_MACRO = b'M'
+KIND_CODE = b'C'
+
+def default_cache_dir():
+    return app_data_dir('code_cache')
+
+def source_key(source):
+    return hashlib.blake2b(source.encode('utf-8', 'surrogatepass'), digest_size=20).hexdigest()
+
+def prepare(source):
+    """ The uncached work: a Macro for straight-line scripts, else a code object. """
+    macro = Macro.from_source(source)
+    if macro is not None:
+        return macro
+    return compile(source, SCRIPT_FILENAME, 'exec')
+
+class CodeCache:
+    """
+    get(source) returns what prepare(source) would, from memory, from disk,
+    or by preparing and storing it. `directory=None` keeps it memory-only;
+    the disk layer keeps at most `max_files` entries, dropping the least
+    recently used.
+    """
+    def __init__(self, directory=None, capacity=16, max_files=256):
+        self.directory = directory
+        self.capacity = capacity
+        self.max_files = max_files
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        if directory is not None:
+            os.makedirs(directory, exist_ok=True)
+
+    def get(self, source):
+        key = source_key(source)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry
+        entry = self._read(key)
+        if entry is not None:
+            self.disk_hits += 1
+        else:
+            self.misses += 1
+            entry = prepare(source)
+            self._write(key, entry)
+        with self._lock:
+            self._entries[key] = entry
+            while len(self._entries) > self.capacity:
+                self._entries.popitem(last=False)
+        return entry
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        return {'hits': self.hits, 'disk_hits': self.disk_hits, 'misses': self.misses,
+                'entries': len(self._entries)}
+
+    # --- Disk layer ---
+    def _path(self, key):
+        return os.path.join(self.directory, key + '.bin')
+
+    def _read(self, key):
+        if self.directory is None:
+            return None
+        path = self._path(key)
+        try:
+            with open(path, 'rb') as f:
+                data = f.read()
+            magic, version, py_magic, kind = CACHE_HEADER.unpack_from(data, 0)
+            if magic != CACHE_MAGIC or version != CACHE_VERSION or py_magic != importlib.util.MAGIC_NUMBER:
+                return None
+            payload = data[CACHE_HEADER.size:]
+            entry = Macro.from_bytes(payload) if kind == KIND_MACRO else marshal.loads(payload)
+            os.utime(path) # mtime doubles as last-use time for pruning
+            return entry
+        except (OSError, ValueError, EOFError, TypeError, struct.error):
+            return None
+
+    def _write(self, key, entry):
+        if self.directory is None:
+            return
+        if isinstance(entry, Macro):
+            kind, payload = KIND_MACRO, entry.to_bytes()
+        else:
+            kind, payload = KIND_CODE, marshal.dumps(entry)
+        header = CACHE_HEADER.pack(CACHE_MAGIC, CACHE_VERSION, importlib.util.MAGIC_NUMBER, kind)
+        try:
+            # Write then rename, so a crash never leaves a torn entry behind
+            fd, tmp = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+            with os.fdopen(fd, 'wb') as f:
+                f.write(header)
+                f.write(payload)
+            os.replace(tmp, self._path(key))
+            self._prune()
+        except OSError as e:
+            print(f"Warning: Could not write code cache: {e}")
+
+    def _prune(self):
+        files = [os.path.join(self.directory, name) for name in os.listdir(self.directory)
+                 if name.endswith('.bin')]
+        if len(files) <= self.max_files:
+            return
+        files.sort(key=os.path.getmtime)
+        for path in files[:len(files) - self.max_files]:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
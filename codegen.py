@@ -0,0 +1,159 @@
+import itertools
+
+from events import (EVENT_MOVE, EVENT_DOWN, EVENT_UP, EVENT_KEY_DOWN, EVENT_KEY_UP, EVENT_KINDS,
+                    BUTTON_NONE, BUTTON_CODES, BUTTON_NAMES)
+from macro import Macro, op_row, format_rows
+from pipeline import Pipeline, process_events
+
+# --- Recording -> ops -> script ---
+# Click and double-click detection as single-pass streaming stages over
+# (kind, button, x, y, time) event tuples. Each stage holds back at most the
+# events of one undecided click, and every event is re-examined at most
+# once, so the whole conversion is linear in the recording length.
+
+CLICK_SLOP = 5 # px of movement tolerated inside a click / between double-click halves
+DOUBLE_CLICK_GAP = 0.8 # s between the two clicks of a double click
+
+KEY_OP_TYPES = {EVENT_KEY_DOWN: 'key_press', EVENT_KEY_UP: 'key_release'}
+
+class ClickDetector:
+    """
+    Turns raw events into move/click/press/release ops. A down followed by an
+    up of the same button, with only moves within CLICK_SLOP px in between,
+    becomes one click (those moves are dropped). Anything else, a key event
+    included, breaks the candidate: the down becomes a press and the
+    held-back events are processed normally. Key events become key ops.
+    """
+    def __init__(self, slop=CLICK_SLOP):
+        self.slop = slop
+        self.cur_x = 0
+        self.cur_y = 0
+        self.down = None # pending down event
+        self.held = [] # small moves after the pending down
+
+    def _emit(self, ev, out):
+        kind, button, x, y, t = ev
+        if kind == EVENT_MOVE:
+            self.cur_x, self.cur_y = x, y
+            out.append({'type': 'move', 'x': x, 'y': y, 'time': t})
+        elif kind == EVENT_DOWN:
+            self.down = ev
+        elif kind in KEY_OP_TYPES:
+            out.append({'type': KEY_OP_TYPES[kind], 'key': button, 'scan_code': x, 'time': t})
+        else:
+            out.append({'type': 'release', 'button': BUTTON_NAMES.get(button), 'x': self.cur_x, 'y': self.cur_y, 'time': t})
+
+    def _break_candidate(self, ev, out):
+        down = self.down
+        held = self.held
+        self.down = None
+        self.held = []
+        out.append({'type': 'press', 'button': BUTTON_NAMES.get(down[1]), 'x': self.cur_x, 'y': self.cur_y, 'time': down[4]})
+        for move in held:
+            self._emit(move, out)
+        if ev is not None:
+            self._emit(ev, out)
+
+    def feed(self, ev, out):
+        down = self.down
+        if down is None:
+            self._emit(ev, out)
+            return
+        kind = ev[0]
+        if kind == EVENT_MOVE:
+            if abs(ev[2] - self.cur_x) > self.slop or abs(ev[3] - self.cur_y) > self.slop:
+                self._break_candidate(ev, out)
+            else:
+                self.held.append(ev)
+        elif kind == EVENT_UP and ev[1] == down[1]:
+            out.append({'type': 'click', 'button': BUTTON_NAMES.get(down[1]), 'x': self.cur_x, 'y': self.cur_y,
+                        'time': ev[4], 'start_time': down[4]})
+            self.down = None
+            self.held = []
+        else:
+            self._break_candidate(ev, out)
+
+    def flush(self, out):
+        if self.down is not None:
+            self._break_candidate(None, out)
+
+class DoubleClickDetector:
+    """
+    Merges two clicks of the same button less than DOUBLE_CLICK_GAP apart,
+    with only moves within CLICK_SLOP px of the first click in between, into
+    one double_click op.
+    """
+    def __init__(self, slop=CLICK_SLOP, gap=DOUBLE_CLICK_GAP):
+        self.slop = slop
+        self.gap = gap
+        self.click = None # pending click op
+        self.held = [] # small moves after it
+
+    def _release_pending(self, out):
+        out.append(self.click)
+        out.extend(self.held)
+        self.click = None
+        self.held = []
+
+    def feed(self, op, out):
+        click = self.click
+        if click is None:
+            if op['type'] == 'click':
+                self.click = op
+            else:
+                out.append(op)
+            return
+        kind = op['type']
+        if kind == 'move' and abs(op['x'] - click['x']) <= self.slop and abs(op['y'] - click['y']) <= self.slop:
+            self.held.append(op)
+        elif kind == 'click' and op['button'] == click['button'] and op['start_time'] - click['time'] < self.gap:
+            out.append({'type': 'double_click', 'button': click['button'], 'x': click['x'], 'y': click['y'],
+                        'time': op['time']})
+            self.click = None
+            self.held = []
+        else:
+            self._release_pending(out)
+            self.feed(op, out)
+
+    def flush(self, out):
+        if self.click is not None:
+            self._release_pending(out)
+
+def iter_ops(events):
+    """ Streams op dicts for an iterable of event tuples. """
+    return process_events(events, Pipeline([ClickDetector(), DoubleClickDetector()]))
+
+def _with_base_time(events):
+    # Offsets are relative to the first event; peek at it without materializing the stream
+    events = iter(events)
+    first = next(events, None)
+    if first is None:
+        return None, events
+    return first[4], itertools.chain((first,), events)
+
+def iter_lines(events):
+    """ Streams the generated script for an iterable of event tuples, line by line. """
+    base_time, events = _with_base_time(events)
+    if base_time is None:
+        return iter(())
+    return format_rows(op_row(op, base_time) for op in iter_ops(events))
+
+def events_to_macro(events):
+    base_time, events = _with_base_time(events)
+    if base_time is None:
+        return None
+    return Macro.from_ops(iter_ops(events), base_time)
+
+def events_to_code(events):
+    return "\n".join(iter_lines(events))
+
+def from_mouse_events(events):
+    """ Converts `mouse` library event objects to event tuples. """
+    import mouse
+    x = y = 0
+    for e in events:
+        if isinstance(e, mouse.MoveEvent):
+            x, y = e.x, e.y
+            yield (EVENT_MOVE, BUTTON_NONE, x, y, e.time)
+        elif isinstance(e, mouse.ButtonEvent):
+            yield (EVENT_KINDS[e.event_type], BUTTON_CODES.get(e.button, BUTTON_NONE), x, y, e.time)
@@ -0,0 +1,45 @@
+# --- Shared event codes ---
+# Compact integer codes used wherever input events are stored in arrays
+# (recording sinks, recorder buffers, macro timelines).
+
+EVENT_MOVE = 0
+EVENT_DOWN = 1
+EVENT_UP = 2
+EVENT_DOUBLE = 3
+
+EVENT_KINDS = {'down': EVENT_DOWN, 'up': EVENT_UP, 'double': EVENT_DOUBLE}
+EVENT_NAMES = {code: name for name, code in EVENT_KINDS.items()}
+
+BUTTON_NONE = 0
+BUTTON_CODES = {'left': 1, 'right': 2, 'middle': 3, 'x': 4, 'x2': 5}
+BUTTON_NAMES = {code: name for name, code in BUTTON_CODES.items()}
+
+# Key events share the tuple layout: (kind, key, scan_code, 0, time). `key`
+# is the key's code in KEY_CODES, or KEY_NONE for names outside the table,
+# which are then identified by their scan code alone.
+EVENT_KEY_DOWN = 4
+EVENT_KEY_UP = 5
+
+KEY_KINDS = {'down': EVENT_KEY_DOWN, 'up': EVENT_KEY_UP}
+KEY_EVENTS = frozenset(KEY_KINDS.values())
+
+# Codes are stored in recordings and macros: only ever append to this list
+KEY_NONE = 0
+_KEYS = ([chr(c) for c in range(ord('a'), ord('z') + 1)] +
+         [str(d) for d in range(10)] +
+         [f'f{n}' for n in range(1, 25)] +
+         ['space', 'enter', 'tab', 'backspace', 'esc', 'delete', 'insert', 'home', 'end',
+          'page up', 'page down', 'up', 'down', 'left', 'right',
+          'caps lock', 'num lock', 'scroll lock', 'print screen', 'pause', 'menu',
+          'shift', 'right shift', 'ctrl', 'right ctrl', 'alt', 'right alt', 'alt gr',
+          'windows', 'left windows', 'right windows',
+          '-', '=', '[', ']', '\\', ';', "'", ',', '.', '/', '`'])
+KEY_CODES = {name: code for code, name in enumerate(_KEYS, 1)}
+KEY_NAMES = {code: name for name, code in KEY_CODES.items()}
+
+def key_code(name):
+    return KEY_CODES.get(name.lower(), KEY_NONE) if name else KEY_NONE
+
+def key_label(key, scan_code):
+    """ What keyboard.press() takes for a recorded key: its name, else its scan code. """
+    return KEY_NAMES.get(key, scan_code)
@@ -0,0 +1,240 @@
+import re
+import queue
+import threading
+
+# --- Script editor highlighting ---
+# The tokenizer works line by line and carries one piece of state across
+# lines: the delimiter of an open triple-quoted string (or None). Caching the
+# state at the start of every line lets an edit re-tokenize only the lines it
+# touched, continuing downwards only while the carried state differs from the
+# cached one (e.g. after typing an opening ''').
+
+TAG_COLORS = {
+    "keyword": "#FF7B72", # Red/Pink
+    "string": "#A5D6FF",  # Light Blue
+    "comment": "#8B949E", # Gray
+    "number": "#79C0FF",  # Blue
+    "function": "#D2A8FF" # Purple
+}
+
+TOKEN_RE = re.compile(
+    r"(?P<comment>#.*)"
+    r"|(?P<triple>'''|\"\"\")"
+    r"|(?P<string>'(?:\\.|[^'\\])*'|\"(?:\\.|[^\"\\])*\")"
+    r"|(?P<keyword>\b(?:import|def|if|else|elif|while|for|return|from|as|try|except|finally)\b)"
+    r"|(?P<function>\b(?:mouse|keyboard|time|print|click|move|press|release|sleep)\b)"
+    r"|(?P<number>\b\d+(?:\.\d+)?\b)"
+)
+
+DEBOUNCE_MS = 40 # quiet time after the last keystroke before re-highlighting
+POLL_MS = 5 # how often the GUI checks for tokenizer results
+CHUNK_LINES = 2000 # lines per tokenizer job; big buffers are tokenized chunk by chunk
+VIEWPORT_MARGIN = 50 # lines painted above and below the visible ones
+VIEWPORT_POLL_MS = 100 # how often scrolling is checked for unpainted lines
+
+def tokenize_line(line, state=None):
+    """ Returns ([(tag, start_col, end_col), ...], state at the start of the next line). """
+    spans = []
+    pos = 0
+    if state is not None:
+        end = line.find(state)
+        if end < 0:
+            return [("string", 0, len(line))] if line else [], state
+        pos = end + 3
+        spans.append(("string", 0, pos))
+        state = None
+    for m in TOKEN_RE.finditer(line, pos):
+        if m.start() < pos:
+            continue # inside a triple-quoted string closed on this line
+        tag = m.lastgroup
+        if tag == "triple":
+            delim = m.group()
+            end = line.find(delim, m.end())
+            if end < 0:
+                spans.append(("string", m.start(), len(line)))
+                return spans, delim
+            pos = end + 3
+            spans.append(("string", m.start(), pos))
+        else:
+            spans.append((tag, m.start(), m.end()))
+    return spans, state
+
+def tokenize_lines(lines, state=None):
+    """ Tokenizes consecutive lines. Returns (spans per line, state after each line). """
+    all_spans = []
+    states = []
+    for line in lines:
+        spans, state = tokenize_line(line, state)
+        all_spans.append(spans)
+        states.append(state)
+    return all_spans, states
+
+class SyntaxHighlighter:
+    """
+    Incremental highlighter for a tk.Text. Edits only mark lines dirty;
+    after DEBOUNCE_MS of quiet the dirty lines are snapshotted and tokenized
+    on a worker thread, and the GUI thread swaps the tags of just those lines
+    (line.col indices, one tag_add call per tag). Results computed against a
+    buffer that has been edited since are discarded and the range redone.
+
+    Line states are kept for the whole buffer, but tags are only painted for
+    the lines around the viewport; lines scrolled into view later are painted
+    then (checked every `viewport_poll_ms`, None to disable).
+    """
+    def __init__(self, text_widget, debounce_ms=DEBOUNCE_MS, chunk_lines=CHUNK_LINES,
+                 viewport_poll_ms=VIEWPORT_POLL_MS):
+        self.text_widget = text_widget
+        self.tags = TAG_COLORS
+        self.debounce_ms = debounce_ms
+        self.chunk_lines = chunk_lines
+        self.states = [None] # tokenizer state at the start of each line (index 0 = line 1)
+        self.painted = bytearray(1) # 1 if the line's tags are current
+        self.dirty = None # (first, last) line range waiting to be tokenized
+        self.version = 0 # bumped on every edit, used to detect stale results
+        self._after_id = None
+        self._job = None
+        self._jobs = queue.SimpleQueue()
+        self._results = queue.SimpleQueue()
+        self._worker = None
+        self._setup_tags()
+        # <<Modified>> also fires for paste, undo and programmatic edits, not just keys
+        self.text_widget.bind("<<Modified>>", self._on_modified, add="+")
+        self.viewport_poll_ms = viewport_poll_ms
+        if viewport_poll_ms is not None:
+            self.text_widget.after(viewport_poll_ms, self._watch_viewport)
+
+    def _setup_tags(self):
+        for name, color in self.tags.items():
+            self.text_widget.tag_config(name, foreground=color)
+
+    def _line_count(self):
+        return int(self.text_widget.index("end-1c").split(".")[0])
+
+    def _viewport(self):
+        text = self.text_widget
+        top = int(text.index("@0,0").split(".")[0])
+        bottom = int(text.index(f"@0,{text.winfo_height()}").split(".")[0])
+        return max(1, top - VIEWPORT_MARGIN), bottom + VIEWPORT_MARGIN
+
+    # --- Dirty tracking (GUI thread) ---
+    def highlight(self, event=None):
+        """ Re-highlights the whole buffer, e.g. after the text was replaced programmatically. """
+        self.version += 1
+        self.states = [None] * self._line_count()
+        self.painted = bytearray(len(self.states))
+        self.dirty = None
+        for tag in self.tags:
+            self.text_widget.tag_remove(tag, "1.0", "end")
+        self.text_widget.edit_modified(False)
+        self.mark_dirty(1, len(self.states), delay=0)
+
+    def _on_modified(self, event=None):
+        text = self.text_widget
+        if not text.edit_modified():
+            return # our own reset of the flag
+        text.edit_modified(False)
+        self.version += 1
+        # Keep the per-line state cache aligned with the buffer: typing, paste
+        # and undo leave the cursor next to the lines they added or removed.
+        # Code that edits elsewhere calls highlight() afterwards.
+        line = int(text.index("insert").split(".")[0])
+        delta = self._line_count() - len(self.states)
+        first = line
+        if delta > 0:
+            first = max(1, line - delta)
+            self.states[first:first] = [None] * delta
+            self.painted[first:first] = bytes(delta)
+        elif delta < 0:
+            del self.states[line:line - delta]
+            del self.painted[line:line - delta]
+        self.mark_dirty(first, line)
+
+    def check_viewport(self):
+        """ Queues the unpainted lines around the viewport. """
+        top, bottom = self._viewport()
+        bottom = min(bottom, len(self.painted))
+        first = self.painted.find(0, top - 1, bottom)
+        if first >= 0:
+            self.mark_dirty(first + 1, self.painted.rfind(0, top - 1, bottom) + 1, delay=0)
+
+    def _watch_viewport(self):
+        self.check_viewport()
+        self.text_widget.after(self.viewport_poll_ms, self._watch_viewport)
+
+    def mark_dirty(self, first, last, delay=None):
+        if self.dirty is not None:
+            first = min(first, self.dirty[0])
+            last = max(last, self.dirty[1])
+        self.dirty = (first, last)
+        if self._after_id is not None:
+            self.text_widget.after_cancel(self._after_id)
+        self._after_id = self.text_widget.after(self.debounce_ms if delay is None else delay, self._dispatch)
+
+    def _dispatch(self):
+        self._after_id = None
+        if self._job is not None or self.dirty is None:
+            return # the result handler dispatches again
+        n = len(self.states)
+        first, last = self.dirty
+        last = min(last, n)
+        if first > last:
+            self.dirty = None
+            return
+        end = min(last, first + self.chunk_lines - 1)
+        self.dirty = (end + 1, last) if end < last else None
+        lines = self.text_widget.get(f"{first}.0", f"{end}.end").split("\n")
+        self._job = (self.version, first, end)
+        if self._worker is None:
+            self._worker = threading.Thread(target=self._work_loop, daemon=True)
+            self._worker.start()
+        self._jobs.put((self._job, lines, self.states[first - 1]))
+        self.text_widget.after(POLL_MS, self._poll)
+
+    # --- Tokenizer thread ---
+    def _work_loop(self):
+        while True:
+            job, lines, state = self._jobs.get()
+            self._results.put((job, tokenize_lines(lines, state)))
+
+    # --- Applying results (GUI thread) ---
+    def _poll(self):
+        try:
+            job, (spans, states) = self._results.get_nowait()
+        except queue.Empty:
+            self.text_widget.after(POLL_MS, self._poll)
+            return
+        self._job = None
+        version, first, last = job
+        if version != self.version:
+            # Edited while tokenizing; line numbers may have moved, so just redo the range
+            self.mark_dirty(first, last)
+            return
+        self._apply(first, last, spans)
+        n = len(self.states)
+        # states[i] is the state at the start of line i + 1
+        self.states[first:last] = states[:-1]
+        if last < n and self.states[last] != states[-1]:
+            # The carried state changed (string opened or closed): continue downwards
+            self.states[last] = states[-1]
+            self.mark_dirty(last + 1, min(n, last + self.chunk_lines), delay=0)
+        elif self.dirty is not None:
+            self._dispatch()
+
+    def _apply(self, first, last, spans):
+        text = self.text_widget
+        start, end = f"{first}.0", f"{last}.end"
+        for tag in self.tags:
+            text.tag_remove(tag, start, end)
+        top, bottom = self._viewport()
+        top, bottom = max(top, first), min(bottom, last)
+        self.painted[first - 1:last] = bytes(last - first + 1)
+        if top > bottom:
+            return
+        self.painted[top - 1:bottom] = b"\x01" * (bottom - top + 1)
+        ranges = {tag: [] for tag in self.tags}
+        for line, line_spans in enumerate(spans[top - first:bottom - first + 1], top):
+            for tag, a, b in line_spans:
+                ranges[tag].extend((f"{line}.{a}", f"{line}.{b}"))
+        for tag, indices in ranges.items():
+            if indices:
+                text.tag_add(tag, *indices)
@@ -0,0 +1,97 @@
+import time
+import queue
+import threading
+
+from timing_stats import IntervalHistogram
+
+# --- Hotkey dispatch ---
+# keyboard runs hotkey callbacks on its OS hook thread; anything slow there
+# (joining the clicker thread, reconfiguring Tk widgets) delays or drops
+# other keystrokes. Hotkeys therefore only post a command name, and one
+# dispatcher thread runs the handlers in order. Handlers change engine
+# state themselves and hand widget updates to the Tk thread (via `after`).
+# A handler that only schedules the real work there returns DEFERRED and
+# calls record() once the command has actually taken effect.
+
+DEFERRED = object()
+
+class HotkeyDispatcher:
+    """
+    Runs registered handlers for posted commands on a single thread and
+    records, per command, the latency from post() (the key press) to the
+    handler returning. Commands without a handler are counted as errors.
+    """
+    def __init__(self):
+        self._handlers = {}
+        self._queue = queue.SimpleQueue()
+        self._thread = None
+        self.latency = {} # command -> IntervalHistogram (seconds)
+        self.errors = 0
+        self.posted = 0.0 # post() time of the command being handled
+
+    def register(self, command, handler):
+        self._handlers[command] = handler
+        self.latency.setdefault(command, IntervalHistogram())
+
+    def post(self, command, *args):
+        """ Queues `command`; safe to call from the hook thread, never blocks. """
+        self._queue.put((command, args, time.perf_counter()))
+
+    def hotkey(self, command, *args):
+        """ A callback for keyboard.add_hotkey that posts `command`. """
+        return lambda: self.post(command, *args)
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, daemon=True)
+            self._thread.start()
+
+    def stop(self, timeout=1.0):
+        """ Stops after the commands already queued. """
+        if self._thread is not None:
+            self._queue.put(None)
+            self._thread.join(timeout)
+            self._thread = None
+
+    def _run(self):
+        while True:
+            item = self._queue.get()
+            if item is None:
+                return
+            command, args, posted = item
+            handler = self._handlers.get(command)
+            if handler is None:
+                self.errors += 1
+                print(f"Hotkey Error: no handler for {command!r}")
+                continue
+            self.posted = posted
+            result = None
+            try:
+                result = handler(*args)
+            except Exception as e:
+                self.errors += 1
+                print(f"Hotkey Error ({command}): {e}")
+            if result is not DEFERRED:
+                self.record(command, posted)
+
+    def record(self, command, posted):
+        """ Records `command`'s latency from its post() time until now. """
+        self.latency[command].record(time.perf_counter() - posted)
+
+    def latency_report(self):
+        """ {command: {count, p50_us, p99_us, max_us}} for every command run at least once. """
+        report = {}
+        for command, hist in self.latency.items():
+            if hist.count:
+                report[command] = {
+                    'count': hist.count,
+                    'p50_us': hist.percentile(50) * 1e6,
+                    'p99_us': hist.percentile(99) * 1e6,
+                    'max_us': hist.max * 1e6,
+                }
+        return report
+
+    def format_report(self):
+        return "\n".join(f"{command}: {r['count']} 次, p50 {r['p50_us']:.0f}us, "
+                         f"p99 {r['p99_us']:.0f}us, max {r['max_us']:.0f}us"
+                         for command, r in self.latency_report().items())
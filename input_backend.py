@@ -0,0 +1,433 @@
+import sys
+import time
+import ctypes
+from array import array
+from ctypes import wintypes
+
+from events import (EVENT_MOVE, EVENT_DOWN, EVENT_UP, EVENT_KEY_DOWN, EVENT_KEY_UP,
+                    BUTTON_NONE, BUTTON_CODES, KEY_NONE, key_code)
+
+# --- Win32 API Definitions ---
+IS_WINDOWS = sys.platform == 'win32'
+
+if IS_WINDOWS:
+    user32 = ctypes.windll.user32
+    winmm = ctypes.windll.winmm
+else:
+    user32 = None
+    winmm = None
+
+INPUT_MOUSE = 0
+MOUSEEVENTF_MOVE = 0x0001
+MOUSEEVENTF_LEFTDOWN = 0x0002
+MOUSEEVENTF_LEFTUP = 0x0004
+MOUSEEVENTF_RIGHTDOWN = 0x0008
+MOUSEEVENTF_RIGHTUP = 0x0010
+MOUSEEVENTF_MIDDLEDOWN = 0x0020
+MOUSEEVENTF_MIDDLEUP = 0x0040
+MOUSEEVENTF_VIRTUALDESK = 0x4000
+MOUSEEVENTF_ABSOLUTE = 0x8000
+
+SM_XVIRTUALSCREEN = 76
+SM_YVIRTUALSCREEN = 77
+SM_CXVIRTUALSCREEN = 78
+SM_CYVIRTUALSCREEN = 79
+
+BUTTON_FLAGS = {
+    'left': (MOUSEEVENTF_LEFTDOWN, MOUSEEVENTF_LEFTUP),
+    'right': (MOUSEEVENTF_RIGHTDOWN, MOUSEEVENTF_RIGHTUP),
+    'middle': (MOUSEEVENTF_MIDDLEDOWN, MOUSEEVENTF_MIDDLEUP),
+}
+
+class MOUSEINPUT(ctypes.Structure):
+    _fields_ = [("dx", wintypes.LONG),
+                ("dy", wintypes.LONG),
+                ("mouseData", wintypes.DWORD),
+                ("dwFlags", wintypes.DWORD),
+                ("time", wintypes.DWORD),
+                ("dwExtraInfo", ctypes.POINTER(wintypes.ULONG))]
+
+class INPUT(ctypes.Structure):
+    _fields_ = [("type", wintypes.DWORD),
+                ("mi", MOUSEINPUT)]
+
+def begin_timer_period(period=1):
+    """ Raise the system timer resolution (Windows only). Returns True if applied. """
+    if winmm is None:
+        return False
+    winmm.timeBeginPeriod(period)
+    return True
+
+def end_timer_period(period=1):
+    if winmm is None:
+        return False
+    winmm.timeEndPeriod(period)
+    return True
+
+def enable_dpi_awareness():
+    """ Physical-pixel coordinates for moves, same as generated scripts request. """
+    if not IS_WINDOWS:
+        return False
+    try:
+        ctypes.windll.shcore.SetProcessDpiAwareness(1)
+    except Exception:
+        return False
+    return True
+
+# --- Backends ---
+class InputBackend:
+    """
+    Sink for injected input. Mouse method names mirror the `mouse` module so
+    a backend can stand in for it inside playback scripts; key_press() and
+    key_release() take what keyboard.press() takes (a key name or scan code).
+    """
+    def move(self, x, y):
+        raise NotImplementedError
+
+    def press(self, button='left'):
+        raise NotImplementedError
+
+    def release(self, button='left'):
+        raise NotImplementedError
+
+    def click(self, button='left'):
+        self.press(button)
+        self.release(button)
+
+    def click_burst(self, button='left', count=1):
+        """ `count` down/up pairs, ideally submitted as a single injection. """
+        for _ in range(count):
+            self.click(button)
+
+    def send_batch(self, ops):
+        """
+        Clicks for several streams that are due at the same time. `ops` is a
+        sequence of (button, x, y); x/y of None means click in place.
+        """
+        for button, x, y in ops:
+            if x is not None:
+                self.move(x, y)
+            self.click(button)
+
+    def double_click(self, button='left'):
+        self.click(button)
+        self.click(button)
+
+    def key_press(self, key):
+        raise NotImplementedError
+
+    def key_release(self, key):
+        raise NotImplementedError
+
+    def get_position(self):
+        return (0, 0)
+
+class Win32InputBackend(InputBackend):
+    """
+    Injects real input through SendInput. INPUT arrays are built once per
+    (button, count) and reused, so a click or a burst costs one syscall and
+    no allocations.
+    """
+    def __init__(self):
+        if user32 is None:
+            raise OSError("Win32InputBackend requires Windows")
+        self._extra = ctypes.c_ulong(0)
+        self._extra_ptr = ctypes.pointer(self._extra)
+        self._input_size = ctypes.sizeof(INPUT)
+        self._send_input = user32.SendInput
+        self._single = {}
+        self._bursts = {}
+        self._batches = {}
+        self._screen = None
+
+    def _build(self, flag_seq):
+        inputs = (INPUT * len(flag_seq))()
+        for ii, flags in zip(inputs, flag_seq):
+            ii.type = INPUT_MOUSE
+            ii.mi.dwFlags = flags
+            ii.mi.dwExtraInfo = self._extra_ptr
+        return inputs
+
+    def _buffer(self, button, count):
+        key = (button, count)
+        buf = self._bursts.get(key)
+        if buf is None:
+            btn_down, btn_up = BUTTON_FLAGS[button]
+            buf = self._build((btn_down, btn_up) * count)
+            self._bursts[key] = buf
+        return buf
+
+    def _send(self, flags):
+        buf = self._single.get(flags)
+        if buf is None:
+            buf = self._single[flags] = self._build((flags,))
+        self._send_input(1, buf, self._input_size)
+
+    def move(self, x, y):
+        user32.SetCursorPos(int(x), int(y))
+
+    def key_press(self, key):
+        import keyboard
+        keyboard.press(key)
+
+    def key_release(self, key):
+        import keyboard
+        keyboard.release(key)
+
+    def press(self, button='left'):
+        self._send(BUTTON_FLAGS[button][0])
+
+    def release(self, button='left'):
+        self._send(BUTTON_FLAGS[button][1])
+
+    def click(self, button='left'):
+        self._send_input(2, self._buffer(button, 1), self._input_size)
+
+    def click_burst(self, button='left', count=1):
+        self._send_input(2 * count, self._buffer(button, count), self._input_size)
+
+    def _virtual_screen(self):
+        get = user32.GetSystemMetrics
+        return (get(SM_XVIRTUALSCREEN), get(SM_YVIRTUALSCREEN),
+                max(2, get(SM_CXVIRTUALSCREEN)), max(2, get(SM_CYVIRTUALSCREEN)))
+
+    def _absolute(self, x, y):
+        # SendInput absolute coordinates are normalized to 0..65535 over the virtual desktop
+        left, top, width, height = self._screen
+        return ((int(x) - left) * 65535 // (width - 1),
+                (int(y) - top) * 65535 // (height - 1))
+
+    def send_batch(self, ops):
+        screen = self._virtual_screen()
+        if screen != self._screen:
+            # Resolution or monitor layout changed: cached coordinates are stale
+            self._batches.clear()
+            self._screen = screen
+        key = tuple(ops)
+        buf = self._batches.get(key)
+        if buf is None:
+            inputs = []
+            for button, x, y in key:
+                if x is not None:
+                    inputs.append((MOUSEEVENTF_MOVE | MOUSEEVENTF_ABSOLUTE | MOUSEEVENTF_VIRTUALDESK,)
+                                  + self._absolute(x, y))
+                btn_down, btn_up = BUTTON_FLAGS[button]
+                inputs.append((btn_down, 0, 0))
+                inputs.append((btn_up, 0, 0))
+            buf = self._build([flags for flags, _, _ in inputs])
+            for ii, (_, dx, dy) in zip(buf, inputs):
+                ii.mi.dx = dx
+                ii.mi.dy = dy
+            # Stream combinations repeat, so keep a bounded cache of built batches
+            if len(self._batches) >= 256:
+                self._batches.clear()
+            self._batches[key] = buf
+        self._send_input(len(buf), buf, self._input_size)
+
+    def get_position(self):
+        point = wintypes.POINT()
+        user32.GetCursorPos(ctypes.byref(point))
+        return (point.x, point.y)
+
+class NullInputBackend(InputBackend):
+    """ Discards everything. Useful for measuring pure loop overhead. """
+    def move(self, x, y):
+        pass
+
+    def press(self, button='left'):
+        pass
+
+    def release(self, button='left'):
+        pass
+
+    def click(self, button='left'):
+        pass
+
+    def click_burst(self, button='left', count=1):
+        pass
+
+    def send_batch(self, ops):
+        pass
+
+    def key_press(self, key):
+        pass
+
+    def key_release(self, key):
+        pass
+
+class RecordingInputBackend(InputBackend):
+    """
+    Timestamps every injected event into preallocated columns
+    (kind/button/x/y/time), key events in the recorder's layout (see
+    events.py). Events beyond `capacity` are counted in `dropped`.
+    """
+    def __init__(self, capacity=1000000, clock=time.perf_counter):
+        self.capacity = capacity
+        self.clock = clock
+        self.kinds = array('B', bytes(capacity))
+        self.buttons = array('B', bytes(capacity))
+        self.xs = array('i', [0]) * capacity
+        self.ys = array('i', [0]) * capacity
+        self.times = array('d', [0.0]) * capacity
+        self.count = 0
+        self.dropped = 0
+        self._x = 0
+        self._y = 0
+
+    def _record(self, kind, button, x, y):
+        i = self.count
+        if i >= self.capacity:
+            self.dropped += 1
+            return
+        self.times[i] = self.clock()
+        self.kinds[i] = kind
+        self.buttons[i] = button
+        self.xs[i] = x
+        self.ys[i] = y
+        self.count = i + 1
+
+    def _record_key(self, kind, key):
+        if isinstance(key, str):
+            self._record(kind, key_code(key), 0, 0)
+        else:
+            self._record(kind, KEY_NONE, int(key), 0)
+
+    def move(self, x, y):
+        self._x = int(x)
+        self._y = int(y)
+        self._record(EVENT_MOVE, BUTTON_NONE, self._x, self._y)
+
+    def press(self, button='left'):
+        self._record(EVENT_DOWN, BUTTON_CODES[button], self._x, self._y)
+
+    def release(self, button='left'):
+        self._record(EVENT_UP, BUTTON_CODES[button], self._x, self._y)
+
+    def key_press(self, key):
+        self._record_key(EVENT_KEY_DOWN, key)
+
+    def key_release(self, key):
+        self._record_key(EVENT_KEY_UP, key)
+
+    def get_position(self):
+        return (self._x, self._y)
+
+    def clear(self):
+        self.count = 0
+        self.dropped = 0
+
+    def events(self):
+        """ Yields (kind, button, x, y, time) tuples for the recorded events. """
+        for i in range(self.count):
+            yield (self.kinds[i], self.buttons[i], self.xs[i], self.ys[i], self.times[i])
+
+    def press_times(self):
+        """ Timestamps of every button-down event, i.e. one per click. """
+        kinds = self.kinds
+        times = self.times
+        return [times[i] for i in range(self.count) if kinds[i] == EVENT_DOWN]
+
+def default_backend():
+    """ Real input on Windows, a no-op sink everywhere else. """
+    if IS_WINDOWS:
+        return Win32InputBackend()
+    return NullInputBackend()
+
+# --- Playback helpers ---
+class ScriptMouse:
+    """
+    Stand-in for the `mouse` module inside exec'd scripts. Injection goes
+    through the backend; anything else falls back to the real module.
+    `duration` drags step through `time_module.sleep`, so they stay
+    interruptible and speed-scaled during playback.
+    """
+    def __init__(self, backend, time_module=time):
+        self._backend = backend
+        self._time = time_module
+
+    def move(self, x, y, absolute=True, duration=0, steps_per_second=120.0):
+        # Same semantics as mouse.move()
+        if not absolute or duration:
+            start_x, start_y = self._backend.get_position()
+            if not absolute:
+                x, y = start_x + x, start_y + y
+        if not duration:
+            self._backend.move(x, y)
+            return
+        dx, dy = x - start_x, y - start_y
+        if dx == 0 and dy == 0:
+            self._time.sleep(duration)
+            return
+        steps = max(1, int(duration * steps_per_second))
+        for i in range(1, steps + 1):
+            self._backend.move(start_x + dx * i / steps, start_y + dy * i / steps)
+            self._time.sleep(duration / steps)
+
+    def press(self, button='left'):
+        self._backend.press(button)
+
+    def release(self, button='left'):
+        self._backend.release(button)
+
+    def click(self, button='left'):
+        self._backend.click(button)
+
+    def double_click(self, button='left'):
+        self._backend.double_click(button)
+
+    def click_burst(self, button='left', count=1):
+        self._backend.click_burst(button, count)
+
+    def get_position(self):
+        return self._backend.get_position()
+
+    def __getattr__(self, name):
+        import mouse
+        return getattr(mouse, name)
+
+class ScriptKeyboard:
+    """ Stand-in for the `keyboard` module inside exec'd scripts, like ScriptMouse. """
+    def __init__(self, backend):
+        self._backend = backend
+
+    def press(self, key):
+        self._backend.key_press(key)
+
+    def release(self, key):
+        self._backend.key_release(key)
+
+    def send(self, key, do_press=True, do_release=True):
+        if do_press:
+            self._backend.key_press(key)
+        if do_release:
+            self._backend.key_release(key)
+
+    def __getattr__(self, name):
+        import keyboard
+        return getattr(keyboard, name)
+
+def script_globals(backend, time_module=time, **extra):
+    """
+    Globals for exec'ing a playback script so that the injected `mouse` and
+    `keyboard` names, and importing them inside the script, resolve to the
+    backend. `time_module` likewise replaces `time` (e.g. with an
+    interruptible sleep).
+    """
+    import builtins
+    proxies = {'mouse': ScriptMouse(backend, time_module), 'keyboard': ScriptKeyboard(backend)}
+    real_import = builtins.__import__
+
+    def _import(name, globals=None, locals=None, fromlist=(), level=0):
+        if name in proxies and level == 0:
+            return proxies[name]
+        if name == 'time' and level == 0:
+            return time_module
+        return real_import(name, globals, locals, fromlist, level)
+
+    script_builtins = dict(vars(builtins))
+    script_builtins['__import__'] = _import
+    namespace = {'__builtins__': script_builtins, '__name__': '__main__',
+                 'time': time_module}
+    namespace.update(proxies)
+    namespace.update(extra)
+    return namespace
@@ -0,0 +1,246 @@
+import re
+import ast
+import sys
+import struct
+from array import array
+
+from events import BUTTON_NONE, BUTTON_CODES, BUTTON_NAMES, key_code, key_label
+
+# --- Op Codes ---
+OP_MOVE = 0
+OP_CLICK = 1
+OP_DOUBLE_CLICK = 2
+OP_PRESS = 3
+OP_RELEASE = 4
+# Key ops keep the key code in `buttons` and the scan code in `xs` (see events.py)
+OP_KEY_PRESS = 5
+OP_KEY_RELEASE = 6
+
+OP_CODES = {'move': OP_MOVE, 'click': OP_CLICK, 'double_click': OP_DOUBLE_CLICK,
+            'press': OP_PRESS, 'release': OP_RELEASE,
+            'key_press': OP_KEY_PRESS, 'key_release': OP_KEY_RELEASE}
+OP_NAMES = {code: name for name, code in OP_CODES.items()}
+KEY_OPS = {OP_KEY_PRESS: 'press', OP_KEY_RELEASE: 'release'} # op -> keyboard function
+
+# Binary layout: header, then one packed array per column
+MAGIC = b'ASPM'
+VERSION = 1
+HEADER = struct.Struct('<4sHId') # magic, version, op count, base time
+COLUMNS = (('ops', 'B'), ('buttons', 'B'), ('xs', 'i'), ('ys', 'i'),
+           ('times', 'd'), ('durations', 'd'))
+
+SCRIPT_HEADER = ["import mouse", "import keyboard", "import time", "import ctypes", "",
+                 "# Enable high precision timer",
+                 "ctypes.windll.winmm.timeBeginPeriod(1)",
+                 "# Enable High DPI Awareness",
+                 "try:",
+                 "    ctypes.windll.shcore.SetProcessDpiAwareness(1)",
+                 "except:",
+                 "    pass",
+                 "",
+                 "def run_script():"]
+SCRIPT_FOOTER = ["",
+                 "    ctypes.windll.winmm.timeEndPeriod(1)",
+                 "",
+                 "if __name__ == '__main__':",
+                 "    run_script()"]
+
+# Statements accepted by from_source() inside run_script()
+_SLEEP_RE = re.compile(r"time\.sleep\(\s*([0-9.eE+-]+)\s*\)$")
+_MOVE_RE = re.compile(r"mouse\.move\(\s*(-?\d+)\s*,\s*(-?\d+)\s*\)$")
+_BUTTON_RE = re.compile(r"mouse\.(click|double_click|press|release)\(\s*(?:button\s*=\s*)?['\"](\w+)['\"]\s*\)$")
+_KEY_RE = re.compile(r"keyboard\.(press|release)\((.+)\)$")
+_PASSTHROUGH = {line.strip() for line in SCRIPT_HEADER + SCRIPT_FOOTER}
+_BODY_PASSTHROUGH = {"ctypes.windll.winmm.timeEndPeriod(1)"}
+
+def op_row(op, base_time):
+    """
+    Converts an op dict from click detection ({'type', 'button', 'x', 'y',
+    'time'[, 'start_time']}) into an (op, button, x, y, offset, duration) row.
+    """
+    kind = op['type']
+    if 'key' in op:
+        return (OP_CODES[kind], op['key'], op['scan_code'], 0, op['time'] - base_time, 0.0)
+    # Clicks start when the button went down, everything else at 'time'
+    start = op.get('start_time', op['time']) if kind in ('click', 'double_click') else op['time']
+    return (OP_CODES[kind], BUTTON_CODES.get(op.get('button'), BUTTON_NONE),
+            op['x'], op['y'], start - base_time, op['time'] - start)
+
+def format_rows(rows):
+    """ Yields the generated Python script for an iterable of op rows, line by line. """
+    yield from SCRIPT_HEADER
+    last_time = 0.0
+    script_x, script_y = -1, -1
+    for op, button, x, y, t, duration in rows:
+        dt = t - last_time
+        if dt > 0.002:
+            yield f"    time.sleep({dt:.4f})"
+
+        if op in KEY_OPS:
+            yield f"    keyboard.{KEY_OPS[op]}({key_label(button, x)!r})"
+            last_time = t
+            continue
+
+        if (x, y) != (script_x, script_y):
+            yield f"    mouse.move({x}, {y})"
+            script_x, script_y = x, y
+
+        if op != OP_MOVE:
+            yield f"    mouse.{OP_NAMES[op]}(button='{BUTTON_NAMES[button]}')"
+
+        last_time = t + duration
+    yield from SCRIPT_FOOTER
+
+class Macro:
+    """
+    Array-backed macro timeline. Every op carries its position and an absolute
+    offset (`times`, seconds from the start of the macro), so playback can run
+    against deadlines instead of chaining relative sleeps. `durations` keeps
+    how long a recorded click/double click lasted so the Python export can
+    reproduce the original relative sleeps.
+    """
+    def __init__(self, base_time=0.0):
+        self.base_time = base_time
+        self.ops = array('B')
+        self.buttons = array('B')
+        self.xs = array('i')
+        self.ys = array('i')
+        self.times = array('d')
+        self.durations = array('d')
+
+    def __len__(self):
+        return len(self.ops)
+
+    def append(self, op, button, x, y, t, duration=0.0):
+        self.ops.append(op)
+        self.buttons.append(button)
+        self.xs.append(x)
+        self.ys.append(y)
+        self.times.append(t)
+        self.durations.append(duration)
+
+    def duration(self):
+        if not self.ops:
+            return 0.0
+        return self.times[-1] + self.durations[-1]
+
+    # --- Construction ---
+    @classmethod
+    def from_ops(cls, ops, base_time):
+        """ Builds a macro from the op dicts produced by click detection (see op_row). """
+        macro = cls(base_time)
+        append = macro.append
+        for op in ops:
+            append(*op_row(op, base_time))
+        return macro
+
+    @classmethod
+    def from_source(cls, code):
+        """
+        Parses a straight-line script in the generated format back into a
+        macro. Returns None if the script contains anything else, in which case
+        it has to be exec'd instead.
+        """
+        macro = cls()
+        t = 0.0
+        x, y = -1, -1
+        in_body = False
+        for raw in code.splitlines():
+            line = raw.strip()
+            if not line or line.startswith('#'):
+                continue
+            if line == "def run_script():":
+                in_body = True
+                continue
+            if in_body and raw.startswith("    "):
+                m = _SLEEP_RE.match(line)
+                if m:
+                    t += float(m.group(1))
+                    continue
+                m = _MOVE_RE.match(line)
+                if m:
+                    x, y = int(m.group(1)), int(m.group(2))
+                    macro.append(OP_MOVE, BUTTON_NONE, x, y, t)
+                    continue
+                m = _BUTTON_RE.match(line)
+                if m:
+                    if m.group(2) not in BUTTON_CODES:
+                        return None
+                    # A move directly before an action is folded into it, as in the generated form
+                    if macro.ops and macro.ops[-1] == OP_MOVE and macro.times[-1] == t:
+                        macro._pop()
+                    macro.append(OP_CODES[m.group(1)], BUTTON_CODES[m.group(2)], x, y, t)
+                    continue
+                m = _KEY_RE.match(line)
+                if m:
+                    try:
+                        key = ast.literal_eval(m.group(2))
+                    except (ValueError, SyntaxError):
+                        return None
+                    op = OP_CODES['key_' + m.group(1)]
+                    if isinstance(key, str) and key_code(key):
+                        macro.append(op, key_code(key), 0, 0, t)
+                    elif type(key) is int and key > 0:
+                        macro.append(op, 0, key, 0, t)
+                    else:
+                        return None
+                    continue
+                if line in _BODY_PASSTHROUGH:
+                    continue
+                return None
+            in_body = False
+            if line not in _PASSTHROUGH:
+                return None
+        return macro
+
+    def _pop(self):
+        for name, _ in COLUMNS:
+            getattr(self, name).pop()
+
+    # --- Export ---
+    def rows(self):
+        return zip(self.ops, self.buttons, self.xs, self.ys, self.times, self.durations)
+
+    def iter_lines(self):
+        """ Yields the macro as lines of the generated Python script. """
+        return format_rows(self.rows())
+
+    def to_source(self):
+        return "\n".join(self.iter_lines())
+
+    # --- Binary format ---
+    def to_bytes(self):
+        parts = [HEADER.pack(MAGIC, VERSION, len(self.ops), self.base_time)]
+        for name, _ in COLUMNS:
+            column = getattr(self, name)
+            if sys.byteorder == 'big':
+                column = array(column.typecode, column)
+                column.byteswap()
+            parts.append(column.tobytes())
+        return b"".join(parts)
+
+    @classmethod
+    def from_bytes(cls, data):
+        magic, version, count, base_time = HEADER.unpack_from(data, 0)
+        if magic != MAGIC or version != VERSION:
+            raise ValueError("Not a macro file")
+        macro = cls(base_time)
+        offset = HEADER.size
+        for name, typecode in COLUMNS:
+            column = array(typecode)
+            size = column.itemsize * count
+            column.frombytes(data[offset:offset + size])
+            if sys.byteorder == 'big':
+                column.byteswap()
+            setattr(macro, name, column)
+            offset += size
+        return macro
+
+    def save(self, path):
+        with open(path, 'wb') as f:
+            f.write(self.to_bytes())
+
+    @classmethod
+    def load(cls, path):
+        with open(path, 'rb') as f:
+            return cls.from_bytes(f.read())
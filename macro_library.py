@@ -0,0 +1,197 @@
+import io
+import os
+import time
+import sqlite3
+import threading
+from collections import namedtuple
+
+from macro import Macro
+from paths import app_data_dir
+from recorder import read_raw
+
+# --- Macro library ---
+# One SQLite file. Listing and searching only touch the small `macros` and
+# `tags` tables (indexed by name, tag and hotkey); script text, the compiled
+# macro and the raw recording live in `bodies` and are read only when a
+# macro is opened, so startup cost doesn't grow with what is stored.
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS macros (
+    id INTEGER PRIMARY KEY,
+    name TEXT NOT NULL UNIQUE COLLATE NOCASE,
+    hotkey TEXT UNIQUE,
+    created REAL NOT NULL,
+    modified REAL NOT NULL,
+    op_count INTEGER NOT NULL DEFAULT 0,
+    duration REAL NOT NULL DEFAULT 0,
+    size INTEGER NOT NULL DEFAULT 0
+);
+CREATE TABLE IF NOT EXISTS tags (
+    tag TEXT NOT NULL COLLATE NOCASE,
+    macro_id INTEGER NOT NULL REFERENCES macros(id) ON DELETE CASCADE,
+    PRIMARY KEY (tag, macro_id)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS tags_by_macro ON tags(macro_id);
+CREATE TABLE IF NOT EXISTS bodies (
+    macro_id INTEGER PRIMARY KEY REFERENCES macros(id) ON DELETE CASCADE,
+    source TEXT NOT NULL,
+    macro BLOB,
+    raw BLOB
+);
+"""
+
+MacroEntry = namedtuple('MacroEntry', ['id', 'name', 'hotkey', 'modified', 'op_count', 'duration', 'size', 'tags'])
+
+def default_library_path():
+    return app_data_dir('library.db')
+
+def _like_prefix(text):
+    return text.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_') + '%'
+
+class MacroLibrary:
+    """ Stored scripts with metadata, tags and hotkey bindings. Safe to share between threads. """
+    def __init__(self, path=None):
+        self.path = path if path is not None else default_library_path()
+        if self.path != ':memory:':
+            os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        self._conn = sqlite3.connect(self.path, check_same_thread=False)
+        self._lock = threading.Lock()
+        with self._lock, self._conn:
+            self._conn.execute("PRAGMA foreign_keys = ON")
+            self._conn.execute("PRAGMA journal_mode = WAL")
+            self._conn.executescript(SCHEMA)
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+    # --- Writing ---
+    def save(self, name, source, macro=None, raw=None, tags=(), hotkey=None):
+        """
+        Stores a script under `name`, replacing the body and tags of an
+        existing one. `macro` is its compiled Macro (if straight-line), `raw`
+        the recording's raw_format bytes. Returns the macro id.
+        """
+        now = time.time()
+        op_count = len(macro.ops) if macro is not None else 0
+        duration = macro.duration() if macro is not None else 0.0
+        with self._lock, self._conn:
+            row = self._conn.execute("SELECT id FROM macros WHERE name = ?", (name,)).fetchone()
+            if row is None:
+                macro_id = self._conn.execute(
+                    "INSERT INTO macros (name, hotkey, created, modified, op_count, duration, size) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                    (name, hotkey, now, now, op_count, duration, len(source))).lastrowid
+            else:
+                macro_id = row[0]
+                self._conn.execute(
+                    "UPDATE macros SET modified = ?, op_count = ?, duration = ?, size = ?, "
+                    "hotkey = COALESCE(?, hotkey) WHERE id = ?",
+                    (now, op_count, duration, len(source), hotkey, macro_id))
+            self._conn.execute(
+                "INSERT OR REPLACE INTO bodies (macro_id, source, macro, raw) VALUES (?, ?, ?, ?)",
+                (macro_id, source, macro.to_bytes() if macro is not None else None, raw))
+            self._set_tags(macro_id, tags)
+        return macro_id
+
+    def _set_tags(self, macro_id, tags):
+        self._conn.execute("DELETE FROM tags WHERE macro_id = ?", (macro_id,))
+        self._conn.executemany("INSERT OR IGNORE INTO tags (tag, macro_id) VALUES (?, ?)",
+                               [(tag.strip(), macro_id) for tag in tags if tag.strip()])
+
+    def set_tags(self, macro_id, tags):
+        with self._lock, self._conn:
+            self._set_tags(macro_id, tags)
+
+    def set_hotkey(self, macro_id, hotkey):
+        """ Binds `hotkey` to the macro (None to unbind), taking it away from any other macro. """
+        with self._lock, self._conn:
+            if hotkey is not None:
+                self._conn.execute("UPDATE macros SET hotkey = NULL WHERE hotkey = ?", (hotkey,))
+            self._conn.execute("UPDATE macros SET hotkey = ? WHERE id = ?", (hotkey, macro_id))
+
+    def rename(self, macro_id, name):
+        with self._lock, self._conn:
+            self._conn.execute("UPDATE macros SET name = ? WHERE id = ?", (name, macro_id))
+
+    def delete(self, macro_id):
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM macros WHERE id = ?", (macro_id,))
+
+    # --- Listing (metadata only) ---
+    def search(self, name='', tag=None, limit=None):
+        """ Entries whose name starts with `name` (case-insensitive), optionally with `tag`, by name. """
+        sql = ("SELECT m.id, m.name, m.hotkey, m.modified, m.op_count, m.duration, m.size, "
+               "(SELECT group_concat(tag, ',') FROM tags WHERE macro_id = m.id) FROM macros m")
+        args = []
+        where = []
+        if name:
+            where.append("m.name LIKE ? ESCAPE '\\'")
+            args.append(_like_prefix(name))
+        if tag:
+            where.append("m.id IN (SELECT macro_id FROM tags WHERE tag = ?)")
+            args.append(tag)
+        if where:
+            sql += " WHERE " + " AND ".join(where)
+        sql += " ORDER BY m.name"
+        if limit is not None:
+            sql += " LIMIT ?"
+            args.append(limit)
+        with self._lock:
+            rows = self._conn.execute(sql, args).fetchall()
+        return [MacroEntry(*row[:7], tuple(row[7].split(',')) if row[7] else ()) for row in rows]
+
+    def tags(self):
+        """ (tag, macro count) pairs, by tag. """
+        with self._lock:
+            return self._conn.execute("SELECT tag, count(*) FROM tags GROUP BY tag ORDER BY tag").fetchall()
+
+    def bindings(self):
+        """ {hotkey: macro id} for every bound macro. """
+        with self._lock:
+            return dict(self._conn.execute("SELECT hotkey, id FROM macros WHERE hotkey IS NOT NULL"))
+
+    def count(self):
+        with self._lock:
+            return self._conn.execute("SELECT count(*) FROM macros").fetchone()[0]
+
+    # --- Bodies (loaded on demand) ---
+    def _body_column(self, macro_id, column):
+        with self._lock:
+            row = self._conn.execute(f"SELECT {column} FROM bodies WHERE macro_id = ?", (macro_id,)).fetchone()
+        if row is None:
+            raise KeyError(macro_id)
+        return row[0]
+
+    def load_source(self, macro_id):
+        return self._body_column(macro_id, 'source')
+
+    def load_macro(self, macro_id):
+        """ The stored Macro, or None for scripts that aren't straight-line. """
+        data = self._body_column(macro_id, 'macro')
+        return Macro.from_bytes(data) if data is not None else None
+
+    def iter_raw(self, macro_id):
+        """
+        Streams the stored raw recording as event tuples (nothing if there is
+        none). The blob is read through a connection of its own as the events
+        are consumed, so the shared one isn't held meanwhile.
+        """
+        with self._lock:
+            row = self._conn.execute("SELECT raw IS NOT NULL FROM bodies WHERE macro_id = ?",
+                                     (macro_id,)).fetchone()
+        if not row or not row[0]:
+            return iter(())
+        if self.path == ':memory:' or not hasattr(sqlite3.Connection, 'blobopen'):
+            return read_raw(io.BytesIO(self._body_column(macro_id, 'raw')))
+        return _iter_blob(self.path, macro_id)
+
+def _iter_blob(path, macro_id):
+    # Incremental blob I/O (Python 3.11+); in WAL mode the reader keeps its
+    # snapshot even if the macro is saved again while it streams
+    conn = sqlite3.connect(path, check_same_thread=False)
+    try:
+        with conn.blobopen('bodies', 'raw', macro_id, readonly=True) as blob:
+            yield from read_raw(blob)
+    finally:
+        conn.close()
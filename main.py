@@ -1,13 +1,15 @@
-import customtkinter as ctk
-import tkinter as tk
-from tkinter import messagebox
-from PIL import Image, ImageTk
+from startup_trace import StartupTrace, trace_enabled
+startup_trace = StartupTrace()
+
+with startup_trace.stage("import tkinter/customtkinter"):
+    import customtkinter as ctk
+    import tkinter as tk
+    from tkinter import messagebox
 import threading
 import time
 import json
 import os
 import sys
-import re
 
 # Resource helper for PyInstaller
 def resource_path(relative_path):
@@ -26,76 +28,115 @@ def log(msg):
     pass
 
 try:
-    import keyboard
-    import mouse
-    from clicker_core import HighResClicker
+    with startup_trace.stage("import keyboard/mouse"):
+        import keyboard
+        import mouse
+    with startup_trace.stage("import app modules"):
+        from clicker_core import HighResClicker
+        from input_backend import default_backend
+        from macro import Macro
+        from playback import MacroPlayer, PlaybackRuntime
+        from code_cache import CodeCache, default_cache_dir
+        from macro_library import MacroLibrary
+        from recorder import StreamingRecorder
+        from raw_format import new_recording_path
+        from codegen import events_to_macro
+        from highlighter import SyntaxHighlighter
+        from hotkey_dispatch import HotkeyDispatcher, DEFERRED
 except Exception as e:
     messagebox.showerror("Error", f"Dependency missing: {e}")
     sys.exit(1)
 
 # --- Configuration & Assets ---
+# Window icon pre-sized at build time (update_icons.py); icon.png is only a fallback
+WINDOW_ICON = "icon_32.png"
+
 ctk.set_appearance_mode("Dark")
 ctk.set_default_color_theme("blue")
 
-class SyntaxHighlighter:
-    def __init__(self, text_widget):
-        self.text_widget = text_widget
-        self.tags = {
-            "keyword": "#FF7B72", # Red/Pink
-            "string": "#A5D6FF",  # Light Blue
-            "comment": "#8B949E", # Gray
-            "number": "#79C0FF",  # Blue
-            "function": "#D2A8FF" # Purple
-        }
-        self._setup_tags()
-        self.text_widget.bind("<KeyRelease>", self.highlight)
+# Clicker stats are polled at a fixed display rate, independent of CPS
+STATS_POLL_MS = 50
 
-    def _setup_tags(self):
-        for name, color in self.tags.items():
-            self.text_widget.tag_config(name, foreground=color)
+# Playback speed multipliers offered in the recorder toolbar
+PLAYBACK_SPEEDS = ["0.5x", "1x", "2x", "5x", "10x", "20x"]
 
-    def highlight(self, event=None):
-        content = self.text_widget.get("1.0", "end-1c")
-        
-        # Clear existing tags
-        for tag in self.tags.keys():
-            self.text_widget.tag_remove(tag, "1.0", "end")
-
-        # Regex patterns
-        patterns = [
-            ("keyword", r"\b(import|def|if|else|elif|while|for|return|from|as|try|except|finally)\b"),
-            ("function", r"\b(mouse|time|print|click|move|press|release|sleep)\b"),
-            ("string", r"(['\"])(?:(?=(\\?))\2.)*?\1"),
-            ("comment", r"#.*"),
-            ("number", r"\b\d+(\.\d+)?\b")
-        ]
-
-        for tag, pattern in patterns:
-            for match in re.finditer(pattern, content):
-                start = f"1.0 + {match.start()} chars"
-                end = f"1.0 + {match.end()} chars"
-                self.text_widget.tag_add(tag, start, end)
+# At most this many library entries are listed; narrow down with the search box
+LIBRARY_LIST_LIMIT = 500
+
+CLICK_BUTTONS = {"左键": "left", "右键": "right", "中键": "middle"}
+
+# Scripts are loaded into the editor this many lines per event-loop tick
+LOAD_CHUNK_LINES = 2000
+
+def chunk_lines(lines, size=LOAD_CHUNK_LINES):
+    """ Joins an iterable of lines into newline-joined blocks of `size` lines. """
+    chunk = []
+    for line in lines:
+        chunk.append(line)
+        if len(chunk) == size:
+            yield "\n".join(chunk)
+            chunk = []
+    if chunk:
+        yield "\n".join(chunk)
 
 class AutomationApp(ctk.CTk):
     def __init__(self):
-        super().__init__()
+        with startup_trace.stage("create window"):
+            super().__init__()
 
         # Window Setup
         self.title("自动化脚本工具 Pro")
         self.geometry("900x700")
         self.resizable(True, True)
-        
-        # Set Window Icon
+
+        with startup_trace.stage("window icon"):
+            self._set_window_icon()
+
+        with startup_trace.stage("core components"):
+            self._setup_core()
+
+        # Grid Layout (1x2)
+        self.grid_rowconfigure(0, weight=1)
+        self.grid_columnconfigure(1, weight=1)
+
+        # --- Sidebar ---
+        with startup_trace.stage("sidebar"):
+            self._setup_sidebar()
+
+        # --- Main Content Frames ---
+        # Empty containers; each page's widgets are built on its first visit
+        self.frames = {}
+        self._frame_builders = {
+            "clicker": self._setup_clicker_frame,
+            "recorder": self._setup_recorder_frame,
+            "library": self._setup_library_frame,
+            "settings": self._setup_settings_frame,
+        }
+        for name in self._frame_builders:
+            self.frames[name] = ctk.CTkFrame(self, corner_radius=0, fg_color="transparent")
+        self._built_frames = set()
+
+        # Show Home by default
+        with startup_trace.stage("clicker frame"):
+            self.select_frame("clicker")
+
+        # Initial Hotkeys - Delayed to avoid startup freeze
+        self.after(1000, self._refresh_hotkeys)
+        self.after_idle(self._on_first_paint)
+
+    def _set_window_icon(self):
         try:
-            # Use PNG for window icon, but resize it first to prevent display issues
-            icon_path = resource_path("icon.png")
-            img = Image.open(icon_path)
-            # Resize to standard icon size (32x32 is standard for window title bar)
-            img = img.resize((32, 32), Image.Resampling.LANCZOS)
-            
-            self.icon_image = ImageTk.PhotoImage(img)
+            icon_path = resource_path(WINDOW_ICON)
+            if os.path.exists(icon_path):
+                # Already 32x32; Tk reads PNG natively, no PIL needed
+                self.icon_image = tk.PhotoImage(file=icon_path)
+            else:
+                # Dev checkout without built assets: resize the full-size PNG
+                from PIL import Image, ImageTk
+                img = Image.open(resource_path("icon.png")).resize((32, 32), Image.Resampling.LANCZOS)
+                self.icon_image = ImageTk.PhotoImage(img)
             self.iconphoto(False, self.icon_image)
-            
+
             # Try to set taskbar icon separately if ICO exists
             icon_ico_path = resource_path("icon.ico")
             if os.path.exists(icon_ico_path):
@@ -105,41 +146,54 @@ class AutomationApp(ctk.CTk):
         except Exception as e:
             print(f"Warning: Could not load icon: {e}")
 
-        # Core Components
-        self.clicker = HighResClicker()
-        self.clicker.on_stats_update = self.update_clicker_stats
+    def _on_first_paint(self):
+        startup_trace.mark_first_paint()
+        if trace_enabled() or startup_trace.over_budget():
+            print(startup_trace.report())
+
+    def _setup_core(self):
+        self.backend = default_backend()
+        self.clicker = HighResClicker(self.backend)
+        self._stats_polling = False
+        self._playback_polling = False
         
         self.hotkey_clicker = "F8"
         self.hotkey_record = "F9"
         self.hotkey_play = "F10"
+
+        # Hotkeys and the toggle buttons only post commands; engine changes run
+        # on the dispatcher thread, widget updates are handed back via `after`
+        self.dispatcher = HotkeyDispatcher()
+        self.dispatcher.register("clicker", self.toggle_clicker)
+        self.dispatcher.register("record", self.toggle_recording)
+        self.dispatcher.register("play", self.toggle_playback)
+        self.dispatcher.register("library", self._play_library_macro)
+        self.dispatcher.start()
         
         self.is_recording = False
-        self.recorded_events = []
+        self.recorder = None
         self.playback_thread = None
         self.is_playing = False
-
-        # Grid Layout (1x2)
-        self.grid_rowconfigure(0, weight=1)
-        self.grid_columnconfigure(1, weight=1)
-
-        # --- Sidebar ---
-        self._setup_sidebar()
-
-        # --- Main Content Frames ---
-        self.frames = {}
-        self.frames["clicker"] = ctk.CTkFrame(self, corner_radius=0, fg_color="transparent")
-        self.frames["recorder"] = ctk.CTkFrame(self, corner_radius=0, fg_color="transparent")
-        self.frames["settings"] = ctk.CTkFrame(self, corner_radius=0, fg_color="transparent")
-        
-        self._setup_clicker_frame()
-        self._setup_recorder_frame()
-        self._setup_settings_frame()
-
-        # Show Home by default
-        self.select_frame("clicker")
-        
-        # Initial Hotkeys - Delayed to avoid startup freeze
-        self.after(1000, self._refresh_hotkeys)
+        self.macro_player = MacroPlayer(self.backend)
+        self._playback_runtime = PlaybackRuntime()
+        # Parsed macros / compiled code of played scripts, keyed by source hash
+        try:
+            self.code_cache = CodeCache(default_cache_dir())
+        except OSError:
+            self.code_cache = CodeCache()
+        # Stored scripts; only names/tags/hotkeys are read until one is opened
+        try:
+            self.library = MacroLibrary()
+        except Exception as e:
+            print(f"Warning: Could not open macro library: {e}")
+            self.library = None
+        self._library_ids = []
+        # Last generated macro and the source it was exported as
+        self.current_macro = None
+        self.current_macro_source = None
+        # Chunked editor loads; bumping the token abandons a load in progress
+        self._load_token = 0
+        self._loading = False
 
     def _setup_sidebar(self):
         self.sidebar_frame = ctk.CTkFrame(self, width=200, corner_radius=0)
@@ -157,8 +211,11 @@ class AutomationApp(ctk.CTk):
         self.nav_btns["recorder"] = ctk.CTkButton(self.sidebar_frame, text="脚本录制/编辑", command=lambda: self.select_frame("recorder"))
         self.nav_btns["recorder"].grid(row=2, column=0, padx=20, pady=10)
         
+        self.nav_btns["library"] = ctk.CTkButton(self.sidebar_frame, text="脚本库", command=lambda: self.select_frame("library"))
+        self.nav_btns["library"].grid(row=3, column=0, padx=20, pady=10)
+
         self.nav_btns["settings"] = ctk.CTkButton(self.sidebar_frame, text="全局设置", command=lambda: self.select_frame("settings"))
-        self.nav_btns["settings"].grid(row=3, column=0, padx=20, pady=10)
+        self.nav_btns["settings"].grid(row=4, column=0, padx=20, pady=10)
 
         # Appearance Mode
         self.appearance_mode_label = ctk.CTkLabel(self.sidebar_frame, text="主题模式:", anchor="w")
@@ -167,7 +224,13 @@ class AutomationApp(ctk.CTk):
                                                                command=lambda m: ctk.set_appearance_mode(m))
         self.appearance_mode_optionemenu.grid(row=7, column=0, padx=20, pady=(10, 20))
 
+    def _ensure_frame(self, name):
+        if name not in self._built_frames:
+            self._built_frames.add(name)
+            self._frame_builders[name]()
+
     def select_frame(self, name):
+        self._ensure_frame(name)
         # Reset buttons
         for btn_name, btn in self.nav_btns.items():
             btn.configure(fg_color=("gray75", "gray25") if btn_name == name else "transparent")
@@ -178,6 +241,10 @@ class AutomationApp(ctk.CTk):
                 frame.grid(row=0, column=1, sticky="nsew")
             else:
                 frame.grid_forget()
+        if name == "library":
+            self._refresh_library()
+        elif name == "settings":
+            self._refresh_latency()
 
     # --- Clicker Frame ---
     def _setup_clicker_frame(self):
@@ -187,12 +254,12 @@ class AutomationApp(ctk.CTk):
         # Stats Panel
         stats_panel = ctk.CTkFrame(frame, corner_radius=15)
         stats_panel.grid(row=0, column=0, padx=20, pady=(20, 10), sticky="ew")
-        stats_panel.grid_columnconfigure((0,1,2), weight=1)
+        stats_panel.grid_columnconfigure((0,1,2,3), weight=1)
         
         self.clicker_start_btn = ctk.CTkButton(stats_panel, text=f"开始连点 ({self.hotkey_clicker})", 
                                              font=ctk.CTkFont(size=18, weight="bold"),
                                              height=60, corner_radius=10, 
-                                             command=self.toggle_clicker,
+                                             command=self.dispatcher.hotkey("clicker"),
                                              fg_color="#2CC985", hover_color="#229C68")
         self.clicker_start_btn.grid(row=0, column=0, rowspan=2, padx=20, pady=20, sticky="ew")
         
@@ -204,6 +271,10 @@ class AutomationApp(ctk.CTk):
         self.click_time_lbl.grid(row=1, column=2)
         ctk.CTkLabel(stats_panel, text="运行时间").grid(row=0, column=2)
 
+        self.click_rate_lbl = ctk.CTkLabel(stats_panel, text="0", font=ctk.CTkFont(size=24, weight="bold"))
+        self.click_rate_lbl.grid(row=1, column=3)
+        ctk.CTkLabel(stats_panel, text="实时频率 (CPS)").grid(row=0, column=3)
+
         # Config Panel
         config_panel = ctk.CTkScrollableFrame(frame, label_text="连点配置")
         config_panel.grid(row=1, column=0, padx=20, pady=10, sticky="nsew")
@@ -211,18 +282,25 @@ class AutomationApp(ctk.CTk):
         
         # CPS
         ctk.CTkLabel(config_panel, text="点击频率 (CPS):").pack(anchor="w", padx=10)
-        self.cps_slider = ctk.CTkSlider(config_panel, from_=1, to=500, number_of_steps=499, command=lambda v: self.cps_val_lbl.configure(text=str(int(v))))
-        self.cps_slider.set(10)
+        # Settings go straight to the engine, so toggling never has to read widgets
+        self.cps_slider = ctk.CTkSlider(config_panel, from_=1, to=500, number_of_steps=499, command=self._set_cps)
+        self.cps_slider.set(self.clicker.cps)
         self.cps_slider.pack(fill="x", padx=10)
-        self.cps_val_lbl = ctk.CTkLabel(config_panel, text="10")
+        self.cps_val_lbl = ctk.CTkLabel(config_panel, text=str(int(self.clicker.cps)))
         self.cps_val_lbl.pack(anchor="e", padx=10)
         
         # Button
         ctk.CTkLabel(config_panel, text="鼠标按键:").pack(anchor="w", padx=10, pady=(10,0))
-        self.btn_seg = ctk.CTkSegmentedButton(config_panel, values=["左键", "右键", "中键"])
+        self.btn_seg = ctk.CTkSegmentedButton(config_panel, values=list(CLICK_BUTTONS), command=self._set_click_button)
         self.btn_seg.set("左键")
         self.btn_seg.pack(fill="x", padx=10, pady=5)
 
+        # Closed-loop rate control: corrects the schedule until the achieved CPS matches the slider
+        self.rate_switch = ctk.CTkSwitch(config_panel, text="闭环速率控制", command=self._set_rate_control)
+        if self.clicker.rate_control:
+            self.rate_switch.select()
+        self.rate_switch.pack(anchor="w", padx=10, pady=(10, 0))
+
     # --- Recorder Frame ---
     def _setup_recorder_frame(self):
         frame = self.frames["recorder"]
@@ -233,13 +311,28 @@ class AutomationApp(ctk.CTk):
         toolbar = ctk.CTkFrame(frame)
         toolbar.grid(row=0, column=0, sticky="ew", padx=20, pady=10)
         
-        self.rec_btn = ctk.CTkButton(toolbar, text=f"开始录制 ({self.hotkey_record})", command=self.toggle_recording, fg_color="#E04F5F", hover_color="#C23848")
+        self.rec_btn = ctk.CTkButton(toolbar, text=f"开始录制 ({self.hotkey_record})", command=self.dispatcher.hotkey("record"), fg_color="#E04F5F", hover_color="#C23848")
         self.rec_btn.pack(side="left", padx=5, pady=5)
         
-        self.play_btn = ctk.CTkButton(toolbar, text=f"播放脚本 ({self.hotkey_play})", command=self.toggle_playback, fg_color="#3B8ED0", hover_color="#36719F")
+        self.play_btn = ctk.CTkButton(toolbar, text=f"播放脚本 ({self.hotkey_play})", command=self.dispatcher.hotkey("play"), fg_color="#3B8ED0", hover_color="#36719F")
         self.play_btn.pack(side="left", padx=5, pady=5)
         
+        # Playback speed and repeat count (0 = loop until stopped)
+        self.speed_menu = ctk.CTkOptionMenu(toolbar, values=PLAYBACK_SPEEDS, width=70)
+        self.speed_menu.set("1x")
+        self.speed_menu.pack(side="left", padx=5, pady=5)
+        ctk.CTkLabel(toolbar, text="次数").pack(side="left", padx=(5, 0))
+        self.repeat_entry = ctk.CTkEntry(toolbar, width=50)
+        self.repeat_entry.insert(0, "1")
+        self.repeat_entry.pack(side="left", padx=5, pady=5)
+        self.loop_lbl = ctk.CTkLabel(toolbar, text="")
+        self.loop_lbl.pack(side="left", padx=5)
+        
         ctk.CTkButton(toolbar, text="清空", command=self.clear_script, fg_color="gray", width=60).pack(side="right", padx=5)
+
+        # Shown only while a large script is being loaded into the editor
+        self.load_bar = ctk.CTkProgressBar(toolbar, width=120)
+        self.load_bar.set(0)
         
         # Editor
         self.editor_container = ctk.CTkFrame(frame)
@@ -257,6 +350,35 @@ class AutomationApp(ctk.CTk):
         self.highlighter = SyntaxHighlighter(self.editor._textbox)
         self.highlighter.highlight()
 
+    # --- Library Frame ---
+    def _setup_library_frame(self):
+        frame = self.frames["library"]
+        frame.grid_columnconfigure(0, weight=1)
+        frame.grid_rowconfigure(1, weight=1)
+
+        # Search bar: name prefix and tag
+        search = ctk.CTkFrame(frame)
+        search.grid(row=0, column=0, sticky="ew", padx=20, pady=10)
+        self.lib_name_entry = ctk.CTkEntry(search, placeholder_text="名称")
+        self.lib_name_entry.pack(side="left", fill="x", expand=True, padx=5, pady=5)
+        self.lib_tag_entry = ctk.CTkEntry(search, placeholder_text="标签", width=120)
+        self.lib_tag_entry.pack(side="left", padx=5, pady=5)
+        for entry in (self.lib_name_entry, self.lib_tag_entry):
+            entry.bind("<KeyRelease>", lambda e: self._refresh_library())
+
+        # Plain tk.Listbox: cheap to fill with hundreds of rows
+        self.lib_list = tk.Listbox(frame, font=("Consolas", 12), activestyle="none",
+                                   bg="#2B2B2B", fg="#DCE4EE", selectbackground="#1F6AA5", borderwidth=0)
+        self.lib_list.grid(row=1, column=0, sticky="nsew", padx=20)
+        self.lib_list.bind("<Double-Button-1>", lambda e: self._open_library_macro())
+
+        actions = ctk.CTkFrame(frame)
+        actions.grid(row=2, column=0, sticky="ew", padx=20, pady=10)
+        ctk.CTkButton(actions, text="保存当前脚本", command=self._save_to_library).pack(side="left", padx=5, pady=5)
+        ctk.CTkButton(actions, text="打开", command=self._open_library_macro, width=80).pack(side="left", padx=5, pady=5)
+        ctk.CTkButton(actions, text="绑定热键", command=self._bind_library_hotkey, width=80).pack(side="left", padx=5, pady=5)
+        ctk.CTkButton(actions, text="删除", command=self._delete_library_macro, fg_color="gray", width=60).pack(side="right", padx=5, pady=5)
+
     # --- Settings Frame ---
     def _setup_settings_frame(self):
         frame = self.frames["settings"]
@@ -284,6 +406,14 @@ class AutomationApp(ctk.CTk):
             
         ctk.CTkLabel(frame, text="注意: 修改热键后自动生效，请避免热键冲突。", text_color="gray").pack(pady=20)
 
+        # Key press -> action applied, per command
+        ctk.CTkLabel(frame, text="热键响应延迟", font=ctk.CTkFont(size=14, weight="bold")).pack(anchor="w", padx=20)
+        self.latency_lbl = ctk.CTkLabel(frame, text="", justify="left", text_color="gray")
+        self.latency_lbl.pack(anchor="w", padx=20, pady=5)
+
+    def _refresh_latency(self):
+        self.latency_lbl.configure(text=self.dispatcher.format_report() or "暂无数据")
+
     # --- Hotkey Logic ---
     def _on_hotkey_focus(self, key_name, entry_widget):
         entry_widget.delete(0, "end")
@@ -306,52 +436,94 @@ class AutomationApp(ctk.CTk):
              entry_widget.insert(0, old_val)
 
     def _on_key_press(self, event):
+        # Hook thread: only hand the key over to Tk
         if event.event_type == "down":
             key = event.name.upper()
             if key in ["CTRL", "SHIFT", "ALT"]:
                 return
-            
-            self.current_binding_entry.delete(0, "end")
-            self.current_binding_entry.insert(0, key)
-            
-            setattr(self, f"hotkey_{self.current_binding_key}", key)
-            self._refresh_hotkeys()
-            
-            keyboard.unhook(self.hook_id)
-            del self.hook_id
-            self.focus()
+            self.after(0, lambda: self._bind_hotkey(key))
+
+    def _bind_hotkey(self, key):
+        if not hasattr(self, "hook_id"):
+            return # already bound by an earlier key press
+        self.current_binding_entry.delete(0, "end")
+        self.current_binding_entry.insert(0, key)
+
+        setattr(self, f"hotkey_{self.current_binding_key}", key)
+        self._refresh_hotkeys()
+
+        keyboard.unhook(self.hook_id)
+        del self.hook_id
+        self.focus()
 
     def _refresh_hotkeys(self):
         try:
             keyboard.unhook_all()
-            keyboard.add_hotkey(self.hotkey_clicker, self.toggle_clicker)
-            keyboard.add_hotkey(self.hotkey_record, self.toggle_recording)
-            keyboard.add_hotkey(self.hotkey_play, self.toggle_playback)
+            keyboard.add_hotkey(self.hotkey_clicker, self.dispatcher.hotkey("clicker"))
+            keyboard.add_hotkey(self.hotkey_record, self.dispatcher.hotkey("record"))
+            keyboard.add_hotkey(self.hotkey_play, self.dispatcher.hotkey("play"))
+            if self.library is not None:
+                reserved = {self.hotkey_clicker, self.hotkey_record, self.hotkey_play}
+                for hotkey, macro_id in self.library.bindings().items():
+                    if hotkey not in reserved:
+                        keyboard.add_hotkey(hotkey, self.dispatcher.hotkey("library", macro_id))
             
-            self.clicker_start_btn.configure(text=f"开始连点 ({self.hotkey_clicker})")
-            self.rec_btn.configure(text=f"开始录制 ({self.hotkey_record})")
-            self.play_btn.configure(text=f"播放脚本 ({self.hotkey_play})")
+            if "clicker" in self._built_frames:
+                self.clicker_start_btn.configure(text=f"开始连点 ({self.hotkey_clicker})")
+            if "recorder" in self._built_frames:
+                self.rec_btn.configure(text=f"开始录制 ({self.hotkey_record})")
+                self.play_btn.configure(text=f"播放脚本 ({self.hotkey_play})")
         except Exception as e:
             print(f"Hotkey Error: {e}")
 
     # --- Clicker Logic ---
+    def _set_cps(self, value):
+        self.clicker.cps = value
+        self.cps_val_lbl.configure(text=str(int(value)))
+
+    def _set_click_button(self, value):
+        self.clicker.button = CLICK_BUTTONS.get(value, "left")
+
+    def _set_rate_control(self):
+        # Read by the engine when the next run starts
+        self.clicker.rate_control = bool(self.rate_switch.get())
+
     def toggle_clicker(self):
+        # Dispatcher thread: stop() joins the click thread, so it must not run on Tk or the hook
         if self.clicker.running:
             self.clicker.stop()
-            self.clicker_start_btn.configure(fg_color="#2CC985", text=f"开始连点 ({self.hotkey_clicker})")
         else:
-            self.clicker.cps = self.cps_slider.get()
-            btn_map = {"左键": "left", "右键": "right", "中键": "middle"}
-            self.clicker.button = btn_map.get(self.btn_seg.get(), "left")
             self.clicker.start()
+        self.after(0, self._show_clicker_state)
+
+    def _show_clicker_state(self):
+        self._ensure_frame("clicker")
+        if self.clicker.running:
             self.clicker_start_btn.configure(fg_color="#E53935", text=f"停止连点 ({self.hotkey_clicker})")
+            if not self._stats_polling:
+                self._stats_polling = True
+                self._poll_clicker_stats()
+        else:
+            self.clicker_start_btn.configure(fg_color="#2CC985", text=f"开始连点 ({self.hotkey_clicker})")
 
-    def update_clicker_stats(self, count, elapsed):
-        self.after(0, lambda: self.click_count_lbl.configure(text=str(count)))
-        self.after(0, lambda: self.click_time_lbl.configure(text=f"{elapsed:.1f}s"))
+    def _poll_clicker_stats(self):
+        # Runs on the Tk thread; reads the engine's counters without touching its loop
+        stats = self.clicker.snapshot()
+        self.click_count_lbl.configure(text=str(stats.clicks))
+        self.click_time_lbl.configure(text=f"{stats.elapsed:.1f}s")
+        rate = f"{stats.cps:.0f}"
+        state = self.clicker.controller_state()
+        if state is not None and state.achieved_cps:
+            rate += " ✓" if state.within_tolerance else f" ({state.error * -100:+.0f}%)"
+        self.click_rate_lbl.configure(text=rate)
+        if stats.running:
+            self.after(STATS_POLL_MS, self._poll_clicker_stats)
+        else:
+            self._stats_polling = False
 
     # --- Recorder Logic ---
     def toggle_recording(self):
+        # Dispatcher thread
         if self.is_recording:
             self.stop_recording()
         else:
@@ -359,271 +531,306 @@ class AutomationApp(ctk.CTk):
 
     def start_recording(self):
         self.is_recording = True
-        self.recorded_events = []
-        self.rec_btn.configure(text=f"停止录制 ({self.hotkey_record})", fg_color="#E53935")
-        self.editor.delete("1.0", "end")
-        self.editor.insert("1.0", "# 正在录制...\n")
+        if self.recorder is not None:
+            self.recorder.close()
+        # Raw events are kept on disk, so scripts can be regenerated with other filter settings
+        try:
+            raw_path = new_recording_path()
+        except OSError as e:
+            print(f"Warning: Could not keep raw recording: {e}")
+            raw_path = None
+        # The app's own hotkeys (e.g. the one stopping this recording) are not recorded
+        self.recorder = StreamingRecorder(raw_path=raw_path, ignore_keys=(
+            self.hotkey_clicker, self.hotkey_record, self.hotkey_play))
+        self.after(0, self._show_recording_started)
         
         # Capture initial position manually because hook might miss it before first move
         try:
             init_pos = mouse.get_position()
-            self.recorded_events.append(mouse.MoveEvent(init_pos[0], init_pos[1], time.time()))
         except:
-            pass
+            init_pos = None
             
-        mouse.hook(self.recorded_events.append)
+        # The hooks only hand events to preallocated per-device buffers; spilling,
+        # merging and move filtering happen on the recorder's writer thread
+        self.recorder.start(init_pos)
         self.start_time = time.time()
 
+    def _show_recording_started(self):
+        self._ensure_frame("recorder")
+        self.rec_btn.configure(text=f"停止录制 ({self.hotkey_record})", fg_color="#E53935")
+        self._cancel_load()
+        self.editor.delete("1.0", "end")
+        self.editor.insert("1.0", "# 正在录制...\n")
+        self.highlighter.highlight()
+
+    def _show_recording_processing(self):
+        self._ensure_frame("recorder")
+        self.rec_btn.configure(text="正在处理...", fg_color="gray", state="disabled")
+
     def stop_recording(self):
         self.is_recording = False
-        mouse.unhook(self.recorded_events.append)
-        self.rec_btn.configure(text="正在处理...", fg_color="gray", state="disabled")
+        self.after(0, self._show_recording_processing)
         
         # Run processing in a background thread to prevent UI freeze
         threading.Thread(target=self._process_recording_async, daemon=True).start()
 
     def _process_recording_async(self):
         try:
-            # 1. Optimize Event Stream (Sparse Sampling)
-            # Filter out 90% of redundant move events to speed up processing
-            optimized_events = self._optimize_event_stream(self.recorded_events)
+            # 1. Drain the recorder; its streaming stage already dropped redundant moves
+            self.recorder.stop()
             
-            # 2. Generate Code
-            code = self._events_to_code(optimized_events)
+            # 2. Build the macro timeline (single pass over the spilled events) and its Python export,
+            #    already split into the chunks the editor will be loaded with
+            macro = events_to_macro(self.recorder.iter_filtered())
+            chunks = list(chunk_lines(macro.iter_lines())) if macro is not None else []
+            code = "\n".join(chunks)
             
             # 3. Update UI on Main Thread
-            self.after(0, lambda: self._finish_processing(code))
+            self.after(0, lambda: self._finish_processing(code, macro, chunks))
         except Exception as e:
             print(f"Processing Error: {e}")
             self.after(0, lambda: self._finish_processing(f"# Error processing recording: {e}"))
 
-    def _finish_processing(self, code):
-        self.editor.delete("1.0", "end")
-        self.editor.insert("1.0", code)
-        self.highlighter.highlight()
+    def _finish_processing(self, code, macro=None, chunks=None):
+        self._ensure_frame("recorder")
+        self.current_macro = macro
+        self.current_macro_source = code if macro is not None else None
         self.rec_btn.configure(text=f"开始录制 ({self.hotkey_record})", fg_color="#E04F5F", state="normal")
-
-    def _optimize_event_stream(self, events):
-        if not events: return []
-        filtered = []
-        last_pos = (-100, -100)
-        
-        n = len(events)
-        for i, e in enumerate(events):
-            if isinstance(e, mouse.ButtonEvent):
-                filtered.append(e)
-            elif isinstance(e, mouse.MoveEvent):
-                # Always keep the first move
-                if not filtered:
-                    filtered.append(e)
-                    last_pos = (e.x, e.y)
-                    continue
-                
-                # Always keep move if the NEXT event is a ButtonEvent (Precision)
-                if i + 1 < n and isinstance(events[i+1], mouse.ButtonEvent):
-                    filtered.append(e)
-                    last_pos = (e.x, e.y)
-                    continue
-
-                # Otherwise, only keep if distance > 5 pixels (Sparse Sampling)
-                if abs(e.x - last_pos[0]) > 5 or abs(e.y - last_pos[1]) > 5:
-                    filtered.append(e)
-                    last_pos = (e.x, e.y)
-        return filtered
-
-    def _events_to_code(self, events):
-        if not events:
-            return ""
-            
-        lines = ["import mouse", "import time", "import ctypes", "", 
-                 "# Enable high precision timer",
-                 "ctypes.windll.winmm.timeBeginPeriod(1)", 
-                 "# Enable High DPI Awareness",
-                 "try:",
-                 "    ctypes.windll.shcore.SetProcessDpiAwareness(1)",
-                 "except:",
-                 "    pass",
-                 "",
-                 "def run_script():"]
-        
-        # --- PASS 1: Normalize Events & Detect Clicks ---
-        # Convert raw events into a stream of:
-        # {'type': 'move', 'x': x, 'y': y, 'time': t}
-        # {'type': 'click', 'button': b, 'x': x, 'y': y, 'time': t, 'duration': d}
-        # {'type': 'press', ...}
-        # {'type': 'release', ...}
-        
-        normalized = []
-        i = 0
-        n = len(events)
-        
-        # Track current state
-        cur_x, cur_y = 0, 0
-        
-        while i < n:
-            e = events[i]
-            if isinstance(e, mouse.MoveEvent):
-                cur_x, cur_y = e.x, e.y
-                normalized.append({'type': 'move', 'x': e.x, 'y': e.y, 'time': e.time})
-                i += 1
-            elif isinstance(e, mouse.ButtonEvent):
-                if e.event_type == 'down':
-                    # Look ahead for Up
-                    found_up = False
-                    j = i + 1
-                    while j < n:
-                        next_e = events[j]
-                        if isinstance(next_e, mouse.MoveEvent):
-                            # Ignore small moves
-                            if abs(next_e.x - cur_x) > 5 or abs(next_e.y - cur_y) > 5:
-                                break
-                            j += 1
-                            continue
-                        if isinstance(next_e, mouse.ButtonEvent) and next_e.event_type == 'up' and next_e.button == e.button:
-                            # It's a click
-                            normalized.append({
-                                'type': 'click', 
-                                'button': e.button, 
-                                'x': cur_x, 
-                                'y': cur_y, 
-                                'time': next_e.time, # Use end time
-                                'start_time': e.time
-                            })
-                            i = j + 1
-                            found_up = True
-                            break
-                        break
-                    
-                    if not found_up:
-                        normalized.append({'type': 'press', 'button': e.button, 'x': cur_x, 'y': cur_y, 'time': e.time})
-                        i += 1
-                else:
-                    normalized.append({'type': 'release', 'button': e.button, 'x': cur_x, 'y': cur_y, 'time': e.time})
-                    i += 1
-        
-        # --- PASS 2: Detect Double Clicks ---
-        final_ops = []
-        i = 0
-        n = len(normalized)
-        
-        while i < n:
-            op = normalized[i]
-            
-            if op['type'] == 'click':
-                # Check next op for double click
-                is_double = False
-                j = i + 1
-                while j < n:
-                    next_op = normalized[j]
-                    if next_op['type'] == 'move':
-                        # Allow tiny moves between clicks
-                        if abs(next_op['x'] - op['x']) > 5 or abs(next_op['y'] - op['y']) > 5:
-                            break
-                        j += 1
-                        continue
-                    
-                    if next_op['type'] == 'click' and next_op['button'] == op['button']:
-                        # Check time gap
-                        gap = next_op['start_time'] - op['time']
-                        if gap < 0.8: # Generous 0.8s gap
-                            final_ops.append({
-                                'type': 'double_click',
-                                'button': op['button'],
-                                'x': op['x'],
-                                'y': op['y'],
-                                'time': next_op['time']
-                            })
-                            i = j + 1 # Skip both clicks
-                            is_double = True
-                        break
-                    break
-                
-                if not is_double:
-                    final_ops.append(op)
-                    i += 1
-            else:
-                final_ops.append(op)
-                i += 1
-                
-        # --- PASS 3: Generate Code ---
-        last_time = events[0].time if events else time.time()
-        
-        # We need to track the "current" cursor position in the script to avoid redundant moves
-        script_x, script_y = -1, -1
-        
-        for op in final_ops:
-            # Time delay
-            # For double clicks, we use the time of the *second* click, but we want to wait relative to previous op
-            # If it's a double click, 'time' is the end of 2nd click.
-            # We should probably use the start of the sequence.
-            # Simplified: just use op['time'] or op['start_time'] if available.
-            
-            # Use 'start_time' for clicks if available to get pre-click delay, else 'time'
-            target_time = op.get('start_time', op['time']) if op['type'] in ['click', 'double_click'] else op['time']
-            
-            dt = target_time - last_time
-            if dt > 0.002:
-                lines.append(f"    time.sleep({dt:.4f})")
-            
-            # Move
-            if 'x' in op:
-                if (op['x'], op['y']) != (script_x, script_y):
-                     lines.append(f"    mouse.move({op['x']}, {op['y']})")
-                     script_x, script_y = op['x'], op['y']
-            
-            # Action
-            if op['type'] == 'move':
-                pass # Already handled by move logic above
-            elif op['type'] == 'click':
-                lines.append(f"    mouse.click(button='{op['button']}')")
-            elif op['type'] == 'double_click':
-                lines.append(f"    mouse.double_click(button='{op['button']}')")
-            elif op['type'] == 'press':
-                lines.append(f"    mouse.press(button='{op['button']}')")
-            elif op['type'] == 'release':
-                lines.append(f"    mouse.release(button='{op['button']}')")
-                
-            last_time = op['time'] # Update to end time of operation
-
-        lines.append("")
-        lines.append("    ctypes.windll.winmm.timeEndPeriod(1)")
-        lines.append("")
-        lines.append("if __name__ == '__main__':")
-        lines.append("    run_script()")
-        return "\n".join(lines)
+        self._load_script(chunks if chunks is not None else [code])
+
+    # --- Editor Loading ---
+    def _load_script(self, chunks):
+        """ Replaces the editor text one chunk per event-loop tick, so hotkeys and buttons stay live. """
+        self._cancel_load()
+        self._load_token += 1
+        self._loading = True
+        # No undo history for the load itself; the box is read-only until it is done
+        self.editor._textbox.configure(undo=False)
+        self.editor.delete("1.0", "end")
+        self.editor.configure(state="disabled")
+        self.load_bar.set(0)
+        self.load_bar.pack(side="right", padx=5)
+        self._load_next(self._load_token, chunks, 0)
+
+    def _load_next(self, token, chunks, i):
+        if token != self._load_token:
+            return
+        if i == len(chunks):
+            self._end_load()
+            self.highlighter.highlight()
+            return
+        self.editor.configure(state="normal")
+        self.editor.insert("end-1c", chunks[i] if i == 0 else "\n" + chunks[i])
+        self.editor.configure(state="disabled")
+        self.load_bar.set((i + 1) / len(chunks))
+        self.after(1, lambda: self._load_next(token, chunks, i + 1))
+
+    def _end_load(self):
+        self._loading = False
+        self.editor.configure(state="normal")
+        self.editor._textbox.configure(undo=True)
+        self.editor._textbox.edit_reset()
+        self.load_bar.pack_forget()
+
+    def _cancel_load(self):
+        if self._loading:
+            self._load_token += 1
+            self._end_load()
 
     # --- Playback Logic ---
     def toggle_playback(self):
+        # Dispatcher thread
         if self.is_playing:
-            self.is_playing = False 
+            self.is_playing = False
+            # Wakes the playback thread out of any wait; it halts at its next checkpoint
+            self._playback_runtime.stop()
+        else:
+            # The script comes from the editor, so starting happens on the Tk thread;
+            # the hotkey's latency is recorded once playback has really started
+            posted = self.dispatcher.posted
+            self.after(0, lambda: self._play_editor_script(("play", posted)))
+            return DEFERRED
+
+    def _play_editor_script(self, hotkey=None):
+        self._ensure_frame("recorder")
+        if self._loading and self.current_macro is not None:
+            # The editor is still filling up with the recording's export
+            code = self.current_macro_source
         else:
             code = self.editor.get("1.0", "end")
-            threading.Thread(target=self._run_script, args=(code,), daemon=True).start()
+        self._start_playback(code, hotkey)
 
-    def _run_script(self, code):
+    def _start_playback(self, code, hotkey=None):
+        # `hotkey`: (command, post time) of the hotkey that asked for this start
+        self._ensure_frame("recorder")
+        if self.is_playing:
+            return # a second start queued before the first one ran
+        self.macro_player.speed = float(self.speed_menu.get().rstrip("x"))
+        try:
+            self.macro_player.repeat = max(0, int(self.repeat_entry.get()))
+        except ValueError:
+            self.macro_player.repeat = 1
+        self._playback_runtime = PlaybackRuntime()
         self.is_playing = True
-        self.play_btn.configure(text=f"停止播放 ({self.hotkey_play})", fg_color="#E53935")
+        self.loop_lbl.configure(text="")
+        if not self._playback_polling:
+            self._playback_polling = True
+            self.after(STATS_POLL_MS, self._poll_playback_stats)
+        threading.Thread(target=self._run_script, args=(code, self._playback_runtime), daemon=True).start()
+        if hotkey is not None:
+            self.dispatcher.record(*hotkey)
+
+    def _poll_playback_stats(self):
+        # Iteration counter / rate of repeat playback, read without touching the playback loop
+        stats = self.macro_player.snapshot()
+        if stats.iterations:
+            self.loop_lbl.configure(text=f"{stats.iterations} 轮 · {stats.per_minute:.1f} 轮/分")
+        if self.is_playing or stats.running:
+            self.after(STATS_POLL_MS * 10, self._poll_playback_stats)
+        else:
+            self._playback_polling = False
+
+    def _prepare(self, code):
+        # Library macros arrive prepared; an unedited recording -> its macro;
+        # anything else is parsed or compiled once and cached
+        if isinstance(code, Macro):
+            return code
+        if self.current_macro is not None and code.rstrip() == self.current_macro_source.rstrip():
+            return self.current_macro
+        return self.code_cache.get(code)
+
+    def _run_script(self, code, runtime):
+        self.is_playing = True
+        self.after(0, lambda: self.play_btn.configure(text=f"停止播放 ({self.hotkey_play})", fg_color="#E53935"))
         
         try:
-            # Pass __name__='__main__' so the script executes its main block
-            exec(code, {'mouse': mouse, 'time': time, '__name__': '__main__'})
+            prepared = self._prepare(code)
+            if isinstance(prepared, Macro):
+                self.macro_player.play(prepared, runtime)
+            else:
+                # Runs with __name__='__main__' and the script's `mouse`/`time` routed
+                # through the runtime, so sleeps and loops are interruptible too
+                self.macro_player.run_script(prepared, runtime)
+            if runtime.stopped:
+                log(f"Playback stopped: {runtime.report()}")
         except Exception as e:
             print(f"Script Error: {e}")
-            messagebox.showerror("运行错误", f"脚本执行出错:\n{e}")
+            error = str(e)
+            self.after(0, lambda: messagebox.showerror("运行错误", f"脚本执行出错:\n{error}"))
         finally:
             self.is_playing = False
             self.after(0, lambda: self.play_btn.configure(text=f"播放脚本 ({self.hotkey_play})", fg_color="#3B8ED0"))
             
+    # --- Library Logic ---
+    def _selected_library_id(self):
+        selection = self.lib_list.curselection()
+        if not selection:
+            return None
+        return self._library_ids[selection[0]]
+
+    def _refresh_library(self):
+        if self.library is None:
+            return
+        entries = self.library.search(self.lib_name_entry.get().strip(), self.lib_tag_entry.get().strip() or None,
+                                      limit=LIBRARY_LIST_LIMIT)
+        self._library_ids = [entry.id for entry in entries]
+        self.lib_list.delete(0, "end")
+        for entry in entries:
+            hotkey = f" [{entry.hotkey}]" if entry.hotkey else ""
+            tags = f"  #{' #'.join(entry.tags)}" if entry.tags else ""
+            self.lib_list.insert("end", f"{entry.name}{hotkey}  ({entry.op_count} 步, {entry.duration:.1f}s){tags}")
+
+    def _save_to_library(self):
+        if self.library is None:
+            return
+        name = ctk.CTkInputDialog(text="脚本名称:", title="保存到脚本库").get_input()
+        if not name or not name.strip():
+            return
+        tags = ctk.CTkInputDialog(text="标签 (逗号分隔, 可留空):", title="保存到脚本库").get_input() or ""
+        # The editor lives on the recorder page, which may not have been opened yet
+        self._ensure_frame("recorder")
+        code = self.editor.get("1.0", "end-1c")
+        macro = raw = None
+        if self.current_macro is not None and code.rstrip() == self.current_macro_source.rstrip():
+            # Unedited recording: keep its timeline and the raw events it came from
+            macro = self.current_macro
+            if self.recorder is not None and not self.is_recording:
+                raw = self.recorder.raw_bytes()
+        else:
+            prepared = self.code_cache.get(code) if code.strip() else None
+            if isinstance(prepared, Macro):
+                macro = prepared
+        try:
+            self.library.save(name.strip(), code, macro, raw, tags.replace("，", ",").split(","))
+        except Exception as e:
+            messagebox.showerror("保存失败", str(e))
+        self._refresh_library()
+
+    def _open_library_macro(self):
+        macro_id = self._selected_library_id()
+        if macro_id is None:
+            return
+        # Bodies are only read now, on open
+        source = self.library.load_source(macro_id)
+        macro = self.library.load_macro(macro_id)
+        self.select_frame("recorder")
+        self._finish_processing(source, macro, list(chunk_lines(source.split("\n"))))
+
+    def _bind_library_hotkey(self):
+        macro_id = self._selected_library_id()
+        if macro_id is None:
+            return
+        hotkey = ctk.CTkInputDialog(text="热键 (例如 F6, 留空解除绑定):", title="绑定热键").get_input()
+        if hotkey is None:
+            return
+        hotkey = hotkey.strip().upper() or None
+        if hotkey in (self.hotkey_clicker, self.hotkey_record, self.hotkey_play):
+            messagebox.showerror("热键冲突", f"{hotkey} 已被全局热键占用")
+            return
+        self.library.set_hotkey(macro_id, hotkey)
+        self._refresh_hotkeys()
+        self._refresh_library()
+
+    def _delete_library_macro(self):
+        macro_id = self._selected_library_id()
+        if macro_id is None:
+            return
+        if messagebox.askyesno("删除", "确定删除所选脚本?"):
+            self.library.delete(macro_id)
+            self._refresh_hotkeys()
+            self._refresh_library()
+
+    def _play_library_macro(self, macro_id):
+        # Dispatcher thread. Bound hotkey: play (or stop) the stored script without touching the editor
+        if self.is_playing:
+            self.toggle_playback()
+            return
+        macro = self.library.load_macro(macro_id)
+        playable = macro if macro is not None else self.library.load_source(macro_id)
+        posted = self.dispatcher.posted
+        self.after(0, lambda: self._start_playback(playable, ("library", posted)))
+        return DEFERRED
+
     def clear_script(self):
+        self._cancel_load()
         self.editor.delete("1.0", "end")
+        self.highlighter.highlight()
 
 if __name__ == "__main__":
     try:
         app = AutomationApp()
         
         def on_closing():
+            app.dispatcher.stop()
+            report = app.dispatcher.format_report()
+            if report:
+                print(f"Hotkey latency:\n{report}")
             if app.clicker.running:
                 app.clicker.stop()
+            if app.recorder is not None:
+                app.recorder.close()
+            if app.library is not None:
+                app.library.close()
             app.destroy()
             keyboard.unhook_all()
             mouse.unhook_all()
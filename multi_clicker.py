@@ -0,0 +1,247 @@
+import time
+import heapq
+import random
+import threading
+
+from input_backend import default_backend, begin_timer_period, end_timer_period
+from timing import Pacer
+from timing_stats import IntervalHistogram, RateWindow
+
+class ClickStream:
+    """ One independent click stream served by MultiStreamClicker. """
+    def __init__(self, button='left', cps=10.0, position=None, random_range=0.0,
+                 limit_mode='none', limit_value=0, name=None):
+        # Settings (same meaning as on HighResClicker)
+        self.name = name
+        self.button = button
+        self.cps = cps
+        self.position = position # (x, y) to click at, None = wherever the cursor is
+        self.random_range = random_range
+        self.limit_mode = limit_mode
+        self.limit_value = limit_value
+
+        # State / Stats
+        self.active = False
+        self.finished = threading.Event()
+        self.total_clicks = 0
+        self.start_time = 0.0
+        self.interval_hist = IntervalHistogram()
+        self.jitter_hist = IntervalHistogram()
+        self.rate_window = RateWindow(window=1.0)
+        self._last_click = None
+        self._scheduled = 0.0
+        self._generation = 0 # bumped on add/remove; stale heap entries are dropped
+
+    def _reset(self, now):
+        self._generation += 1
+        self.active = True
+        self.finished.clear()
+        self.total_clicks = 0
+        self.start_time = now
+        self.interval_hist.reset()
+        self.jitter_hist.reset()
+        self.rate_window.reset()
+        self._last_click = None
+        self._scheduled = 0.0
+
+    def _next_delay(self):
+        delay = 1.0 / self.cps
+        if self.random_range > 0:
+            delay += random.uniform(-self.random_range / 1000.0, self.random_range / 1000.0)
+        return max(delay, 0.001) # Hard floor for stability, as in HighResClicker
+
+    def _limit_reached(self, now):
+        if self.limit_mode == 'count':
+            return self.total_clicks >= self.limit_value
+        if self.limit_mode == 'time':
+            return now - self.start_time >= self.limit_value
+        return False
+
+    def _due_past_limit(self, deadline):
+        # A click due at or after the time limit never goes out, as on HighResClicker;
+        # the microsecond absorbs rounding in the accumulated deadlines
+        return self.limit_mode == 'time' and deadline - self.start_time >= self.limit_value - 1e-6
+
+    def interval_stats(self):
+        jitter = self.jitter_hist
+        return {
+            'clicks': self.total_clicks,
+            'interval_p50_us': self.interval_hist.percentile(50) * 1e6,
+            'jitter_p50_us': jitter.percentile(50) * 1e6,
+            'jitter_p99_us': jitter.percentile(99) * 1e6,
+            'jitter_max_us': jitter.max * 1e6,
+            'window_cps': self.rate_window.rate(),
+        }
+
+class MultiStreamClicker:
+    """
+    Serves many ClickStreams from one thread. Pending clicks sit in a heap
+    ordered by deadline; everything due within `coalesce_window` of the head
+    goes out as one backend.send_batch() call. The timer resolution is raised
+    once for the whole scheduler, not per stream.
+    """
+    IDLE_WAIT = 0.05 # longest blind wait, so new streams are picked up promptly
+
+    def __init__(self, backend=None, timing_mode='hybrid', cpu_budget=0.05,
+                 spin_window=0.002, coalesce_window=0.0005, max_lag=0.1):
+        self.backend = backend if backend is not None else default_backend()
+        self.timing_mode = timing_mode
+        self.cpu_budget = cpu_budget
+        self.spin_window = spin_window
+        self.coalesce_window = coalesce_window
+        self.max_lag = max_lag
+
+        self.running = False
+        self.thread = None
+        self.pacer = None
+        self._stop_event = threading.Event()
+        self._wake = threading.Event()
+        self._lock = threading.Lock()
+        self._heap = []
+        self._seq = 0 # tie-breaker so streams never get compared
+        self.streams = []
+
+        # Stats
+        self.batches = 0
+        self.batched_clicks = 0
+        self.timer_resolution_set = False
+
+    def _push(self, deadline, stream):
+        self._seq += 1
+        heapq.heappush(self._heap, (deadline, self._seq, stream._generation, stream))
+
+    def add_stream(self, stream):
+        now = time.perf_counter()
+        with self._lock:
+            stream._reset(now)
+            self.streams.append(stream)
+            # Limits are checked before every click, the first one included
+            if stream._limit_reached(now):
+                stream.active = False
+                stream.finished.set()
+                return stream
+            self._push(now, stream)
+        self._wake.set()
+        return stream
+
+    def remove_stream(self, stream):
+        # Lazily dropped from the heap when its next deadline comes up; the
+        # generation bump keeps that entry dead even if the stream is re-added
+        with self._lock:
+            stream.active = False
+            stream._generation += 1
+            if stream in self.streams:
+                self.streams.remove(stream)
+        stream.finished.set()
+
+    def start(self):
+        if self.running:
+            return
+        self.running = True
+        self._stop_event.clear()
+        self.batches = 0
+        self.batched_clicks = 0
+        if not self.timer_resolution_set:
+            self.timer_resolution_set = begin_timer_period(1)
+        self.thread = threading.Thread(target=self._loop, daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        if not self.running:
+            return
+        self.running = False
+        self._stop_event.set()
+        self._wake.set()
+        self.thread.join()
+        if self.timer_resolution_set:
+            end_timer_period(1)
+            self.timer_resolution_set = False
+
+    def report(self):
+        return {
+            'streams': len(self.streams),
+            'threads': 1 if self.running else 0,
+            'batches': self.batches,
+            'clicks_per_batch': self.batched_clicks / self.batches if self.batches else 0.0,
+            'timing': self.pacer.report() if self.pacer else None,
+        }
+
+    def _loop(self):
+        perf_counter = time.perf_counter
+        pacer = Pacer(self.timing_mode, self.cpu_budget, self.spin_window, self._stop_event)
+        self.pacer = pacer
+        send_batch = self.backend.send_batch
+        heap = self._heap
+        lock = self._lock
+
+        while self.running:
+            with lock:
+                head = heap[0][0] if heap else None
+            if head is None:
+                self._wake.wait(self.IDLE_WAIT)
+                self._wake.clear()
+                continue
+
+            now = perf_counter()
+            if head - now > self.IDLE_WAIT:
+                # Far away: block interruptibly so add_stream/stop wake us
+                self._wake.wait(head - now - self.spin_window)
+                self._wake.clear()
+                continue
+
+            pacer.wait_until(head)
+            if self._stop_event.is_set():
+                break
+
+            # Collect everything due within the coalescing window
+            due = []
+            with lock:
+                cutoff = head + self.coalesce_window
+                while heap and heap[0][0] <= cutoff:
+                    deadline, _, generation, stream = heapq.heappop(heap)
+                    if stream.active and generation == stream._generation:
+                        due.append((deadline, generation, stream))
+            if not due:
+                continue
+
+            ops = []
+            for _, _, stream in due:
+                if stream.position is None:
+                    ops.append((stream.button, None, None))
+                else:
+                    ops.append((stream.button, stream.position[0], stream.position[1]))
+            t0 = perf_counter()
+            send_batch(ops)
+            self.batches += 1
+            self.batched_clicks += len(ops)
+
+            # Per-stream stats and rescheduling
+            with lock:
+                for deadline, generation, stream in due:
+                    if generation != stream._generation:
+                        continue # removed (and maybe re-added) during the send
+                    stream.total_clicks += 1
+                    if stream._last_click is not None:
+                        actual = t0 - stream._last_click
+                        stream.interval_hist.record(actual)
+                        stream.jitter_hist.record(abs(actual - stream._scheduled))
+                    stream._last_click = t0
+                    stream.rate_window.record(t0, stream.total_clicks)
+
+                    if stream._limit_reached(t0):
+                        stream.active = False
+                        stream.finished.set()
+                        continue
+                    delay = stream._next_delay()
+                    stream._scheduled = delay
+                    next_deadline = deadline + delay
+                    if t0 - next_deadline > self.max_lag:
+                        next_deadline = t0
+                    if stream._due_past_limit(next_deadline):
+                        stream.active = False
+                        stream.finished.set()
+                        continue
+                    self._push(next_deadline, stream)
+
+        pacer.finish()
+        self.running = False
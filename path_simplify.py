@@ -0,0 +1,147 @@
+import math
+from array import array
+
+from events import EVENT_MOVE, KEY_EVENTS
+
+# --- Error-bounded path simplification ---
+# Ramer-Douglas-Peucker over runs of consecutive moves, with a time-aware
+# error: a dropped point must lie within `tolerance` pixels of the kept
+# segment AND be reached within `time_tolerance` seconds of when uniform
+# motion along that segment would reach it. The latter keeps pauses and
+# speed changes inside a drag. Runs end at every button event, so the move
+# right before one is always an endpoint and always kept. Key events don't
+# end a run: typing during a drag is held and put back in time order.
+
+def simplify_run(xs, ys, ts, tolerance=3.0, time_tolerance=0.05):
+    """ Indices of the points to keep, in order. Endpoints are always kept. """
+    n = len(xs)
+    if n <= 2:
+        return list(range(n))
+    keep = bytearray(n)
+    keep[0] = keep[n - 1] = 1
+    inv_px = 1.0 / tolerance if tolerance > 0 else math.inf
+    inv_t = 1.0 / time_tolerance if time_tolerance > 0 else math.inf
+    hypot = math.hypot
+    stack = [(0, n - 1)]
+    while stack:
+        a, b = stack.pop()
+        if b - a < 2:
+            continue
+        ax, ay, at = xs[a], ys[a], ts[a]
+        dx, dy, dt = xs[b] - ax, ys[b] - ay, ts[b] - at
+        seg2 = dx * dx + dy * dy
+        px, py, pt = xs[a + 1:b], ys[a + 1:b], ts[a + 1:b]
+        if seg2 == 0:
+            # Endpoints coincide: plain distance, timing judged against a linear clock
+            errors = [max(hypot(x - ax, y - ay) * inv_px,
+                          abs(t - at - dt * (k + 1) / (b - a)) * inv_t if dt > 0 else 0.0)
+                      for k, (x, y, t) in enumerate(zip(px, py, pt))]
+        else:
+            us = [min(1.0, max(0.0, ((x - ax) * dx + (y - ay) * dy) / seg2)) for x, y in zip(px, py)]
+            errors = [max(hypot(ax + u * dx - x, ay + u * dy - y) * inv_px,
+                          abs(t - at - u * dt) * inv_t)
+                      for u, x, y, t in zip(us, px, py, pt)]
+        worst = max(errors)
+        if worst > 1.0:
+            split = a + 1 + errors.index(worst)
+            keep[split] = 1
+            stack.append((a, split))
+            stack.append((split, b))
+    return [i for i in range(n) if keep[i]]
+
+class PathSimplifier:
+    """
+    Streaming stage (feed/flush, like recorder.MoveFilter). Consecutive moves
+    are buffered in coordinate arrays and simplified when the run ends; runs
+    longer than `max_run` are cut so memory stays bounded.
+    """
+    def __init__(self, tolerance=3.0, time_tolerance=0.05, max_run=65536):
+        self.tolerance = tolerance
+        self.time_tolerance = time_tolerance
+        self.max_run = max_run
+        self._reset_run()
+
+    def _reset_run(self):
+        self.run = []
+        self.keys = [] # (run length when fed, event) for key events inside the run
+        self.xs = array('d')
+        self.ys = array('d')
+        self.ts = array('d')
+
+    def _add(self, ev):
+        self.run.append(ev)
+        self.xs.append(ev[2])
+        self.ys.append(ev[3])
+        self.ts.append(ev[4])
+
+    def _emit_run(self, out, keep_last):
+        run = self.run
+        keys = self.keys
+        if not run:
+            return
+        kept = simplify_run(self.xs, self.ys, self.ts, self.tolerance, self.time_tolerance)
+        last = run[-1]
+        if keep_last:
+            # The run's end point starts the next run instead of being emitted twice
+            kept.pop()
+        k = 0
+        for i in kept:
+            # Keys fed before run[i] go out before it
+            while k < len(keys) and keys[k][0] <= i:
+                out.append(keys[k][1])
+                k += 1
+            out.append(run[i])
+        if keep_last:
+            # Keys before the carried end point go out now, later ones stay with it
+            while k < len(keys) and keys[k][0] < len(run):
+                out.append(keys[k][1])
+                k += 1
+            carried = [(1, ev) for _, ev in keys[k:]]
+        else:
+            out.extend(ev for _, ev in keys[k:])
+        self._reset_run()
+        if keep_last:
+            self._add(last)
+            self.keys = carried
+
+    def feed(self, ev, out):
+        kind = ev[0]
+        if kind == EVENT_MOVE:
+            self._add(ev)
+            if len(self.run) >= self.max_run:
+                self._emit_run(out, keep_last=True)
+        elif kind in KEY_EVENTS:
+            if self.run:
+                self.keys.append((len(self.run), ev))
+            else:
+                out.append(ev)
+        else:
+            self._emit_run(out, keep_last=False)
+            out.append(ev)
+
+    def flush(self, out):
+        self._emit_run(out, keep_last=False)
+
+def max_deviation(original, simplified):
+    """
+    Largest distance (px) between a move in `original` and the kept segment
+    spanning it in `simplified`. Both are event tuple sequences; used to check
+    the guarantee.
+    """
+    kept = [ev for ev in simplified if ev[0] == EVENT_MOVE]
+    worst = 0.0
+    j = 0
+    for ev in original:
+        if ev[0] != EVENT_MOVE:
+            continue
+        while j + 1 < len(kept) and kept[j + 1][4] < ev[4]:
+            j += 1
+        if j + 1 >= len(kept):
+            a = b = kept[j]
+        else:
+            a, b = kept[j], kept[j + 1]
+        dx, dy = b[2] - a[2], b[3] - a[3]
+        seg2 = dx * dx + dy * dy
+        u = 0.0 if seg2 == 0 else min(1.0, max(0.0, ((ev[2] - a[2]) * dx + (ev[3] - a[3]) * dy) / seg2))
+        worst = max(worst, math.hypot(a[2] + u * dx - ev[2], a[3] + u * dy - ev[3]))
+    return worst
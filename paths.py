@@ -0,0 +1,6 @@
+import os
+
+def app_data_dir(*parts):
+    """ Per-user data directory (%LOCALAPPDATA%/AutoScriptPro, or ~/.cache/AutoScriptPro). """
+    base = os.environ.get('LOCALAPPDATA') or os.path.join(os.path.expanduser('~'), '.cache')
+    return os.path.join(base, 'AutoScriptPro', *parts)
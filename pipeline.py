@@ -0,0 +1,40 @@
+# --- Streaming stages ---
+# A stage is any object with feed(ev, out) and flush(out): feed() appends
+# whatever it can decide about `ev` to `out`, flush() emits what is still
+# held back once the input ends. Stages run on recorder threads, in the
+# code generator and in batch tools, always one event at a time.
+
+class Pipeline:
+    """ Chains streaming stages (objects with feed(ev, out) and flush(out)). """
+    def __init__(self, stages):
+        self.stages = list(stages)
+
+    def _through(self, stages, batch):
+        for stage in stages:
+            if not batch:
+                break
+            nxt = []
+            for ev in batch:
+                stage.feed(ev, nxt)
+            batch = nxt
+        return batch
+
+    def feed(self, ev, out):
+        out.extend(self._through(self.stages, [ev]))
+
+    def flush(self, out):
+        for i, stage in enumerate(self.stages):
+            batch = []
+            stage.flush(batch)
+            out.extend(self._through(self.stages[i + 1:], batch))
+
+def process_events(events, stage):
+    """ Runs a streaming stage (or Pipeline) over an iterable, yielding its output. """
+    out = []
+    for ev in events:
+        stage.feed(ev, out)
+        if out:
+            yield from out
+            out.clear()
+    stage.flush(out)
+    yield from out
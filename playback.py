@@ -0,0 +1,312 @@
+import sys
+import time
+import types
+import threading
+from collections import namedtuple
+
+from input_backend import (InputBackend, default_backend, script_globals,
+                           begin_timer_period, end_timer_period, enable_dpi_awareness)
+from macro import OP_MOVE, OP_CLICK, OP_DOUBLE_CLICK, OP_PRESS, OP_RELEASE, OP_KEY_PRESS, OP_KEY_RELEASE
+from events import BUTTON_NAMES, key_label
+from timing import Pacer
+
+SCRIPT_FILENAME = '<playback script>'
+
+MIN_SPEED = 0.5
+MAX_SPEED = 20.0
+
+PlaybackStats = namedtuple('PlaybackStats', ['running', 'iterations', 'elapsed', 'per_minute'])
+
+class PlaybackCancelled(BaseException):
+    """
+    Raised in the playback thread at the first checkpoint after a stop.
+    Derives from BaseException so a script's `except Exception` can't
+    swallow it.
+    """
+
+class PlaybackRuntime:
+    """
+    Cancellation state for one playback run. stop() may be called from any
+    thread (e.g. the hotkey handler); the playback thread hits a checkpoint
+    before every injected op and every script line, and its waits block on
+    the stop event rather than time.sleep, so they end as soon as it is set.
+
+    The stop latency is measured from stop() until the playback thread
+    halted or injected its last event, whichever is later.
+    """
+    def __init__(self, stop_event=None):
+        self.stop_event = stop_event if stop_event is not None else threading.Event()
+        self.stop_time = None
+        self.halt_time = None
+        self.last_inject = None
+        self.injected_after_stop = 0
+
+    def stop(self):
+        if self.stop_time is None:
+            self.stop_time = time.perf_counter()
+        self.stop_event.set()
+
+    @property
+    def stopped(self):
+        return self.stop_event.is_set()
+
+    def checkpoint(self):
+        if self.stop_event.is_set():
+            self.halt()
+            raise PlaybackCancelled()
+
+    def halt(self):
+        if self.halt_time is None:
+            self.halt_time = time.perf_counter()
+
+    def injected(self):
+        now = time.perf_counter()
+        self.last_inject = now
+        if self.stop_time is not None and now > self.stop_time:
+            self.injected_after_stop += 1
+
+    def sleep(self, seconds):
+        """ time.sleep() replacement for scripts; wakes up as soon as stop() is called. """
+        self.checkpoint()
+        if seconds > 0:
+            deadline = time.perf_counter() + seconds
+            remaining = seconds
+            while remaining > 0 and not self.stop_event.wait(remaining):
+                remaining = deadline - time.perf_counter()
+        self.checkpoint()
+
+    def stop_latency(self):
+        """ Seconds from stop() until nothing more was injected, or None if not stopped via stop(). """
+        if self.stop_time is None or self.halt_time is None:
+            return None
+        end = self.halt_time
+        if self.last_inject is not None and self.last_inject > end:
+            end = self.last_inject
+        return max(0.0, end - self.stop_time)
+
+    def report(self):
+        latency = self.stop_latency()
+        return {
+            'stopped': self.stopped,
+            'stop_latency_ms': None if latency is None else latency * 1e3,
+            'injected_after_stop': self.injected_after_stop,
+        }
+
+    def _trace(self, frame, event, arg):
+        # Only the script's own frames get a line tracer; library calls run untraced
+        if frame.f_code.co_filename != SCRIPT_FILENAME:
+            return None
+        self.checkpoint()
+        return self._trace_line
+
+    def _trace_line(self, frame, event, arg):
+        if self.stop_event.is_set():
+            self.checkpoint()
+        return self._trace_line
+
+class GuardedBackend(InputBackend):
+    """ Passes input through to `backend`, with a cancellation checkpoint before each op. """
+    def __init__(self, backend, runtime):
+        self.backend = backend
+        self.runtime = runtime
+
+    def move(self, x, y):
+        self.runtime.checkpoint()
+        self.backend.move(x, y)
+        self.runtime.injected()
+
+    def press(self, button='left'):
+        self.runtime.checkpoint()
+        self.backend.press(button)
+        self.runtime.injected()
+
+    def release(self, button='left'):
+        self.runtime.checkpoint()
+        self.backend.release(button)
+        self.runtime.injected()
+
+    def click(self, button='left'):
+        self.runtime.checkpoint()
+        self.backend.click(button)
+        self.runtime.injected()
+
+    def click_burst(self, button='left', count=1):
+        self.runtime.checkpoint()
+        self.backend.click_burst(button, count)
+        self.runtime.injected()
+
+    def send_batch(self, ops):
+        self.runtime.checkpoint()
+        self.backend.send_batch(ops)
+        self.runtime.injected()
+
+    def double_click(self, button='left'):
+        self.runtime.checkpoint()
+        self.backend.double_click(button)
+        self.runtime.injected()
+
+    def key_press(self, key):
+        self.runtime.checkpoint()
+        self.backend.key_press(key)
+        self.runtime.injected()
+
+    def key_release(self, key):
+        self.runtime.checkpoint()
+        self.backend.key_release(key)
+        self.runtime.injected()
+
+    def get_position(self):
+        return self.backend.get_position()
+
+class ScriptTime:
+    """ Stand-in for the `time` module inside scripts: sleep() is interruptible and speed-scaled. """
+    def __init__(self, runtime, speed=1.0):
+        self._runtime = runtime
+        self._scale = 1.0 / speed
+
+    def sleep(self, seconds):
+        self._runtime.sleep(seconds * self._scale)
+
+    def __getattr__(self, name):
+        return getattr(time, name)
+
+def as_runtime(stop):
+    """ Accepts a PlaybackRuntime, a threading.Event or None. """
+    if isinstance(stop, PlaybackRuntime):
+        return stop
+    return PlaybackRuntime(stop)
+
+class MacroPlayer:
+    """
+    Plays a Macro timeline against absolute deadlines (start + op offset), so
+    per-op overhead and late wake-ups never accumulate into drift. Scripts
+    that aren't plain timelines run through run_script() under the same
+    cancellation runtime.
+
+    `speed` (MIN_SPEED..MAX_SPEED) divides every recorded delay; `repeat`
+    plays the macro that many times back to back, 0 meaning until stopped.
+    """
+    def __init__(self, backend=None, timing_mode='hybrid', cpu_budget=0.05, spin_window=0.002):
+        self.backend = backend if backend is not None else default_backend()
+        self.timing_mode = timing_mode
+        self.cpu_budget = cpu_budget
+        self.spin_window = spin_window
+        self.speed = 1.0
+        self.repeat = 1
+        self.pacer = None
+        self.runtime = None
+
+        # Loop stats, published for snapshot()
+        self.iterations = 0
+        self.start_time = None
+        self.end_time = None
+
+    def _speed(self):
+        return min(MAX_SPEED, max(MIN_SPEED, float(self.speed)))
+
+    def _begin_loop(self):
+        self.iterations = 0
+        self.end_time = None
+        self.start_time = time.perf_counter()
+
+    def _more(self):
+        return self.repeat <= 0 or self.iterations < self.repeat
+
+    def snapshot(self):
+        """ Lock-free read of the loop counters, for polling from the GUI. """
+        start_time = self.start_time
+        end_time = self.end_time
+        if start_time is None:
+            return PlaybackStats(False, 0, 0.0, 0.0)
+        elapsed = (end_time or time.perf_counter()) - start_time
+        per_minute = self.iterations / elapsed * 60.0 if elapsed > 0 else 0.0
+        return PlaybackStats(end_time is None, self.iterations, elapsed, per_minute)
+
+    def play(self, macro, stop=None):
+        """
+        Blocks until all repeats are done or playback is stopped. `stop` is a
+        PlaybackRuntime or a threading.Event. Returns the number of ops run.
+        """
+        runtime = as_runtime(stop)
+        self.runtime = runtime
+        backend = GuardedBackend(self.backend, runtime)
+        actions = {
+            OP_CLICK: backend.click,
+            OP_DOUBLE_CLICK: backend.double_click,
+            OP_PRESS: backend.press,
+            OP_RELEASE: backend.release,
+        }
+        key_actions = {OP_KEY_PRESS: backend.key_press, OP_KEY_RELEASE: backend.key_release}
+        ops, buttons, xs, ys, times = macro.ops, macro.buttons, macro.xs, macro.ys, macro.times
+        scale = 1.0 / self._speed()
+        span = macro.duration() * scale
+        pacer = Pacer(self.timing_mode, self.cpu_budget, self.spin_window, runtime.stop_event)
+        self.pacer = pacer
+        wait_until = pacer.wait_until
+        enable_dpi_awareness()
+        timer_set = begin_timer_period(1)
+
+        done = 0
+        cur_x, cur_y = -1, -1
+        self._begin_loop()
+        try:
+            start = time.perf_counter()
+            while len(ops) and self._more():
+                for i in range(len(ops)):
+                    wait_until(start + times[i] * scale)
+                    runtime.checkpoint()
+                    op = ops[i]
+                    if op in key_actions:
+                        key_actions[op](key_label(buttons[i], xs[i]))
+                        done += 1
+                        continue
+                    x, y = xs[i], ys[i]
+                    if x != cur_x or y != cur_y:
+                        backend.move(x, y)
+                        cur_x, cur_y = x, y
+                    if op != OP_MOVE:
+                        actions[op](BUTTON_NAMES[buttons[i]])
+                    done += 1
+                self.iterations += 1
+                # Next pass starts where this one ends; re-anchor only if running behind
+                start = max(start + span, time.perf_counter())
+        except PlaybackCancelled:
+            pass
+        finally:
+            self.end_time = time.perf_counter()
+            runtime.halt()
+            pacer.finish()
+            if timer_set:
+                end_timer_period(1)
+        return done
+
+    def run_script(self, code, stop=None):
+        """
+        Execs a playback script (source, or a code object compiled with
+        SCRIPT_FILENAME) with `mouse` and `time` routed through the runtime.
+        Repeats reuse the compiled code with fresh globals. Returns False if
+        it was stopped before finishing.
+        """
+        runtime = as_runtime(stop)
+        self.runtime = runtime
+        backend = GuardedBackend(self.backend, runtime)
+        script_time = ScriptTime(runtime, self._speed())
+        compiled = code if isinstance(code, types.CodeType) else compile(code, SCRIPT_FILENAME, 'exec')
+        timer_set = begin_timer_period(1)
+        previous = sys.gettrace()
+        sys.settrace(runtime._trace)
+        self._begin_loop()
+        try:
+            while self._more():
+                exec(compiled, script_globals(backend, time_module=script_time))
+                self.iterations += 1
+                runtime.checkpoint()
+            return True
+        except PlaybackCancelled:
+            return False
+        finally:
+            sys.settrace(previous)
+            self.end_time = time.perf_counter()
+            runtime.halt()
+            if timer_set:
+                end_timer_period(1)
@@ -0,0 +1,99 @@
+from collections import namedtuple, deque
+
+# --- Closed-loop rate control ---
+# The clicker schedules wake-ups open loop at n / cps. Whatever that schedule
+# doesn't model (slow injection, a loaded machine, backlog dropped after a
+# stall) shows up as an achieved rate below target. RateController measures
+# the achieved rate over a sliding window and scales the rate the schedule
+# aims for: integral action in multiplicative form, so a steady shortfall is
+# driven to zero instead of just reduced. If a correction doesn't raise the
+# achieved rate, wake-ups are bound by per-injection overhead rather than by
+# the schedule, and the controller raises the minimum burst size (clicks per
+# wake-up) instead. Bursts are never shrunk again within a setpoint, which
+# keeps the two knobs from fighting.
+
+ControllerState = namedtuple('ControllerState', [
+    'target_cps',       # rate asked for
+    'achieved_cps',     # measured over the last window (0 until the first full window)
+    'error',            # (target - achieved) / target
+    'correction',       # factor applied to the target when scheduling
+    'burst',            # minimum clicks per wake-up
+    'within_tolerance', # |error| <= tolerance
+    'saturated',        # correction pinned at a limit
+    'updates',          # corrections applied so far
+])
+
+class RateController:
+    """
+    Holds the achieved click rate within `tolerance` (fraction of target).
+    Call update() from the click loop after every injection; it only does
+    work every `period` seconds. The window stretches at low rates so it
+    always spans at least `min_clicks` clicks.
+    """
+    def __init__(self, tolerance=0.02, window=0.5, period=0.25, gain=0.6,
+                 min_clicks=50, max_correction=4.0, allow_burst=True, max_burst=64):
+        self.tolerance = tolerance
+        self.window = window
+        self.period = period
+        self.gain = gain
+        self.min_clicks = min_clicks
+        self.max_correction = max_correction
+        self.allow_burst = allow_burst
+        self.max_burst = max_burst
+        self.reset()
+
+    def reset(self):
+        self.target = 0.0
+        self.achieved = 0.0
+        self.error = 0.0
+        self.correction = 1.0
+        self.burst = 1
+        self.updates = 0
+        self._corrected_from = None # achieved rate when the last correction was made
+        self._samples = deque()
+        self._next_update = 0.0
+
+    def update(self, now, clicks, target):
+        """ Feeds the cumulative click count at perf_counter() time `now`. """
+        if now < self._next_update:
+            return
+        samples = self._samples
+        if target != self.target:
+            # New setpoint: old samples measured a different schedule
+            self.target = target
+            self.burst = 1
+            self._corrected_from = None
+            samples.clear()
+        samples.append((now, clicks))
+        window = max(self.window, self.min_clicks / target) if target > 0 else self.window
+        self._next_update = now + min(self.period, window / 2)
+        while len(samples) > 2 and samples[1][0] <= now - window:
+            samples.popleft()
+        t0, c0 = samples[0]
+        if now - t0 < window:
+            return
+        self.achieved = (clicks - c0) / (now - t0)
+        self.error = (target - self.achieved) / target
+        # Deadband: noise inside half the tolerance is left alone
+        if abs(self.error) > self.tolerance / 2:
+            previous = self._corrected_from
+            if (self.allow_burst and self.error > self.tolerance and previous is not None
+                    and self.achieved <= previous * (1.0 + self.tolerance / 2)
+                    and self.burst < self.max_burst):
+                # Aiming higher didn't help: fewer, larger injections
+                self.burst += 1
+            else:
+                correction = self.correction * (1.0 + self.gain * self.error)
+                self.correction = min(self.max_correction, max(1.0 / self.max_correction, correction))
+            self._corrected_from = self.achieved
+            self.updates += 1
+            # Next measurement starts under the new correction
+            samples.clear()
+            samples.append((now, clicks))
+
+    def state(self):
+        correction = self.correction
+        return ControllerState(self.target, self.achieved, self.error, correction, self.burst,
+                               self.achieved > 0 and abs(self.error) <= self.tolerance,
+                               correction >= self.max_correction or correction <= 1.0 / self.max_correction,
+                               self.updates)
@@ -0,0 +1,184 @@
+import os
+import time
+import mmap
+import struct
+from bisect import bisect_left
+from array import array
+
+from paths import app_data_dir
+
+# --- Raw recording file ---
+# Fixed-width records, so event i lives at RAW_HEADER.size + i * RECORD.size and
+# a capture of any size can be sliced, counted and searched through mmap
+# without reading it into Python objects.
+#
+#   header   RAW_HEADER, rewritten with the final count and index offset on finish()
+#   records  RECORD * count: kind, button, x, y, time (the recorder's event tuple)
+#   index    little-endian doubles: time of every index_every-th record, for seeking by time
+#
+# A file whose writer never finished (crash, power loss) has index offset 0;
+# its count is taken from the file size and seeking falls back to bisecting
+# the records themselves.
+
+RAW_MAGIC = b'ASPR'
+RAW_VERSION = 1
+# magic, version, record size, index_every, count, index offset
+RAW_HEADER = struct.Struct('<4sHHIQQ')
+RECORD = struct.Struct('<BBiid')
+INDEX_ENTRY = struct.Struct('<d') # like the records, little-endian whatever the host
+INDEX_EVERY = 4096
+READ_BLOCK = 4096 # records unpacked per slice when iterating
+
+RAW_EXT = '.raw'
+
+def default_recordings_dir():
+    return app_data_dir('recordings')
+
+def new_recording_path(directory=None):
+    """ A fresh timestamped path for a raw recording (the directory is created). """
+    directory = directory if directory is not None else default_recordings_dir()
+    os.makedirs(directory, exist_ok=True)
+    base = os.path.join(directory, time.strftime('%Y%m%d-%H%M%S'))
+    path, n = base + RAW_EXT, 1
+    while os.path.exists(path):
+        path, n = f"{base}-{n}{RAW_EXT}", n + 1
+    return path
+
+class RawWriter:
+    """ Appends records to a binary file opened for writing ('w+b'). """
+    def __init__(self, f, index_every=INDEX_EVERY):
+        self.f = f
+        self.index_every = index_every
+        self.count = 0
+        self.index = array('d')
+        self._start = f.tell()
+        f.write(RAW_HEADER.pack(RAW_MAGIC, RAW_VERSION, RECORD.size, index_every, 0, 0))
+
+    def write_columns(self, kinds, buttons, xs, ys, times, n):
+        if not n:
+            return
+        every = self.index_every
+        for i in range(-self.count % every, n, every):
+            self.index.append(times[i])
+        pack = RECORD.pack
+        self.f.write(b''.join(map(pack, kinds[:n], buttons[:n], xs[:n], ys[:n], times[:n])))
+        self.count += n
+
+    def write_events(self, events):
+        columns = tuple(zip(*events)) or ((),) * 5
+        self.write_columns(*columns, len(columns[0]))
+
+    def finish(self):
+        """ Writes the index and the final header. The file stays open. """
+        f = self.f
+        f.seek(0, os.SEEK_END)
+        index_offset = f.tell() - self._start
+        f.write(b''.join(map(INDEX_ENTRY.pack, self.index)))
+        f.seek(self._start)
+        f.write(RAW_HEADER.pack(RAW_MAGIC, RAW_VERSION, RECORD.size, self.index_every,
+                                self.count, index_offset))
+        f.seek(0, os.SEEK_END)
+        f.flush()
+
+def _check_header(data):
+    magic, version, record_size, index_every, count, index_offset = RAW_HEADER.unpack_from(data, 0)
+    if magic != RAW_MAGIC:
+        raise ValueError("not a raw recording")
+    if version != RAW_VERSION or record_size != RECORD.size:
+        raise ValueError(f"unsupported raw recording version {version}")
+    return index_every, count, index_offset
+
+def is_raw_recording(head):
+    """ True if `head` (the first bytes of a file) starts a raw recording. """
+    return head[:len(RAW_MAGIC)] == RAW_MAGIC
+
+def iter_records(f):
+    """ Streams the records of a raw recording from a file-like object (e.g. a SQLite blob). """
+    index_every, count, index_offset = _check_header(f.read(RAW_HEADER.size))
+    remaining = count if index_offset else None
+    while remaining is None or remaining > 0:
+        n = READ_BLOCK if remaining is None else min(READ_BLOCK, remaining)
+        data = f.read(n * RECORD.size)
+        usable = len(data) - len(data) % RECORD.size
+        if not usable:
+            return
+        yield from RECORD.iter_unpack(data[:usable])
+        if remaining is not None:
+            remaining -= usable // RECORD.size
+        if usable < n * RECORD.size:
+            return
+
+class RawRecording:
+    """
+    Read-only, memory-mapped view of a raw recording file. len(), indexing,
+    iter_from() and find_time() only touch the pages they need.
+    """
+    def __init__(self, path):
+        self.path = path
+        self._file = open(path, 'rb')
+        try:
+            self._mm = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        except Exception:
+            self._file.close()
+            raise
+        self.index_every, count, index_offset = _check_header(self._mm)
+        if index_offset:
+            self.count = count
+            self.index = array('d', (t for t, in INDEX_ENTRY.iter_unpack(self._mm[index_offset:])))
+        else:
+            self.count = (len(self._mm) - RAW_HEADER.size) // RECORD.size
+            self.index = None
+
+    def close(self):
+        self._mm.close()
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def __len__(self):
+        return self.count
+
+    def __getitem__(self, i):
+        if i < 0:
+            i += self.count
+        if not 0 <= i < self.count:
+            raise IndexError(i)
+        return RECORD.unpack_from(self._mm, RAW_HEADER.size + i * RECORD.size)
+
+    def time_at(self, i):
+        return RECORD.unpack_from(self._mm, RAW_HEADER.size + i * RECORD.size)[4]
+
+    def __iter__(self):
+        return self.iter_from(0)
+
+    def iter_from(self, start=0, stop=None):
+        """ Records start..stop, unpacked one READ_BLOCK slice at a time. """
+        stop = self.count if stop is None else min(stop, self.count)
+        mm = self._mm
+        for i in range(max(start, 0), stop, READ_BLOCK):
+            a = RAW_HEADER.size + i * RECORD.size
+            b = RAW_HEADER.size + min(i + READ_BLOCK, stop) * RECORD.size
+            yield from RECORD.iter_unpack(mm[a:b])
+
+    def find_time(self, t):
+        """ Position of the first record at or after time `t` (recordings are time ordered). """
+        lo, hi = 0, self.count
+        if self.index is not None and len(self.index):
+            # The index narrows the search to one block before any record is touched
+            k = bisect_left(self.index, t)
+            lo = max(0, (k - 1) * self.index_every)
+            hi = min(self.count, k * self.index_every)
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self.time_at(mid) < t:
+                lo = mid + 1
+            else:
+                hi = mid
+        return lo
+
+    def iter_since(self, t):
+        return self.iter_from(self.find_time(t))
@@ -0,0 +1,428 @@
+import time
+import heapq
+import queue
+import struct
+import tempfile
+import threading
+from array import array
+from collections import deque
+from operator import itemgetter
+
+import mouse
+
+from events import (EVENT_MOVE, EVENT_KINDS, EVENT_NAMES, KEY_KINDS, KEY_EVENTS,
+                    BUTTON_NONE, BUTTON_CODES, BUTTON_NAMES, key_code)
+from path_simplify import PathSimplifier
+from pipeline import Pipeline, process_events
+from raw_format import RawWriter, RawRecording, iter_records, is_raw_recording, RAW_HEADER
+
+# Recorded events travel as (kind, button, x, y, time) tuples outside the
+# buffers; button events carry the last known cursor position, key events
+# use the layout described in events.py.
+
+CHUNK_EVENTS = 4096
+CHUNK_HEADER = struct.Struct('<I') # event count, followed by one packed array per column
+
+class ColumnBuffer:
+    """ Preallocated kind/button/x/y/time columns holding up to `capacity` events. """
+    def __init__(self, capacity=CHUNK_EVENTS):
+        self.capacity = capacity
+        self.kinds = array('B', bytes(capacity))
+        self.buttons = array('B', bytes(capacity))
+        self.xs = array('i', [0]) * capacity
+        self.ys = array('i', [0]) * capacity
+        self.times = array('d', [0.0]) * capacity
+        self.n = 0
+
+    def put(self, kind, button, x, y, t):
+        i = self.n
+        self.kinds[i] = kind
+        self.buttons[i] = button
+        self.xs[i] = x
+        self.ys[i] = y
+        self.times[i] = t
+        self.n = i + 1
+        return self.n == self.capacity
+
+    def events(self):
+        kinds, buttons, xs, ys, times = self.kinds, self.buttons, self.xs, self.ys, self.times
+        for i in range(self.n):
+            yield (kinds[i], buttons[i], xs[i], ys[i], times[i])
+
+    def write_to(self, f):
+        n = self.n
+        f.write(CHUNK_HEADER.pack(n))
+        for column in (self.kinds, self.buttons, self.xs, self.ys, self.times):
+            f.write(memoryview(column)[:n].tobytes())
+
+def read_chunks(f):
+    """ Yields the events of a chunked spill file, one chunk in memory at a time. """
+    while True:
+        header = f.read(CHUNK_HEADER.size)
+        if len(header) < CHUNK_HEADER.size:
+            return
+        n, = CHUNK_HEADER.unpack(header)
+        columns = []
+        for typecode in ('B', 'B', 'i', 'i', 'd'):
+            column = array(typecode)
+            column.frombytes(f.read(column.itemsize * n))
+            columns.append(column)
+        yield from zip(*columns)
+
+def read_raw(f):
+    """ Events of a raw recording file object; older chunk-format recordings are still read. """
+    head = f.read(RAW_HEADER.size)
+    f.seek(-len(head), 1)
+    if is_raw_recording(head):
+        return iter_records(f)
+    return read_chunks(f)
+
+def iter_raw_path(path):
+    """ Events of a raw recording on disk, read through mmap. """
+    with open(path, 'rb') as f:
+        head = f.read(RAW_HEADER.size)
+        if not is_raw_recording(head):
+            f.seek(0)
+            yield from read_chunks(f)
+            return
+    with RawRecording(path) as recording:
+        yield from recording
+
+class MoveFilter:
+    """
+    Streaming form of the recorder's move filter: buttons and the first move
+    are always kept, a move directly before a button event is kept (exact
+    click position), any other move only if it is more than `threshold`
+    pixels away from the last kept one. Needs one event of look-ahead, so a
+    move is held back until the next mouse event arrives. Key events don't
+    affect the cursor path; they wait behind a held move to stay in order.
+    """
+    def __init__(self, threshold=5):
+        self.threshold = threshold
+        self.started = False
+        self.pending = None
+        self.held = [] # key events that came after `pending`
+        self.last_x = -100
+        self.last_y = -100
+
+    def _far_enough(self, ev):
+        return abs(ev[2] - self.last_x) > self.threshold or abs(ev[3] - self.last_y) > self.threshold
+
+    def _release_held(self, out):
+        if self.held:
+            out.extend(self.held)
+            self.held.clear()
+
+    def feed(self, ev, out):
+        """ Appends the events that can be decided now to `out`. """
+        pending = self.pending
+        if ev[0] in KEY_EVENTS:
+            if pending is None:
+                out.append(ev)
+            else:
+                self.held.append(ev)
+        elif ev[0] == EVENT_MOVE:
+            if not self.started:
+                self.started = True
+                self.last_x, self.last_y = ev[2], ev[3]
+                out.append(ev)
+                return
+            if pending is not None and self._far_enough(pending):
+                self.last_x, self.last_y = pending[2], pending[3]
+                out.append(pending)
+            self._release_held(out)
+            self.pending = ev
+        else:
+            self.started = True
+            if pending is not None:
+                self.last_x, self.last_y = pending[2], pending[3]
+                out.append(pending)
+                self.pending = None
+            self._release_held(out)
+            out.append(ev)
+
+    def flush(self, out):
+        pending = self.pending
+        if pending is not None and self._far_enough(pending):
+            out.append(pending)
+        self.pending = None
+        self._release_held(out)
+
+def make_pipeline(move_threshold=5, path_tolerance=3.0, time_tolerance=0.05):
+    """ Move filter, then (unless path_tolerance is None) path simplification. """
+    stages = [MoveFilter(move_threshold)]
+    if path_tolerance is not None:
+        stages.append(PathSimplifier(path_tolerance, time_tolerance))
+    return Pipeline(stages)
+
+def filter_events(events, threshold=5):
+    """ Runs MoveFilter over an iterable of event tuples. """
+    return process_events(events, MoveFilter(threshold))
+
+def to_mouse_event(ev):
+    kind, button, x, y, t = ev
+    if kind == EVENT_MOVE:
+        return mouse.MoveEvent(x, y, t)
+    return mouse.ButtonEvent(EVENT_NAMES[kind], BUTTON_NAMES.get(button), t)
+
+class StreamingRecorder:
+    """
+    Mouse and keyboard recorder with bounded memory. Each device's hook only
+    writes into its own preallocated ColumnBuffer; full buffers are handed to
+    a writer thread. The writer merges the devices live: every
+    FLUSH_INTERVAL it takes any partial buffer holding events older than the
+    watermark (wall clock minus HOOK_LAG), k-way merges everything up to the
+    watermark by timestamp (heapq.merge) and streams it into the raw
+    recording (raw_format.py, kept at `raw_path` if given) and through the
+    filter stage, whose output is spilled in chunks. An idle device thus
+    never holds the merge back, and stop() only has the last HOOK_LAG or so
+    left to process. Memory use is a few buffers plus that window,
+    regardless of how long the recording runs.
+
+    The filter stage is the move filter followed by error-bounded path
+    simplification (path_simplify.py); pass path_tolerance=None to skip it.
+    Key events whose name is in `ignore_keys` (e.g. the stop hotkey) are not
+    recorded; keyboard=False records the mouse only.
+    """
+    DEVICES = ('mouse', 'keyboard')
+    FLUSH_INTERVAL = 0.1 # how often the writer advances the watermark
+    HOOK_LAG = 0.25 # longest expected delay between an event's timestamp and its callback
+
+    def __init__(self, chunk_events=CHUNK_EVENTS, move_threshold=5, raw_path=None,
+                 path_tolerance=3.0, time_tolerance=0.05, keyboard=True, ignore_keys=()):
+        self.chunk_events = chunk_events
+        self.move_threshold = move_threshold
+        self.path_tolerance = path_tolerance
+        self.time_tolerance = time_tolerance
+        self.raw_path = raw_path
+        self.keyboard = keyboard
+        # Only the key itself of a combination like 'ctrl+f9' is dropped
+        self.ignore_keys = {name.rsplit('+', 1)[-1].strip().lower() for name in ignore_keys if name}
+        self.recording = False
+        self.keyboard_hooked = False
+        self.raw_count = 0
+        self.filtered_count = 0
+        self._raw_file = None
+        self._filtered_file = None
+        self._pending = None # per-device events handed over but not yet merged
+        self._buffers = None # per-device ColumnBuffer being filled
+        self._lock = threading.Lock() # hook threads vs finish()
+        self._closed = True # set once finish() has taken the buffers; late callbacks are dropped
+        self._free = queue.SimpleQueue()
+        self._full = queue.SimpleQueue()
+        self._writer = None
+        self._x = 0
+        self._y = 0
+
+    # --- Capture (hook threads) ---
+    def _on_event(self, e):
+        cls = type(e)
+        if cls is mouse.MoveEvent:
+            self._x = x = e.x
+            self._y = y = e.y
+            self._put(0, EVENT_MOVE, BUTTON_NONE, x, y, e.time)
+        elif cls is mouse.ButtonEvent:
+            self._put(0, EVENT_KINDS[e.event_type], BUTTON_CODES.get(e.button, BUTTON_NONE),
+                      self._x, self._y, e.time)
+        # Wheel events are not recorded
+
+    def _on_key(self, e):
+        name = e.name.lower() if e.name else None
+        if name in self.ignore_keys:
+            return
+        self._put(1, KEY_KINDS[e.event_type], key_code(name), e.scan_code or 0, 0, e.time)
+
+    def _put(self, device, kind, button, x, y, t):
+        with self._lock:
+            if self._closed:
+                return
+            buffer = self._buffers[device]
+            if buffer.put(kind, button, x, y, t):
+                self._full.put((device, buffer))
+                try:
+                    self._buffers[device] = self._free.get_nowait()
+                except queue.Empty:
+                    self._buffers[device] = ColumnBuffer(self.chunk_events)
+
+    # --- Writer thread ---
+    def _write_loop(self):
+        self._raw = RawWriter(self._raw_file)
+        self._pipeline = make_pipeline(self.move_threshold, self.path_tolerance, self.time_tolerance)
+        self._merged = ColumnBuffer(self.chunk_events)
+        self._filtered = ColumnBuffer(self.chunk_events)
+        self._out = []
+        self._last_time = float('-inf')
+        next_merge = time.time() + self.FLUSH_INTERVAL
+        while True:
+            try:
+                item = self._full.get(timeout=self.FLUSH_INTERVAL)
+            except queue.Empty:
+                item = ()
+            if item is None:
+                break
+            if item:
+                self._take(*item)
+            now = time.time()
+            if now >= next_merge:
+                watermark = now - self.HOOK_LAG
+                self._collect_partial(watermark)
+                self._merge_until(watermark)
+                next_merge = now + self.FLUSH_INTERVAL
+        # finish() queued the partial buffers ahead of the sentinel
+        self._merge_until(float('inf'))
+        self._finish_outputs()
+
+    def _take(self, device, buffer):
+        self._pending[device].extend(buffer.events())
+        self.raw_count += buffer.n
+        buffer.n = 0
+        self._free.put(buffer)
+
+    def _collect_partial(self, watermark):
+        # A partial buffer that already reaches back past the watermark (an
+        # idle or slow device) is swapped out so the merge can move on. Full
+        # buffers still queued are older, so they are taken first.
+        taken = []
+        with self._lock:
+            if self._closed:
+                return
+            while True:
+                try:
+                    taken.append(self._full.get_nowait())
+                except queue.Empty:
+                    break
+            for device, buffer in enumerate(self._buffers):
+                if buffer.n and buffer.times[0] <= watermark:
+                    try:
+                        self._buffers[device] = self._free.get_nowait()
+                    except queue.Empty:
+                        self._buffers[device] = ColumnBuffer(self.chunk_events)
+                    taken.append((device, buffer))
+        for device, buffer in taken:
+            self._take(device, buffer)
+
+    def _merge_until(self, watermark):
+        runs = []
+        for events in self._pending:
+            run = []
+            while events and events[0][4] <= watermark:
+                run.append(events.popleft())
+            runs.append(run)
+        # Each device's events are already in time order; ties keep mouse first
+        for ev in heapq.merge(*runs, key=itemgetter(4)):
+            if ev[4] < self._last_time:
+                # Delivered later than HOOK_LAG: keep the timeline monotonic
+                ev = ev[:4] + (self._last_time,)
+            self._last_time = ev[4]
+            self._emit(ev)
+
+    def _emit(self, ev):
+        merged = self._merged
+        if merged.put(*ev):
+            self._raw.write_columns(merged.kinds, merged.buttons, merged.xs, merged.ys, merged.times, merged.n)
+            merged.n = 0
+        out = self._out
+        self._pipeline.feed(ev, out)
+        if out:
+            self._write_filtered(out)
+
+    def _write_filtered(self, events):
+        filtered = self._filtered
+        for ev in events:
+            if filtered.put(*ev):
+                filtered.write_to(self._filtered_file)
+                filtered.n = 0
+        self.filtered_count += len(events)
+        events.clear()
+
+    def _finish_outputs(self):
+        merged = self._merged
+        self._raw.write_columns(merged.kinds, merged.buttons, merged.xs, merged.ys, merged.times, merged.n)
+        self._pipeline.flush(self._out)
+        self._write_filtered(self._out)
+        if self._filtered.n:
+            self._filtered.write_to(self._filtered_file)
+        self._raw.finish()
+        self._raw = self._pipeline = self._merged = self._filtered = self._pending = None
+
+    # --- Control ---
+    def start(self, initial_pos=None):
+        if self.recording:
+            return
+        self.raw_count = 0
+        self.filtered_count = 0
+        if self.raw_path:
+            self._raw_file = open(self.raw_path, 'w+b')
+        else:
+            self._raw_file = tempfile.TemporaryFile()
+        self._filtered_file = tempfile.TemporaryFile()
+        self._pending = [deque() for _ in self.DEVICES]
+        self._buffers = [ColumnBuffer(self.chunk_events) for _ in self.DEVICES]
+        self._writer = threading.Thread(target=self._write_loop, daemon=True)
+        self._writer.start()
+        self._closed = False
+        self.recording = True
+        # Capture initial position manually because hook might miss it before first move
+        if initial_pos is not None:
+            self._x, self._y = initial_pos
+            self._put(0, EVENT_MOVE, BUTTON_NONE, initial_pos[0], initial_pos[1], time.time())
+        mouse.hook(self._on_event)
+        self.keyboard_hooked = False
+        if self.keyboard:
+            try:
+                # Imported here so mouse-only and headless users never load the keyboard hook
+                import keyboard
+                keyboard.hook(self._on_key)
+                self.keyboard_hooked = True
+            except Exception as e:
+                # e.g. no access to input devices: keep recording the mouse
+                print(f"Warning: Could not record the keyboard: {e}")
+
+    def stop(self):
+        if not self.recording:
+            return
+        mouse.unhook(self._on_event)
+        if self.keyboard_hooked:
+            import keyboard
+            keyboard.unhook(self._on_key)
+            self.keyboard_hooked = False
+        self.recording = False
+        self.finish()
+
+    def finish(self):
+        """
+        Flushes the partial buffers and waits for the writer to merge and
+        drain. A hook callback still running after unhook finds the recorder
+        closed and drops its event.
+        """
+        with self._lock:
+            self._closed = True
+            if self._buffers is not None:
+                for device, buffer in enumerate(self._buffers):
+                    if buffer.n:
+                        self._full.put((device, buffer))
+            self._buffers = None
+        self._full.put(None)
+        self._writer.join()
+        self._raw_file.flush()
+        self._filtered_file.flush()
+
+    def iter_raw(self):
+        self._raw_file.seek(0)
+        return iter_records(self._raw_file)
+
+    def raw_bytes(self):
+        """ The raw recording's contents (raw_format.py), e.g. to store in the library. """
+        self._raw_file.seek(0)
+        return self._raw_file.read()
+
+    def iter_filtered(self):
+        self._filtered_file.seek(0)
+        return read_chunks(self._filtered_file)
+
+    def close(self):
+        for f in (self._raw_file, self._filtered_file):
+            if f is not None:
+                f.close()
+        self._raw_file = None
+        self._filtered_file = None
@@ -0,0 +1,48 @@
+import os
+import sys
+import time
+from contextlib import contextmanager
+
+# --- Startup profiling ---
+# Wall-clock time of each import group and setup stage up to the first
+# paint of the main window. Printed when AUTOSCRIPT_TRACE_STARTUP=1 or
+# --trace-startup is given, and flagged whenever time-to-first-paint goes
+# over the budget.
+
+STARTUP_BUDGET_MS = 1000
+
+def trace_enabled(argv=None):
+    argv = sys.argv if argv is None else argv
+    return os.environ.get('AUTOSCRIPT_TRACE_STARTUP') == '1' or '--trace-startup' in argv
+
+class StartupTrace:
+    def __init__(self, budget_ms=STARTUP_BUDGET_MS):
+        self.start = time.perf_counter()
+        self.budget_ms = budget_ms
+        self.stages = [] # (label, ms), in the order they finished
+        self.first_paint_ms = None
+
+    @contextmanager
+    def stage(self, label):
+        t = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.stages.append((label, (time.perf_counter() - t) * 1e3))
+
+    def mark_first_paint(self):
+        if self.first_paint_ms is None:
+            self.first_paint_ms = (time.perf_counter() - self.start) * 1e3
+
+    def over_budget(self):
+        return self.first_paint_ms is not None and self.first_paint_ms > self.budget_ms
+
+    def report(self):
+        lines = [f"{label:<32} {ms:8.1f} ms" for label, ms in self.stages]
+        traced = sum(ms for _, ms in self.stages)
+        if self.first_paint_ms is not None:
+            lines.append(f"{'(untraced / event loop)':<32} {self.first_paint_ms - traced:8.1f} ms")
+            flag = "  OVER BUDGET" if self.over_budget() else ""
+            lines.append(f"{'time to first paint':<32} {self.first_paint_ms:8.1f} ms"
+                         f" (budget {self.budget_ms} ms){flag}")
+        return "\n".join(lines)
@@ -1,14 +1,42 @@
+import os
+import sys
 import unittest
 import time
+import tempfile
 import threading
+from unittest import mock
 from clicker_core import HighResClicker
+from multi_clicker import MultiStreamClicker, ClickStream
+from input_backend import RecordingInputBackend, NullInputBackend, script_globals
+from events import EVENT_MOVE, EVENT_DOWN, EVENT_UP, EVENT_KEY_DOWN, EVENT_KEY_UP, BUTTON_CODES, KEY_CODES
+from timing import Pacer
+from macro import Macro, OP_MOVE, OP_CLICK, OP_PRESS, OP_RELEASE, OP_KEY_PRESS, OP_KEY_RELEASE
+from playback import MacroPlayer, PlaybackRuntime
+from code_cache import CodeCache
+from macro_library import MacroLibrary
+import recorder
+from recorder import StreamingRecorder, ColumnBuffer, filter_events, to_mouse_event
+from pipeline import process_events
+from codegen import events_to_code, from_mouse_events, iter_ops, iter_lines
+from path_simplify import PathSimplifier, simplify_run, max_deviation
+from timing_stats import IntervalHistogram, RateWindow
+from highlighter import SyntaxHighlighter, tokenize_line, tokenize_lines
+from startup_trace import StartupTrace, trace_enabled
+import cli
+from batch_convert import batch_convert, find_recordings
+from raw_format import RawWriter, RawRecording, iter_records
+import benchmarks
+from hotkey_dispatch import HotkeyDispatcher, DEFERRED
+from rate_control import RateController
+from async_playback import AsyncMacroPlayer
 import mouse
 import keyboard
 
 # Mocking external inputs for headless testing
 class TestClickerCore(unittest.TestCase):
     def setUp(self):
-        self.clicker = HighResClicker()
+        self.sink = RecordingInputBackend(capacity=10000)
+        self.clicker = HighResClicker(self.sink)
 
     def test_initial_state(self):
         self.assertFalse(self.clicker.running)
@@ -22,21 +50,245 @@ class TestClickerCore(unittest.TestCase):
         self.clicker.stop()
         self.assertFalse(self.clicker.running)
 
-    def test_cps_timing(self):
-        # This test might be flaky on loaded systems, but gives a rough idea
-        self.clicker.cps = 50
-        self.clicker.limit_mode = 'time'
-        self.clicker.limit_value = 0.5
-        
-        start = time.time()
+    def test_count_limit_reaches_backend(self):
+        self.clicker.cps = 200
+        self.clicker.button = 'right'
+        self.clicker.limit_mode = 'count'
+        self.clicker.limit_value = 20
         self.clicker.start()
         self.clicker.thread.join()
-        end = time.time()
-        
-        # Should be roughly 25 clicks
-        expected_clicks = 25
-        # Allow 20% margin
-        self.assertTrue(expected_clicks * 0.8 <= self.clicker.total_clicks <= expected_clicks * 1.2)
+
+        events = list(self.sink.events())
+        self.assertEqual(len(events), 40)
+        self.assertEqual([e[0] for e in events[:2]], [EVENT_DOWN, EVENT_UP])
+        self.assertTrue(all(e[1] == BUTTON_CODES['right'] for e in events))
+        times = self.sink.press_times()
+        self.assertEqual(len(times), 20)
+        self.assertEqual(times, sorted(times))
+
+    def test_burst_mode(self):
+        self.clicker.cps = 5000
+        self.clicker.limit_mode = 'count'
+        self.clicker.limit_value = 1001
+        self.clicker.start()
+        self.clicker.thread.join()
+
+        self.assertEqual(self.clicker.total_clicks, 1001)
+        self.assertEqual(len(self.sink.press_times()), 1001)
+        report = self.clicker.burst_report()
+        # 0.2 ms interval vs 2 ms sleep granularity -> 10 clicks per injection
+        self.assertEqual(report['calls'], 101)
+        self.assertGreater(report['clicks_per_call'], 9)
+
+    def test_burst_off_below_granularity(self):
+        self.clicker.cps = 1000
+        self.clicker.burst_mode = 'off'
+        self.clicker.limit_mode = 'count'
+        self.clicker.limit_value = 5
+        self.clicker.start()
+        self.clicker.thread.join()
+        self.assertEqual(self.clicker.burst_report()['calls'], 5)
+
+    def test_drift_compensation(self):
+        # Every 10th injection stalls for 15 ms; the schedule must absorb it
+        class StallingSink(RecordingInputBackend):
+            def click(self, button='left'):
+                super().click(button)
+                if self.count % 20 == 0:
+                    time.sleep(0.015)
+
+        sink = StallingSink(capacity=1000)
+        clicker = HighResClicker(sink)
+        clicker.cps = 100
+        clicker.timing_mode = 'sleep'
+        clicker.limit_mode = 'count'
+        clicker.limit_value = 100
+        clicker.start()
+        clicker.thread.join()
+
+        times = sink.press_times()
+        span = times[-1] - times[0]
+        self.assertAlmostEqual(span, 0.99, delta=0.05)
+
+    def test_interval_stats(self):
+        self.clicker.cps = 200
+        self.clicker.limit_mode = 'count'
+        self.clicker.limit_value = 50
+        self.clicker.start()
+        self.clicker.thread.join()
+
+        stats = self.clicker.interval_stats()
+        self.assertEqual(stats['samples'], 49)
+        self.assertAlmostEqual(stats['interval_p50_us'], 5000, delta=1000)
+        self.assertLessEqual(stats['jitter_p50_us'], stats['jitter_p99_us'])
+        self.assertLessEqual(stats['jitter_p99_us'], stats['jitter_max_us'])
+        self.assertAlmostEqual(stats['window_cps'], 200, delta=30)
+
+    def test_snapshot(self):
+        self.assertEqual(self.clicker.snapshot().clicks, 0)
+        self.clicker.cps = 200
+        self.clicker.start()
+        time.sleep(0.2)
+        live = self.clicker.snapshot()
+        self.clicker.stop()
+        final = self.clicker.snapshot()
+
+        self.assertTrue(live.running)
+        self.assertGreater(live.clicks, 0)
+        self.assertFalse(final.running)
+        self.assertEqual(final.clicks, self.clicker.total_clicks)
+        self.assertGreaterEqual(final.clicks, live.clicks)
+        self.assertAlmostEqual(final.cps, 200, delta=40)
+        # Frozen once the run is over
+        self.assertEqual(self.clicker.snapshot().elapsed, final.elapsed)
+
+class TestMultiStreamClicker(unittest.TestCase):
+    def test_streams_share_one_thread_and_coalesce(self):
+        sink = RecordingInputBackend(capacity=10000)
+        sched = MultiStreamClicker(sink)
+        streams = [sched.add_stream(ClickStream(button=b, cps=100, position=(i, i),
+                                                limit_mode='count', limit_value=20))
+                   for i, b in enumerate(['left', 'right', 'middle'])]
+        threads_before = threading.active_count()
+        sched.start()
+        self.assertEqual(threading.active_count(), threads_before + 1)
+        for stream in streams:
+            self.assertTrue(stream.finished.wait(2.0))
+        report = sched.report()
+        sched.stop()
+
+        self.assertEqual([s.total_clicks for s in streams], [20, 20, 20])
+        self.assertEqual(len(sink.press_times()), 60)
+        # Same rate, same start -> every deadline is shared by all three streams
+        self.assertAlmostEqual(report['clicks_per_batch'], 3.0, delta=0.2)
+        self.assertEqual(streams[0].interval_stats()['clicks'], 20)
+
+    def test_independent_rates(self):
+        sink = RecordingInputBackend(capacity=10000)
+        sched = MultiStreamClicker(sink)
+        fast = sched.add_stream(ClickStream(cps=200, limit_mode='time', limit_value=0.3))
+        slow = sched.add_stream(ClickStream(cps=20, limit_mode='time', limit_value=0.3))
+        sched.start()
+        fast.finished.wait(2.0)
+        slow.finished.wait(2.0)
+        sched.stop()
+        # Exact, as on HighResClicker: a click due at the limit itself doesn't go out
+        self.assertEqual(fast.total_clicks, 60)
+        self.assertEqual(slow.total_clicks, 6)
+
+    def test_zero_count_limit_never_clicks(self):
+        sink = RecordingInputBackend(capacity=100)
+        sched = MultiStreamClicker(sink)
+        empty = sched.add_stream(ClickStream(cps=100, limit_mode='count', limit_value=0))
+        other = sched.add_stream(ClickStream(cps=100, limit_mode='count', limit_value=3))
+        self.assertTrue(empty.finished.is_set())
+        sched.start()
+        self.assertTrue(other.finished.wait(2.0))
+        sched.stop()
+        self.assertEqual(empty.total_clicks, 0)
+        self.assertEqual(len(sink.press_times()), 3)
+
+    def test_readded_stream_is_scheduled_once(self):
+        sink = RecordingInputBackend(capacity=1000)
+        sched = MultiStreamClicker(sink)
+        stream = ClickStream(cps=50, limit_mode='time', limit_value=0.4)
+        sched.add_stream(stream)
+        sched.remove_stream(stream)
+        sched.add_stream(stream)
+        self.assertEqual(len(sched._heap), 2) # the stale entry is only dropped when popped
+        sched.start()
+        self.assertTrue(stream.finished.wait(2.0))
+        sched.stop()
+        self.assertEqual(stream.total_clicks, 20)
+        self.assertEqual(sched._heap, [])
+
+    def test_delay_floor(self):
+        # Jitter wider than the interval must not turn the loop into a busy spin
+        stream = ClickStream(cps=500, random_range=50)
+        self.assertGreaterEqual(min(stream._next_delay() for _ in range(1000)), 0.001)
+
+class TestTimingStats(unittest.TestCase):
+    def test_histogram_percentiles(self):
+        hist = IntervalHistogram()
+        for i in range(1, 1001):
+            hist.record(i * 1e-5) # 10us .. 10ms
+        self.assertEqual(hist.count, 1000)
+        self.assertAlmostEqual(hist.percentile(50), 5e-3, delta=5e-3 / 16)
+        self.assertAlmostEqual(hist.percentile(99), 9.9e-3, delta=9.9e-3 / 16)
+        self.assertEqual(hist.percentile(100), 1e-2)
+        self.assertEqual(hist.max, 1e-2)
+        hist.record(0.0)
+        hist.record(1e6)
+        self.assertEqual(hist.count, 1002)
+
+    def test_rate_window(self):
+        window = RateWindow(window=1.0, capacity=64)
+        for i in range(200):
+            window.record(i * 0.1, i * 5) # 50/s
+        self.assertAlmostEqual(window.rate(), 50.0)
+        self.assertEqual(window.filled, 64)
+
+class TestPacer(unittest.TestCase):
+    def test_strategies_hit_deadline(self):
+        for strategy in ('sleep', 'hybrid', 'spin'):
+            pacer = Pacer(strategy, cpu_budget=0.5)
+            deadline = time.perf_counter() + 0.005
+            error = pacer.wait_until(deadline)
+            self.assertGreaterEqual(time.perf_counter(), deadline)
+            self.assertGreaterEqual(error, 0.0)
+            pacer.finish()
+            report = pacer.report()
+            self.assertEqual(report['waits'], 1)
+            if strategy == 'sleep':
+                self.assertEqual(report['spin_fraction'], 0.0)
+            else:
+                self.assertGreater(report['spin_fraction'], 0.0)
+
+    def test_unknown_strategy(self):
+        with self.assertRaises(ValueError):
+            Pacer('busy')
+
+class TestInputBackends(unittest.TestCase):
+    def test_recording_capacity(self):
+        sink = RecordingInputBackend(capacity=3)
+        sink.move(10, 20)
+        sink.click('left')
+        sink.click('left')
+        self.assertEqual(sink.count, 3)
+        self.assertEqual(sink.dropped, 2)
+        self.assertEqual(list(sink.events())[1][2:4], (10, 20))
+
+    def test_script_globals_routes_mouse(self):
+        sink = RecordingInputBackend(capacity=100)
+        code = "import mouse\nmouse.move(5, 6)\nmouse.click(button='middle')\n"
+        exec(code, script_globals(sink))
+        self.assertEqual(sink.count, 3)
+        self.assertEqual(sink.get_position(), (5, 6))
+
+    def test_script_relative_move(self):
+        sink = RecordingInputBackend(capacity=100)
+        exec("import mouse\nmouse.move(100, 50)\nmouse.move(10, -5, absolute=False)\n", script_globals(sink))
+        self.assertEqual(sink.get_position(), (110, 45))
+
+    def test_script_move_duration(self):
+        sink = RecordingInputBackend(capacity=100)
+        sleeps = []
+        fake_time = mock.Mock(sleep=sleeps.append)
+        exec("mouse.move(0, 0)\nmouse.move(100, 40, duration=0.1)\n", script_globals(sink, time_module=fake_time))
+        moves = [ev[2:4] for ev in sink.events()]
+        self.assertEqual(len(moves), 13) # 12 interpolated steps at 120/s
+        self.assertEqual(moves[-1], (100, 40))
+        self.assertTrue(all(a[0] <= b[0] and a[1] <= b[1] for a, b in zip(moves, moves[1:])))
+        self.assertAlmostEqual(sum(sleeps), 0.1)
+
+    def test_null_backend(self):
+        clicker = HighResClicker(NullInputBackend())
+        clicker.cps = 500
+        clicker.limit_mode = 'count'
+        clicker.limit_value = 10
+        clicker.start()
+        clicker.thread.join()
+        self.assertEqual(clicker.total_clicks, 10)
 
 class TestRecorderLogic(unittest.TestCase):
     def test_events_to_code(self):
@@ -46,37 +298,963 @@ class TestRecorderLogic(unittest.TestCase):
             mouse.ButtonEvent(event_type='up', button='left', time=1000.1),
             mouse.ButtonEvent(event_type='down', button='right', time=1001.0)
         ]
+        code = events_to_code(from_mouse_events(events))
         
-        # We need to extract the conversion logic from the App class.
-        # Since it's embedded in the GUI class, we'll duplicate it here for unit testing purposes
-        # or refactor the code. For now, I'll test the logic directly.
-        
-        lines = ["import mouse", "import time", "", "def run_script():"]
-        last_time = events[0].time
-        
-        for event in events:
-            if isinstance(event, mouse.MoveEvent):
-                pass 
-            elif isinstance(event, mouse.ButtonEvent):
-                dt = event.time - last_time
-                if dt > 0.01:
-                    lines.append(f"    time.sleep({dt:.3f})")
-                
-                if event.event_type == 'down':
-                    lines.append(f"    mouse.press(button='{event.button}')")
-                elif event.event_type == 'up':
-                    lines.append(f"    mouse.release(button='{event.button}')")
-                
-                last_time = event.time
-        
-        lines.append("")
-        lines.append("if __name__ == '__main__':")
-        lines.append("    run_script()")
-        code = "\n".join(lines)
-        
-        self.assertIn("mouse.press(button='left')", code)
-        self.assertIn("mouse.release(button='left')", code)
-        self.assertIn("time.sleep(0.900)", code) # 1001.0 - 1000.1 = 0.9
+        self.assertIn("mouse.click(button='left')", code)
+        self.assertIn("mouse.press(button='right')", code)
+        self.assertIn("time.sleep(0.9000)", code) # 1001.0 - 1000.1 = 0.9
+        self.assertEqual(events_to_code([]), "")
+
+    def test_double_click_and_broken_click(self):
+        events = [
+            (EVENT_MOVE, 0, 100, 100, 0.0),
+            (EVENT_DOWN, 1, 100, 100, 0.1), (EVENT_MOVE, 0, 102, 101, 0.12), (EVENT_UP, 1, 100, 100, 0.15),
+            (EVENT_DOWN, 1, 100, 100, 0.3), (EVENT_UP, 1, 100, 100, 0.35),
+            # Down, then a drag: press / moves / release
+            (EVENT_DOWN, 2, 100, 100, 1.0), (EVENT_MOVE, 0, 101, 100, 1.1), (EVENT_MOVE, 0, 200, 100, 1.2),
+            (EVENT_UP, 2, 200, 100, 1.3),
+        ]
+        ops = [op['type'] for op in iter_ops(events)]
+        self.assertEqual(ops, ['move', 'double_click', 'press', 'move', 'move', 'release'])
+
+    def test_streaming_is_linear(self):
+        # A down followed by many small moves and no up must not be rescanned
+        def events(n):
+            yield (EVENT_DOWN, 1, 0, 0, 0.0)
+            for i in range(n):
+                yield (EVENT_MOVE, 0, i % 3, 0, i * 1e-4)
+        start = time.perf_counter()
+        lines = sum(1 for _ in iter_lines(events(200000)))
+        self.assertGreater(lines, 10)
+        self.assertLess(time.perf_counter() - start, 10.0)
+
+class TestMacro(unittest.TestCase):
+    def _macro(self):
+        ops = [
+            {'type': 'move', 'x': 10, 'y': 20, 'time': 100.0},
+            {'type': 'click', 'button': 'left', 'x': 10, 'y': 20, 'time': 100.08, 'start_time': 100.05},
+            {'type': 'move', 'x': 30, 'y': 40, 'time': 100.1},
+            {'type': 'press', 'button': 'right', 'x': 30, 'y': 40, 'time': 100.2},
+            {'type': 'release', 'button': 'right', 'x': 30, 'y': 40, 'time': 100.25},
+        ]
+        return Macro.from_ops(ops, 100.0)
+
+    def test_export_matches_relative_sleeps(self):
+        code = self._macro().to_source()
+        self.assertIn("    mouse.move(10, 20)\n    time.sleep(0.0500)\n    mouse.click(button='left')", code)
+        # Sleep after a click is measured from the end of the click
+        self.assertIn("    time.sleep(0.0200)\n    mouse.move(30, 40)", code)
+        self.assertIn("mouse.release(button='right')", code)
+        self.assertTrue(code.endswith("    run_script()"))
+
+    def test_source_round_trip(self):
+        code = self._macro().to_source()
+        parsed = Macro.from_source(code)
+        self.assertIsNotNone(parsed)
+        self.assertEqual(list(parsed.ops), [OP_MOVE, OP_CLICK, OP_MOVE, OP_PRESS, OP_RELEASE])
+        self.assertEqual(parsed.to_source(), code)
+        self.assertIsNone(Macro.from_source(code.replace("    mouse.move(30, 40)", "    for i in range(3):")))
+
+    def test_binary_round_trip(self):
+        macro = self._macro()
+        loaded = Macro.from_bytes(macro.to_bytes())
+        self.assertEqual(loaded.base_time, 100.0)
+        for name in ('ops', 'buttons', 'xs', 'ys', 'times', 'durations'):
+            self.assertEqual(getattr(loaded, name), getattr(macro, name))
+        with self.assertRaises(ValueError):
+            Macro.from_bytes(b'XXXX' + macro.to_bytes()[4:])
+
+    def test_key_ops(self):
+        a = KEY_CODES['a']
+        events = [(EVENT_MOVE, 0, 10, 20, 100.0), (EVENT_KEY_DOWN, a, 30, 0, 100.1),
+                  (EVENT_DOWN, 1, 10, 20, 100.15), (EVENT_KEY_UP, a, 30, 0, 100.2),
+                  (EVENT_UP, 1, 10, 20, 100.25), (EVENT_KEY_DOWN, 0, 86, 0, 100.3)]
+        code = events_to_code(events)
+        # A key inside a click breaks it into press/release; unnamed keys go by scan code
+        self.assertIn("    keyboard.press('a')\n    time.sleep(0.0500)\n    mouse.press(button='left')", code)
+        self.assertIn("    keyboard.release('a')\n    time.sleep(0.0500)\n    mouse.release(button='left')", code)
+        self.assertIn("    keyboard.press(86)", code)
+        self.assertEqual(code.count("mouse.move("), 1)
+
+        parsed = Macro.from_source(code)
+        self.assertEqual(list(parsed.ops), [OP_MOVE, OP_KEY_PRESS, OP_PRESS, OP_KEY_RELEASE, OP_RELEASE, OP_KEY_PRESS])
+        self.assertEqual(parsed.to_source(), code)
+        self.assertIsNone(Macro.from_source(code.replace("keyboard.press(86)", "keyboard.press('ctrl+q')")))
+
+        sink = RecordingInputBackend(capacity=100)
+        MacroPlayer(sink, timing_mode='sleep').play(parsed)
+        played = [(ev[0], ev[1], ev[2]) for ev in sink.events() if ev[0] != EVENT_MOVE]
+        self.assertEqual(played, [(EVENT_KEY_DOWN, a, 0), (EVENT_DOWN, 1, 10), (EVENT_KEY_UP, a, 0),
+                                  (EVENT_UP, 1, 10), (EVENT_KEY_DOWN, 0, 86)])
+        # Key ops never move the cursor
+        self.assertEqual([ev[2:4] for ev in sink.events() if ev[0] == EVENT_MOVE], [(10, 20)])
+
+        sink.clear()
+        exec("import keyboard\nkeyboard.press('a')\nkeyboard.send(86)\n", script_globals(sink))
+        self.assertEqual([ev[:3] for ev in sink.events()],
+                         [(EVENT_KEY_DOWN, a, 0), (EVENT_KEY_DOWN, 0, 86), (EVENT_KEY_UP, 0, 86)])
+
+    def test_player_uses_absolute_deadlines(self):
+        macro = Macro()
+        for i in range(50):
+            macro.append(OP_CLICK, 1, 5, 5, i * 0.004)
+        sink = RecordingInputBackend(capacity=1000)
+        player = MacroPlayer(sink, timing_mode='sleep')
+        start = time.perf_counter()
+        self.assertEqual(player.play(macro), 50)
+        times = sink.press_times()
+        self.assertEqual(len(times), 50)
+        # The last click lands on its absolute offset, no accumulated drift
+        self.assertAlmostEqual(times[-1] - start, 49 * 0.004, delta=0.003)
+
+    def test_player_stop_event(self):
+        macro = Macro()
+        macro.append(OP_CLICK, 1, 5, 5, 0.0)
+        macro.append(OP_CLICK, 1, 5, 5, 0.05)
+        stop = threading.Event()
+        stop.set()
+        self.assertEqual(MacroPlayer(NullInputBackend()).play(macro, stop), 0)
+
+class TestPlaybackRuntime(unittest.TestCase):
+    def _stop_after(self, target, delay=0.05):
+        runtime = PlaybackRuntime()
+        result = []
+        thread = threading.Thread(target=lambda: result.append(target(runtime)))
+        thread.start()
+        time.sleep(delay)
+        runtime.stop()
+        thread.join(1.0)
+        self.assertFalse(thread.is_alive())
+        return runtime, result[0]
+
+    def test_stop_during_long_gap(self):
+        macro = Macro()
+        macro.append(OP_CLICK, 1, 5, 5, 0.0)
+        macro.append(OP_CLICK, 1, 5, 5, 10.0)
+        sink = RecordingInputBackend(capacity=100)
+        runtime, done = self._stop_after(lambda rt: MacroPlayer(sink).play(macro, rt))
+        self.assertEqual(done, 1)
+        self.assertEqual(runtime.injected_after_stop, 0)
+        self.assertLess(runtime.stop_latency(), 0.01)
+
+    def test_stop_script_sleep_and_loop(self):
+        sink = RecordingInputBackend(capacity=100000)
+        player = MacroPlayer(sink)
+        code = "import time\nmouse.click()\ntime.sleep(30)\n"
+        runtime, finished = self._stop_after(lambda rt: player.run_script(code, rt))
+        self.assertFalse(finished)
+        self.assertLess(runtime.stop_latency(), 0.01)
+
+        # A busy loop that swallows exceptions is still stopped
+        code = "while True:\n    try:\n        mouse.move(1, 1)\n    except Exception:\n        pass\n"
+        runtime, finished = self._stop_after(lambda rt: player.run_script(code, rt))
+        self.assertFalse(finished)
+        self.assertLess(runtime.stop_latency(), 0.01)
+        self.assertLessEqual(runtime.injected_after_stop, 1)
+
+    def test_script_runs_to_completion(self):
+        sink = RecordingInputBackend(capacity=100)
+        code = "import mouse\nimport time\nfor _ in range(3):\n    mouse.click()\n    time.sleep(0.001)\n"
+        self.assertTrue(MacroPlayer(sink).run_script(code))
+        self.assertEqual(len(sink.press_times()), 3)
+
+class TestPlaybackLoop(unittest.TestCase):
+    def test_speed_and_repeat(self):
+        macro = Macro()
+        for i in range(3):
+            macro.append(OP_CLICK, 1, 5, 5, i * 0.2)
+        sink = RecordingInputBackend(capacity=1000)
+        player = MacroPlayer(sink, timing_mode='sleep')
+        player.speed = 10.0
+        player.repeat = 3
+        start = time.perf_counter()
+        self.assertEqual(player.play(macro), 9)
+        times = sink.press_times()
+        self.assertEqual(len(times), 9)
+        # Three passes of a 0.4 s macro at 10x: 0.04 s per pass, back to back
+        self.assertAlmostEqual(times[-1] - start, 3 * 0.04, delta=0.015)
+        stats = player.snapshot()
+        self.assertFalse(stats.running)
+        self.assertEqual(stats.iterations, 3)
+        self.assertGreater(stats.per_minute, 60 * 3 / 0.2)
+
+    def test_loop_until_stopped(self):
+        macro = Macro()
+        macro.append(OP_CLICK, 1, 5, 5, 0.0)
+        macro.append(OP_CLICK, 1, 5, 5, 0.01)
+        player = MacroPlayer(NullInputBackend())
+        player.repeat = 0
+        runtime = PlaybackRuntime()
+        thread = threading.Thread(target=player.play, args=(macro, runtime))
+        thread.start()
+        time.sleep(0.1)
+        self.assertTrue(player.snapshot().running)
+        runtime.stop()
+        thread.join(1.0)
+        self.assertGreater(player.snapshot().iterations, 3)
+
+    def test_script_speed_and_repeat(self):
+        sink = RecordingInputBackend(capacity=100)
+        player = MacroPlayer(sink)
+        player.speed = 20.0
+        player.repeat = 2
+        start = time.perf_counter()
+        self.assertTrue(player.run_script("import time\nmouse.click()\ntime.sleep(1.0)\n"))
+        self.assertLess(time.perf_counter() - start, 0.5)
+        self.assertEqual(len(sink.press_times()), 2)
+
+class TestCodeCache(unittest.TestCase):
+    def test_memory_and_disk_layers(self):
+        macro = Macro()
+        macro.append(OP_CLICK, 1, 10, 20, 0.0)
+        macro.append(OP_CLICK, 2, 10, 20, 0.5)
+        straight = macro.to_source()
+        script = "for _ in range(2):\n    mouse.click()\n"
+        with tempfile.TemporaryDirectory() as directory:
+            cache = CodeCache(directory, capacity=1)
+            entry = cache.get(straight)
+            self.assertIsInstance(entry, Macro)
+            self.assertEqual(entry.to_bytes(), macro.to_bytes())
+            self.assertIs(cache.get(straight), entry)
+            code = cache.get(script) # evicts the macro from memory
+            self.assertEqual(cache.stats()['misses'], 2)
+
+            # A fresh cache (e.g. after a restart) reads both back from disk
+            cache = CodeCache(directory)
+            self.assertEqual(cache.get(straight).to_bytes(), macro.to_bytes())
+            self.assertEqual(cache.get(script).co_code, code.co_code)
+            self.assertEqual(cache.stats()['disk_hits'], 2)
+            self.assertEqual(cache.stats()['misses'], 0)
+
+            sink = RecordingInputBackend(capacity=100)
+            self.assertTrue(MacroPlayer(sink).run_script(cache.get(script)))
+            self.assertEqual(len(sink.press_times()), 2)
+
+    def test_corrupt_entry_is_rebuilt(self):
+        with tempfile.TemporaryDirectory() as directory:
+            CodeCache(directory).get("x = 1\n")
+            for name in os.listdir(directory):
+                with open(os.path.join(directory, name), 'wb') as f:
+                    f.write(b'garbage')
+            cache = CodeCache(directory)
+            cache.get("x = 1\n")
+            self.assertEqual(cache.stats()['misses'], 1)
+
+class TestMacroLibrary(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.TemporaryDirectory()
+        self.library = MacroLibrary(os.path.join(self.dir.name, "library.db"))
+
+    def tearDown(self):
+        self.library.close()
+        self.dir.cleanup()
+
+    def test_save_search_and_load(self):
+        macro = Macro()
+        macro.append(OP_CLICK, 1, 10, 20, 0.0)
+        macro.append(OP_CLICK, 2, 10, 20, 1.5)
+        buf = ColumnBuffer(4)
+        buf.put(EVENT_MOVE, 0, 10, 20, 5.0)
+        buf.put(EVENT_DOWN, 1, 10, 20, 5.1)
+        raw = tempfile.TemporaryFile()
+        buf.write_to(raw)
+        raw.seek(0)
+        farm = self.library.save("Farm loop", macro.to_source(), macro, raw.read(), tags=["game", "daily"])
+        self.library.save("farm_b", "while True: pass\n", tags=["game"])
+        self.library.save("Login", "mouse.click()\n", hotkey="F6")
+
+        self.assertEqual([e.name for e in self.library.search("FARM")], ["Farm loop", "farm_b"])
+        self.assertEqual([e.name for e in self.library.search(tag="daily")], ["Farm loop"])
+        self.assertEqual([e.name for e in self.library.search("farm_")], ["farm_b"]) # _ is literal
+        entry = self.library.search("Farm l")[0]
+        self.assertEqual((entry.op_count, entry.duration, set(entry.tags)), (2, 1.5, {"game", "daily"}))
+        self.assertEqual(dict(self.library.tags()), {"daily": 1, "game": 2})
+
+        self.assertEqual(self.library.load_source(farm), macro.to_source())
+        self.assertEqual(self.library.load_macro(farm).to_bytes(), macro.to_bytes())
+        self.assertEqual(list(self.library.iter_raw(farm)), [(EVENT_MOVE, 0, 10, 20, 5.0), (EVENT_DOWN, 1, 10, 20, 5.1)])
+        self.assertIsNone(self.library.load_macro(entry.id + 1))
+
+        # Streaming doesn't hold the shared connection: a save meanwhile leaves it intact
+        events = self.library.iter_raw(farm)
+        self.assertEqual(next(events)[4], 5.0)
+        self.library.save("Farm loop", macro.to_source(), macro, None)
+        self.assertEqual(list(events), [(EVENT_DOWN, 1, 10, 20, 5.1)])
+        self.assertEqual(list(self.library.iter_raw(farm)), [])
+
+        # Saving again under the same name replaces body and tags
+        self.library.save("farm loop", "pass\n", tags=["x"])
+        self.assertEqual(self.library.count(), 3)
+        self.assertEqual(self.library.search(tag="x")[0].id, farm)
+
+    def test_hotkeys_and_delete(self):
+        a = self.library.save("a", "pass\n", hotkey="F6")
+        b = self.library.save("b", "pass\n")
+        self.library.set_hotkey(b, "F6")
+        self.assertEqual(self.library.bindings(), {"F6": b})
+        self.library.delete(b)
+        self.assertEqual(self.library.bindings(), {})
+        self.assertEqual([e.id for e in self.library.search()], [a])
+        with self.assertRaises(KeyError):
+            self.library.load_source(b)
+
+    def test_listing_uses_indexes(self):
+        conn = self.library._conn
+        plan = " ".join(str(row) for row in conn.execute(
+            "EXPLAIN QUERY PLAN SELECT id FROM macros WHERE name LIKE 'ab%' ESCAPE '\\'"))
+        self.assertIn("USING", plan)
+        plan = " ".join(str(row) for row in conn.execute(
+            "EXPLAIN QUERY PLAN SELECT macro_id FROM tags WHERE tag = 'x'"))
+        self.assertIn("PRIMARY KEY", plan)
+
+    def test_creates_missing_directory(self):
+        # A fresh HOME has no app-data folder yet
+        path = os.path.join(self.dir.name, "fresh", "AutoScriptPro", "library.db")
+        library = MacroLibrary(path)
+        try:
+            library.save("Login", "pass\n")
+            self.assertEqual(library.count(), 1)
+        finally:
+            library.close()
+        self.assertTrue(os.path.exists(path))
+
+class TestStartupTrace(unittest.TestCase):
+    def test_stages_and_budget(self):
+        trace = StartupTrace(budget_ms=10000)
+        with trace.stage("imports"):
+            time.sleep(0.01)
+        with trace.stage("window"):
+            pass
+        self.assertEqual([label for label, _ in trace.stages], ["imports", "window"])
+        self.assertGreaterEqual(trace.stages[0][1], 9)
+        self.assertFalse(trace.over_budget()) # not painted yet
+        trace.mark_first_paint()
+        self.assertFalse(trace.over_budget())
+        self.assertIn("time to first paint", trace.report())
+        trace.budget_ms = 0
+        self.assertTrue(trace.over_budget())
+        self.assertIn("OVER BUDGET", trace.report())
+
+    def test_enabled_by_flag(self):
+        with mock.patch.dict(os.environ, {"AUTOSCRIPT_TRACE_STARTUP": ""}):
+            self.assertFalse(trace_enabled(["main.py"]))
+            self.assertTrue(trace_enabled(["main.py", "--trace-startup"]))
+
+class TestCli(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.dir.cleanup()
+
+    def path(self, name):
+        return os.path.join(self.dir.name, name)
+
+    def test_convert_raw_to_both_formats(self):
+        with open(self.path("rec.raw"), "w+b") as f:
+            writer = RawWriter(f)
+            writer.write_events([(EVENT_MOVE, 0, 10, 10, 1.0), (EVENT_MOVE, 0, 100, 100, 1.1),
+                                 (EVENT_DOWN, BUTTON_CODES['left'], 100, 100, 1.2),
+                                 (EVENT_UP, BUTTON_CODES['left'], 100, 100, 1.25)])
+            writer.finish()
+        self.assertEqual(cli.main(["convert", self.path("rec.raw"), self.path("rec.py")]), 0)
+        self.assertEqual(cli.main(["convert", self.path("rec.raw"), self.path("rec.aspm")]), 0)
+        source_macro = cli.load_playable(self.path("rec.py"), CodeCache())
+        binary_macro = cli.load_playable(self.path("rec.aspm"))
+        # The .py export only keeps relative timing
+        self.assertEqual(list(source_macro.ops), list(binary_macro.ops))
+        self.assertEqual(list(source_macro.xs), list(binary_macro.xs))
+        for a, b in zip(source_macro.times, binary_macro.times):
+            self.assertAlmostEqual(a, b, places=3)
+        self.assertEqual(list(binary_macro.ops), [OP_MOVE, OP_MOVE, OP_CLICK])
+
+    def test_daemon_plays_last_recording(self):
+        args = cli.build_parser().parse_args(["daemon", "--no-library", "--repeat", "0"])
+        daemon = cli.Daemon(args, backend=NullInputBackend())
+        macro = Macro()
+        macro.append(OP_CLICK, 1, 0, 0, 0.0)
+        macro.append(OP_CLICK, 1, 0, 0, 0.01)
+        daemon.macro = macro
+        daemon.toggle_playback()
+        time.sleep(0.05)
+        self.assertTrue(daemon.player.snapshot().running)
+        daemon.toggle_playback() # second press stops the loop
+        time.sleep(0.05)
+        self.assertFalse(daemon.player.snapshot().running)
+        self.assertGreater(daemon.player.snapshot().iterations, 0)
+
+    def test_play_many_in_parallel(self):
+        for name in ("a.aspm", "b.aspm"):
+            macro = Macro()
+            macro.append(OP_CLICK, 1, 0, 0, 0.0)
+            macro.append(OP_CLICK, 1, 0, 0, 0.01)
+            macro.save(self.path(name))
+        sink = RecordingInputBackend(capacity=100)
+        with mock.patch.object(cli, 'default_backend', return_value=sink):
+            self.assertEqual(cli.main(["play", self.path("a.aspm"), self.path("b.aspm"), "--stop-key", ""]), 0)
+        self.assertEqual(len(sink.press_times()), 4)
+
+    def test_no_gui_imports(self):
+        # `keyboard` too: it's only loaded by the commands that hook it
+        import subprocess
+        code = ("import sys, cli; "
+                "print(sorted(m for m in ('tkinter', 'customtkinter', 'PIL', 'main', 'keyboard') "
+                "if m in sys.modules))")
+        out = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True,
+                             cwd=os.path.dirname(os.path.abspath(__file__)))
+        self.assertEqual(out.stdout.strip(), "[]")
+
+class TestRawFormat(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.dir.name, "rec.raw")
+        self.events = [(EVENT_MOVE, 0, i, -i, i * 0.01) for i in range(1000)]
+
+    def tearDown(self):
+        self.dir.cleanup()
+
+    def write(self, finish=True):
+        with open(self.path, "w+b") as f:
+            writer = RawWriter(f, index_every=64)
+            writer.write_events(self.events[:300])
+            writer.write_events(self.events[300:])
+            if finish:
+                writer.finish()
+        return writer
+
+    def test_mmap_reads_and_seek(self):
+        self.assertEqual(len(self.write().index), 16)
+        with RawRecording(self.path) as rec:
+            self.assertEqual(len(rec), 1000)
+            self.assertEqual(rec[-1], self.events[-1])
+            self.assertEqual(list(rec), self.events)
+            self.assertEqual(list(rec.iter_from(998)), self.events[998:])
+            for t, expected in ((0.0, 0), (3.205, 321), (6.4, 640), (99.0, 1000)):
+                self.assertEqual(rec.find_time(t), expected)
+            # The index is little-endian on disk, like the records
+            import struct
+            with open(self.path, "rb") as f:
+                tail = f.read()[-16 * 8:]
+            self.assertEqual(list(struct.unpack('<16d', tail)), list(rec.index))
+            self.assertEqual(rec.index[1], self.events[64][4])
+        with open(self.path, "rb") as f:
+            self.assertEqual(list(iter_records(f)), self.events)
+
+    def test_unfinished_file_is_readable(self):
+        self.write(finish=False)
+        with RawRecording(self.path) as rec:
+            self.assertIsNone(rec.index)
+            self.assertEqual(len(rec), 1000)
+            self.assertEqual(rec.find_time(3.205), 321)
+        with open(self.path, "rb") as f:
+            self.assertEqual(len(list(iter_records(f))), 1000)
+
+class TestBatchConvert(unittest.TestCase):
+    def test_pool_converts_every_recording(self):
+        with tempfile.TemporaryDirectory() as d:
+            for n in range(3):
+                buf = ColumnBuffer(16)
+                buf.put(EVENT_MOVE, 0, 10 * n, 10, 1.0)
+                buf.put(EVENT_DOWN, BUTTON_CODES['left'], 10 * n, 10, 1.2)
+                buf.put(EVENT_UP, BUTTON_CODES['left'], 10 * n, 10, 1.25)
+                with open(os.path.join(d, f"rec{n}.raw"), "wb") as f:
+                    buf.write_to(f)
+            with open(os.path.join(d, "broken.raw"), "wb") as f:
+                f.write(b"\xff\xff\xff\x7f")
+            progress = []
+            out = os.path.join(d, "out")
+            results = batch_convert(find_recordings(d), out, ".aspm", workers=2,
+                                    on_result=lambda done, total, r: progress.append((done, total)))
+            self.assertEqual(progress, [(1, 4), (2, 4), (3, 4), (4, 4)])
+            by_name = {os.path.basename(r.raw_path): r for r in results}
+            self.assertIsNotNone(by_name["broken.raw"].error)
+            for n in range(3):
+                macro = Macro.load(by_name[f"rec{n}.raw"].output_path)
+                self.assertEqual((list(macro.ops), list(macro.xs)), ([OP_MOVE, OP_CLICK], [10 * n] * 2))
+
+class TestBenchmarks(unittest.TestCase):
+    def test_generators_are_deterministic_and_ordered(self):
+        for gen in benchmarks.SCENARIOS.values():
+            events = list(gen(0.01))
+            self.assertEqual(events, list(gen(0.01)))
+            times = [ev[4] for ev in events]
+            self.assertEqual(times, sorted(times))
+
+    def test_regression_threshold(self):
+        fast = benchmarks.Metric("x", 70.0, "ev/s", "higher", 0)
+        self.assertAlmostEqual(benchmarks.regression(fast, 100.0, 0.25), 0.3)
+        self.assertIsNone(benchmarks.regression(fast, 90.0, 0.25))
+        # Tiny baselines are judged against the floor, not their own size
+        error = benchmarks.Metric("err", 0.5, "%", "lower", 1.0)
+        self.assertIsNone(benchmarks.regression(error, 0.1, 0.5))
+        self.assertIsNotNone(benchmarks.regression(error._replace(value=2.0), 0.1, 0.5))
+        baseline = {"metrics": {"x": {"value": 100.0}, "err": {"value": 0.1}}}
+        self.assertEqual([m.name for m, _, _ in benchmarks.compare([fast, error], baseline, 0.25)], ["x", "err"])
+
+    def test_clicker_rate(self):
+        # Rate measured over the click span, so start-up and join latency don't count
+        run = benchmarks.clicker_run(50, 0.5)
+        self.assertLess(run['rate_error_pct'], 10)
+
+    def test_missing_baseline_fails(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "baseline.json")
+            args = ["--only", "highlighter", "--quick", "--baseline", path]
+            with mock.patch('sys.stdout'):
+                self.assertEqual(benchmarks.main(args), 1)
+                self.assertFalse(os.path.exists(path))
+                self.assertEqual(benchmarks.main(args + ["--update-baseline"]), 0)
+                self.assertEqual(benchmarks.main(args + ["--threshold", "100"]), 0)
+
+class TestHotkeyDispatcher(unittest.TestCase):
+    def test_commands_run_in_order_off_the_posting_thread(self):
+        dispatcher = HotkeyDispatcher()
+        ran = []
+        dispatcher.register("a", lambda *args: ran.append(("a", args, threading.current_thread())))
+        dispatcher.register("b", lambda: time.sleep(0.01))
+        dispatcher.register("bad", lambda: 1 / 0)
+        dispatcher.start()
+        callback = dispatcher.hotkey("a", 7)
+        callback()
+        dispatcher.post("b")
+        dispatcher.post("bad")
+        dispatcher.post("unknown") # no handler: counted, the thread keeps going
+        callback()
+        dispatcher.stop()
+
+        self.assertEqual([(name, args) for name, args, _ in ran], [("a", (7,)), ("a", (7,))])
+        self.assertNotIn(threading.current_thread(), [thread for _, _, thread in ran])
+        self.assertEqual(dispatcher.errors, 2)
+        report = dispatcher.latency_report()
+        self.assertEqual(report["a"]["count"], 2)
+        self.assertGreaterEqual(report["b"]["p50_us"], 9000)
+        # The second "a" waited behind "b"
+        self.assertGreater(report["a"]["max_us"], 9000)
+        self.assertIn("bad", dispatcher.format_report())
+        self.assertNotIn("unknown", dispatcher.latency_report())
+
+    def test_deferred_latency(self):
+        # The handler hands off to another thread; latency runs until that one records it
+        dispatcher = HotkeyDispatcher()
+        done = threading.Event()
+
+        def finish(posted):
+            time.sleep(0.02)
+            dispatcher.record("play", posted)
+            done.set()
+
+        def play():
+            threading.Thread(target=finish, args=(dispatcher.posted,)).start()
+            return DEFERRED
+
+        dispatcher.register("play", play)
+        dispatcher.start()
+        dispatcher.post("play")
+        self.assertTrue(done.wait(1.0))
+        dispatcher.stop()
+        report = dispatcher.latency_report()["play"]
+        self.assertEqual(report["count"], 1)
+        self.assertGreaterEqual(report["p50_us"], 19000)
+
+class TestAsyncPlayback(unittest.TestCase):
+    def setUp(self):
+        self.sink = RecordingInputBackend(capacity=10000)
+        self.player = AsyncMacroPlayer(self.sink)
+        self.player.start()
+
+    def tearDown(self):
+        self.player.stop()
+
+    def _clicks(self, n, interval, x=5):
+        macro = Macro()
+        for i in range(n):
+            macro.append(OP_CLICK, 1, x, 5, i * interval)
+        return macro
+
+    def test_concurrent_macros_on_one_thread(self):
+        threads = threading.active_count()
+        tasks = [self.player.add(self._clicks(20, 0.005, x=k)) for k in range(30)]
+        self.assertEqual(threading.active_count(), threads)
+        self.assertTrue(self.player.wait(5.0))
+        self.assertTrue(all(task.state == 'done' and task.ops_done == 20 for task in tasks))
+        self.assertEqual(len(self.sink.press_times()), 600)
+        report = self.player.report()
+        self.assertEqual(report['injected'], 600)
+        # Clicks due together leave the output queue as one send_batch
+        self.assertGreater(report['ops_per_batch'], 1.5)
+        self.assertLess(report['lateness_p50_us'], 20000)
+
+    def test_pause_resume_cancel(self):
+        paused = self.player.add(self._clicks(10, 0.02))
+        cancelled = self.player.add(self._clicks(10, 0.02), repeat=0)
+        time.sleep(0.05)
+        paused.pause()
+        time.sleep(0.1)
+        done_while_paused = paused.ops_done
+        time.sleep(0.05)
+        self.assertEqual(paused.ops_done, done_while_paused)
+        paused.resume()
+        cancelled.cancel()
+        self.assertTrue(self.player.wait(2.0))
+        self.assertEqual((paused.state, paused.ops_done), ('done', 10))
+        self.assertEqual(cancelled.state, 'cancelled')
+        # The pause shifted the rest of the macro instead of bunching it up
+        self.assertGreater(paused.snapshot().elapsed, 0.18 + 0.1)
+        self.assertLess(paused.lateness.max, 0.05)
+
+    def test_key_ops(self):
+        macro = Macro()
+        macro.append(OP_KEY_PRESS, KEY_CODES['a'], 0, 0, 0.0)
+        macro.append(OP_CLICK, 1, 7, 8, 0.01)
+        macro.append(OP_KEY_RELEASE, KEY_CODES['a'], 0, 0, 0.02)
+        self.player.add(macro).wait(2.0)
+        self.assertEqual([ev[:3] for ev in self.sink.events()],
+                         [(EVENT_KEY_DOWN, KEY_CODES['a'], 0), (EVENT_MOVE, 0, 7), (EVENT_DOWN, 1, 7),
+                          (EVENT_UP, 1, 7), (EVENT_KEY_UP, KEY_CODES['a'], 0)])
+
+class TestRateControl(unittest.TestCase):
+    def _simulate(self, controller, target, plant, seconds=20.0, dt=0.005):
+        # plant(aimed_cps, burst) -> the rate the loop really achieves
+        now, clicks = 0.0, 0.0
+        while now < seconds:
+            clicks += plant(target * controller.correction, controller.burst) * dt
+            now += dt
+            controller.update(now, int(clicks), target)
+        return controller.state()
+
+    def test_steady_shortfall_is_removed(self):
+        state = self._simulate(RateController(tolerance=0.02), 500, lambda aimed, burst: aimed * 0.8)
+        self.assertTrue(state.within_tolerance)
+        self.assertAlmostEqual(state.correction, 1.25, delta=0.03)
+        self.assertEqual(state.burst, 1)
+
+    def test_overhead_bound_raises_burst(self):
+        # One injection can't happen more than 150 times a second, whatever the schedule asks for
+        plant = lambda aimed, burst: min(aimed, 150 * burst)
+        state = self._simulate(RateController(tolerance=0.02), 200, plant)
+        self.assertTrue(state.within_tolerance)
+        self.assertEqual(state.burst, 2)
+        state = self._simulate(RateController(tolerance=0.02, allow_burst=False), 200, plant)
+        self.assertFalse(state.within_tolerance)
+        self.assertTrue(state.saturated)
+
+    def test_clicker_holds_rate_with_slow_injection(self):
+        class SlowBackend(RecordingInputBackend):
+            # Every injection call stalls for 6 ms: at most ~166 wake-ups a second
+            def _stall(self):
+                end = time.perf_counter() + 0.006
+                while time.perf_counter() < end:
+                    pass
+            def click(self, button='left'):
+                self._stall()
+                super().click(button)
+            def click_burst(self, button='left', count=1):
+                self._stall()
+                for _ in range(count):
+                    RecordingInputBackend.click(self, button)
+
+        sink = SlowBackend()
+        clicker = HighResClicker(sink)
+        clicker.cps = 200
+        clicker.limit_mode = 'time'
+        clicker.limit_value = 3.0
+        clicker.rate_control = True
+        clicker.start()
+        clicker.thread.join()
+        times = sink.press_times()
+        last_second = [t for t in times if t > times[-1] - 1.0]
+        self.assertAlmostEqual(len(last_second), 200, delta=12)
+        state = clicker.controller_state()
+        self.assertGreaterEqual(state.burst, 2)
+        self.assertGreater(state.updates, 0)
+
+class TestStreamingRecorder(unittest.TestCase):
+    def _moves(self, points, t0=1000.0):
+        return [mouse.MoveEvent(x, y, t0 + i * 0.01) for i, (x, y) in enumerate(points)]
+
+    def test_move_filter(self):
+        events = [(0, 0, 0, 0, 1.0), (0, 0, 2, 2, 1.1), (0, 0, 9, 0, 1.2),
+                  (0, 0, 10, 1, 1.3), (1, 1, 10, 1, 1.4), (0, 0, 11, 1, 1.5)]
+        kept = [ev[4] for ev in filter_events(events)]
+        # first move, far move, move right before the button, the button
+        self.assertEqual(kept, [1.0, 1.2, 1.3, 1.4])
+
+    def test_recorder_spills_chunks(self):
+        rec = StreamingRecorder(chunk_events=8, path_tolerance=None, keyboard=False)
+        with mock.patch.object(recorder.mouse, 'hook'), mock.patch.object(recorder.mouse, 'unhook'):
+            rec.start(initial_pos=(0, 0))
+            t0 = time.time() + 60 # the initial position is stamped with the wall clock
+            for e in self._moves([(i * 3, 0) for i in range(1, 50)], t0=t0):
+                rec._on_event(e)
+            rec._on_event(mouse.ButtonEvent('down', 'left', t0 + 1.0))
+            rec._on_event(mouse.ButtonEvent('up', 'left', t0 + 1.1))
+            rec.stop()
+
+        self.assertEqual(rec.raw_count, 52)
+        self.assertEqual(len(list(rec.iter_raw())), 52)
+        filtered = [to_mouse_event(ev) for ev in rec.iter_filtered()]
+        self.assertEqual(len(filtered), rec.filtered_count)
+        # 3 px steps: every other move survives, plus the move before the click
+        self.assertEqual(filtered[-2], mouse.ButtonEvent('down', 'left', t0 + 1.0))
+        self.assertEqual((filtered[-3].x, filtered[-3].y), (147, 0))
+        self.assertLess(len(filtered), 30)
+
+        # A hook callback that was already running when stop() unhooked is dropped
+        rec._on_event(mouse.MoveEvent(500, 0, t0 + 1.2))
+        self.assertEqual(len(list(rec.iter_raw())), 52)
+        rec.close()
+
+    def test_recorder_merges_keyboard(self):
+        rec = StreamingRecorder(chunk_events=4, path_tolerance=None, ignore_keys=('ctrl+F9',))
+        with mock.patch.object(recorder.mouse, 'hook'), mock.patch.object(recorder.mouse, 'unhook'), \
+                mock.patch.object(keyboard, 'hook'), mock.patch.object(keyboard, 'unhook'):
+            rec.start()
+            # Each device delivers in time order; the two streams interleave.
+            # Stamped ahead of the wall clock, so nothing is merged until stop()
+            t0 = time.time() + 60
+            for e in self._moves([(i * 20, 0) for i in range(1, 30)], t0=t0):
+                rec._on_event(e)
+            for i, name in enumerate("hello"):
+                t = t0 + 0.005 + i * 0.05
+                rec._on_key(keyboard.KeyboardEvent('down', 35 + i, name=name, time=t))
+                rec._on_key(keyboard.KeyboardEvent('up', 35 + i, name=name, time=t + 0.02))
+            rec._on_key(keyboard.KeyboardEvent('down', 67, name='f9', time=t0 + 0.3))
+            rec.stop()
+
+        raw = list(rec.iter_raw())
+        self.assertEqual(rec.raw_count, 39)
+        self.assertEqual(len(raw), 39)
+        self.assertEqual([ev[4] for ev in raw], sorted(ev[4] for ev in raw))
+        keys = [ev for ev in rec.iter_filtered() if ev[0] in (EVENT_KEY_DOWN, EVENT_KEY_UP)]
+        self.assertEqual(len(keys), 10)
+        self.assertEqual((keys[0][1], keys[0][2]), (KEY_CODES['h'], 35))
+        code = events_to_code(rec.iter_filtered())
+        self.assertEqual([line.strip() for line in code.splitlines() if "keyboard.press" in line],
+                         [f"keyboard.press('{c}')" for c in "hello"])
+        rec.close()
+
+    def test_recorder_merges_live(self):
+        rec = StreamingRecorder(path_tolerance=None)
+        with mock.patch.object(recorder.mouse, 'hook'), mock.patch.object(recorder.mouse, 'unhook'), \
+                mock.patch.object(keyboard, 'hook'), mock.patch.object(keyboard, 'unhook'):
+            rec.start()
+            # One key press, then the keyboard goes idle with a partial buffer
+            t0 = time.time() - 1.0
+            rec._on_key(keyboard.KeyboardEvent('down', 30, name='a', time=t0))
+            for e in self._moves([(i * 20, 0) for i in range(1, 100)], t0=t0 + 0.001):
+                rec._on_event(e)
+            # Neither buffer is full, yet both are merged and filtered during capture
+            deadline = time.time() + 2.0
+            while rec.filtered_count < 99 and time.time() < deadline:
+                time.sleep(0.02)
+            self.assertGreaterEqual(rec.filtered_count, 99) # the last move waits for look-ahead
+            self.assertEqual(sum(map(len, rec._pending)), 0)
+            rec._on_event(mouse.ButtonEvent('down', 'left', time.time()))
+            rec.stop()
+
+        raw = list(rec.iter_raw())
+        self.assertEqual(len(raw), 101)
+        self.assertEqual(raw[0][0], EVENT_KEY_DOWN)
+        self.assertEqual([ev[4] for ev in raw], sorted(ev[4] for ev in raw))
+        self.assertEqual(rec.filtered_count, 101)
+        rec.close()
+
+class TestPathSimplify(unittest.TestCase):
+    def test_straight_drag_collapses(self):
+        xs = [float(i) for i in range(1000)]
+        ts = [i * 0.001 for i in range(1000)]
+        self.assertEqual(simplify_run(xs, [0.0] * 1000, ts), [0, 999])
+
+    def test_curve_within_tolerance(self):
+        import math
+        moves = [(0, 0, int(300 + 200 * math.cos(a / 100)), int(300 + 200 * math.sin(a / 100)), a * 0.002)
+                 for a in range(628)]
+        kept = list(process_events(moves, PathSimplifier(tolerance=2.0, time_tolerance=1.0)))
+        self.assertLess(len(kept), len(moves) // 5)
+        self.assertLessEqual(max_deviation(moves, kept), 2.0)
+
+    def test_pause_and_button_anchor(self):
+        # Straight line with a 0.5 s pause half way, then a click
+        moves = [(0, 0, i, 0, i * 0.01) for i in range(50)]
+        moves += [(0, 0, 50 + i, 0, 1.0 + i * 0.01) for i in range(50)]
+        events = moves + [(1, 1, 99, 0, 2.0), (0, 0, 200, 0, 2.1), (0, 0, 300, 0, 2.2)]
+        kept = list(process_events(events, PathSimplifier(tolerance=3.0, time_tolerance=0.05)))
+        kept_times = [ev[4] for ev in kept]
+        self.assertIn(0.49, kept_times) # pause start
+        self.assertIn(1.0, kept_times) # pause end
+        self.assertEqual(kept[kept.index((1, 1, 99, 0, 2.0)) - 1], moves[-1])
+        self.assertEqual(kept[-1][4], 2.2)
+
+    def test_max_run_is_bounded(self):
+        simplifier = PathSimplifier(max_run=100)
+        out = []
+        for i in range(1000):
+            simplifier.feed((0, 0, i, 0, i * 0.001), out)
+            self.assertLessEqual(len(simplifier.run), 100)
+        simplifier.flush(out)
+        self.assertEqual(out[0][2], 0)
+        self.assertEqual(out[-1][2], 999)
+        self.assertEqual(len(out), len(set(out)))
+
+    def test_keys_do_not_split_a_drag(self):
+        from recorder import make_pipeline
+        a = KEY_CODES['a']
+        drag = [(EVENT_MOVE, 0, i, 0, i * 0.001) for i in range(300)]
+        drag.append((EVENT_UP, 1, 299, 0, 0.3))
+        mixed = []
+        for ev in drag:
+            mixed.append(ev)
+            if ev[0] == EVENT_MOVE and ev[2] % 10 == 5:
+                t = ev[4] + 0.0005
+                mixed.append((EVENT_KEY_DOWN if ev[2] % 20 == 5 else EVENT_KEY_UP, a, 30, 0, t))
+        plain = list(process_events(drag, make_pipeline()))
+        kept = list(process_events(mixed, make_pipeline()))
+        self.assertEqual([ev for ev in kept if ev[0] not in (EVENT_KEY_DOWN, EVENT_KEY_UP)], plain)
+        self.assertEqual(len(plain), 3) # drag end points and the release
+        self.assertEqual(len(kept) - len(plain), 30)
+        self.assertEqual(kept, sorted(kept, key=lambda ev: ev[4]))
+
+        # Same when the run is cut at max_run
+        simplifier = PathSimplifier(max_run=16)
+        kept = list(process_events(mixed, simplifier))
+        self.assertEqual(len([ev for ev in kept if ev[0] in (EVENT_KEY_DOWN, EVENT_KEY_UP)]), 30)
+        self.assertEqual(kept, sorted(kept, key=lambda ev: ev[4]))
+
+class FakeText:
+    """ The slice of the tk.Text API the highlighter uses, with tags stored per line. """
+    def __init__(self, content):
+        self.lines = content.split("\n")
+        self.cursor = 1
+        self.modified = False
+        self.tags = {}
+        self.callbacks = {}
+        self.next_id = 0
+        self.top = 1
+        self.visible = 1000
+        self.bound = []
+
+    def bind(self, sequence, func, add=None): self.bound.append(sequence)
+    def tag_config(self, name, **kwargs): pass
+    def winfo_height(self): return 400
+
+    def index(self, index):
+        if index == "insert":
+            return f"{self.cursor}.0"
+        if index == "@0,0":
+            return f"{self.top}.0"
+        if index.startswith("@"):
+            return f"{min(len(self.lines), self.top + self.visible - 1)}.0"
+        return f"{len(self.lines)}.{len(self.lines[-1])}"
+
+    def get(self, start, end):
+        return "\n".join(self.lines[int(start.split(".")[0]) - 1:int(end.split(".")[0])])
+
+    def tag_remove(self, tag, start, end):
+        last = len(self.lines) if end == "end" else int(end.split(".")[0])
+        for line in range(int(start.split(".")[0]), last + 1):
+            self.tags[line] = {span for span in self.tags.get(line, ()) if span[0] != tag}
+
+    def tag_add(self, tag, *indices):
+        for a, b in zip(indices[::2], indices[1::2]):
+            line, col = a.split(".")
+            self.tags.setdefault(int(line), set()).add((tag, int(col), int(b.split(".")[1])))
+
+    def edit_modified(self, flag=None):
+        if flag is None:
+            return self.modified
+        self.modified = flag
+
+    def after(self, ms, func):
+        self.next_id += 1
+        self.callbacks[self.next_id] = func
+        return self.next_id
+
+    def after_cancel(self, after_id):
+        self.callbacks.pop(after_id, None)
+
+    def run(self):
+        while self.callbacks:
+            after_id = min(self.callbacks)
+            self.callbacks.pop(after_id)()
+            time.sleep(0.001)
+
+    def edit(self, line, new_lines):
+        """ Replaces `line` with `new_lines` and leaves the cursor after them, like typing would. """
+        self.lines[line - 1:line] = new_lines
+        self.cursor = line + len(new_lines) - 1
+        self.modified = True
+
+class TestHighlighter(unittest.TestCase):
+    def expected(self, lines):
+        spans, _ = tokenize_lines(lines)
+        return {i: set(s) for i, s in enumerate(spans, 1) if s}
+
+    def painted(self, text):
+        return {line: spans for line, spans in text.tags.items() if spans}
+
+    def test_tokenize_line(self):
+        spans, state = tokenize_line("mouse.click(button='left') # 2 clicks")
+        self.assertEqual(spans, [("function", 0, 5), ("function", 6, 11), ("string", 19, 25), ("comment", 27, 37)])
+        self.assertIsNone(state)
+        spans, state = tokenize_line("x = '''open", None)
+        self.assertEqual(state, "'''")
+        spans, state = tokenize_line("still # string''' + 3", state)
+        self.assertEqual(spans, [("string", 0, 17), ("number", 20, 21)])
+        self.assertIsNone(state)
+
+    def test_incremental_matches_full(self):
+        lines = [f"mouse.move({i}, {i})" if i % 3 else f"time.sleep(0.{i})" for i in range(50)]
+        text = FakeText("\n".join(lines))
+        hl = SyntaxHighlighter(text, chunk_lines=16, viewport_poll_ms=None)
+        hl.highlight()
+        text.run()
+        self.assertEqual(self.painted(text), self.expected(text.lines))
+        self.assertIn("<<Modified>>", text.bound)
+
+        # Opening a triple-quoted string re-colors everything below it
+        text.edit(10, ['s = """', text.lines[9]])
+        hl._on_modified()
+        text.run()
+        self.assertEqual(self.painted(text), self.expected(text.lines))
+        self.assertEqual(len(hl.states), len(text.lines))
+
+        # Closing it again, and a single-line edit far away
+        text.edit(30, ['"""'])
+        hl._on_modified()
+        text.edit(45, ["import mouse"])
+        hl._on_modified()
+        text.run()
+        self.assertEqual(self.painted(text), self.expected(text.lines))
+
+        # A plain keystroke only re-tokenizes its own line
+        text.edit(5, ["mouse.click()"])
+        hl._on_modified()
+        self.assertEqual(hl.dirty, (5, 5))
+        text.run()
+        self.assertEqual(self.painted(text), self.expected(text.lines))
+
+    def test_paints_only_viewport(self):
+        lines = ["mouse.move(1, 2)"] * 5000
+        lines[10] = "'''"
+        lines[2990] = "''' # end"
+        text = FakeText("\n".join(lines))
+        text.visible = 30
+        hl = SyntaxHighlighter(text, chunk_lines=1000, viewport_poll_ms=None)
+        hl.highlight()
+        text.run()
+        expected = self.expected(text.lines)
+        painted = self.painted(text)
+        self.assertLessEqual(max(painted), 30 + 50)
+        self.assertEqual(painted, {k: v for k, v in expected.items() if k in painted})
+
+        # Scrolling paints the newly visible lines, using states computed for the whole buffer
+        text.top = 2980
+        hl.check_viewport()
+        text.run()
+        painted = self.painted(text)
+        for line in range(2980, 3010):
+            self.assertEqual(painted.get(line), expected.get(line))
+        self.assertNotIn(1500, painted)
 
 if __name__ == '__main__':
     unittest.main()
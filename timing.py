@@ -0,0 +1,108 @@
+import time
+import threading
+
+# --- Deadline Pacing ---
+# Strategies for waiting until an absolute perf_counter() deadline:
+#   sleep  - time.sleep() only. Cheapest, error bounded by the OS timer.
+#   hybrid - sleep most of the way, then busy-wait the last stretch. The
+#            spin stretch is capped by cpu_budget (fraction of each wait
+#            that may be spent spinning) and spin_window (absolute cap).
+#   spin   - busy-wait the whole time. Most accurate, costs a full core.
+# With a stop_event, sleeps block on the event instead of time.sleep() and
+# spins poll it, so setting it ends any wait immediately.
+STRATEGIES = ('sleep', 'hybrid', 'spin')
+
+class Pacer:
+    def __init__(self, strategy='hybrid', cpu_budget=0.05, spin_window=0.002, stop_event=None):
+        if strategy not in STRATEGIES:
+            raise ValueError(f"Unknown timing strategy: {strategy}")
+        self.strategy = strategy
+        self.cpu_budget = cpu_budget
+        self.spin_window = spin_window
+        self.stop_event = stop_event
+        self.reset()
+
+    def reset(self):
+        """ Clears the stats. Call from the thread that will be waiting. """
+        self.waits = 0
+        self.total_error = 0.0
+        self.max_error = 0.0
+        self.spin_time = 0.0
+        self._wall_start = time.perf_counter()
+        self._cpu_start = time.thread_time()
+        self._cpu_end = None
+        self._thread_id = threading.get_ident()
+
+    def finish(self):
+        """ Freezes the CPU measurement. Call from the waiting thread when done. """
+        self._cpu_end = time.thread_time()
+        self._wall_end = time.perf_counter()
+
+    def _sleep_until(self, deadline):
+        stop_event = self.stop_event
+        remaining = deadline - time.perf_counter()
+        if stop_event is None:
+            if remaining > 0:
+                time.sleep(remaining)
+            return
+        # Event.wait may round its timeout down, so re-wait until the deadline
+        while remaining > 0 and not stop_event.wait(remaining):
+            remaining = deadline - time.perf_counter()
+
+    def wait_until(self, deadline):
+        """ Blocks until `deadline`, returns how late we woke up (seconds). """
+        perf_counter = time.perf_counter
+        now = perf_counter()
+        remaining = deadline - now
+
+        if remaining > 0:
+            strategy = self.strategy
+            if strategy == 'sleep':
+                self._sleep_until(deadline)
+            else:
+                if strategy == 'hybrid':
+                    spin = min(self.spin_window, remaining * self.cpu_budget)
+                    if remaining > spin:
+                        self._sleep_until(deadline - spin)
+                spin_start = perf_counter()
+                stop_event = self.stop_event
+                if stop_event is not None:
+                    while perf_counter() < deadline and not stop_event.is_set():
+                        pass
+                else:
+                    while perf_counter() < deadline:
+                        pass
+                self.spin_time += perf_counter() - spin_start
+            now = perf_counter()
+
+        error = now - deadline
+        if error < 0:
+            error = 0.0
+        self.waits += 1
+        self.total_error += error
+        if error > self.max_error:
+            self.max_error = error
+        return error
+
+    def report(self):
+        """
+        CPU cost of waiting vs. the timing error it leaves. While still running,
+        cpu_fraction is only known when called from the waiting thread.
+        """
+        if self._cpu_end is None:
+            wall = time.perf_counter() - self._wall_start
+            if threading.get_ident() == self._thread_id:
+                cpu = time.thread_time() - self._cpu_start
+            else:
+                cpu = None
+        else:
+            cpu = self._cpu_end - self._cpu_start
+            wall = self._wall_end - self._wall_start
+        return {
+            'strategy': self.strategy,
+            'waits': self.waits,
+            'cpu_fraction': None if cpu is None else (cpu / wall if wall > 0 else 0.0),
+            'spin_fraction': self.spin_time / wall if wall > 0 else 0.0,
+            'mean_error_us': self.total_error / self.waits * 1e6 if self.waits else 0.0,
+            'max_error_us': self.max_error * 1e6,
+        }
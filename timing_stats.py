@@ -0,0 +1,131 @@
+import math
+from array import array
+
+# --- Fixed-memory timing statistics ---
+# Both classes preallocate everything up front; record() is a handful of
+# arithmetic ops and array stores so it can sit inside the click loop.
+
+class IntervalHistogram:
+    """
+    Log-bucketed histogram of durations in seconds. Each power of two is split
+    into `sub_buckets` linear slots, so the relative error of a percentile is
+    at most 1 / sub_buckets. Values outside [2**min_exp, 2**max_exp) are
+    clamped into the first/last bucket (min/max are still tracked exactly).
+    """
+    def __init__(self, min_exp=-20, max_exp=10, sub_buckets=16):
+        self.min_exp = min_exp
+        self.max_exp = max_exp
+        self.sub_buckets = sub_buckets
+        self.n_buckets = (max_exp - min_exp) * sub_buckets
+        self.reset()
+
+    def reset(self):
+        self.counts = array('Q', bytes(8 * self.n_buckets))
+        self.count = 0
+        self.total = 0.0
+        self.min = math.inf
+        self.max = 0.0
+
+    def _index(self, value):
+        if value <= 0.0:
+            return 0
+        mantissa, exp = math.frexp(value) # value = mantissa * 2**exp, 0.5 <= mantissa < 1
+        octave = exp - 1 - self.min_exp
+        if octave < 0:
+            return 0
+        index = octave * self.sub_buckets + int((mantissa * 2.0 - 1.0) * self.sub_buckets)
+        if index >= self.n_buckets:
+            return self.n_buckets - 1
+        return index
+
+    def _bucket_value(self, index):
+        # Midpoint of the bucket
+        octave, sub = divmod(index, self.sub_buckets)
+        low = math.ldexp(1.0 + sub / self.sub_buckets, octave + self.min_exp)
+        high = math.ldexp(1.0 + (sub + 1) / self.sub_buckets, octave + self.min_exp)
+        return (low + high) / 2.0
+
+    def record(self, value):
+        self.counts[self._index(value)] += 1
+        self.count += 1
+        self.total += value
+        if value < self.min:
+            self.min = value
+        if value > self.max:
+            self.max = value
+
+    def percentile(self, p):
+        """ Value at percentile `p` (0-100), 0.0 if empty. """
+        if self.count == 0:
+            return 0.0
+        target = max(1, math.ceil(self.count * p / 100.0))
+        seen = 0
+        counts = self.counts
+        for i in range(self.n_buckets):
+            seen += counts[i]
+            if seen >= target:
+                return min(max(self._bucket_value(i), self.min), self.max)
+        return self.max
+
+    def mean(self):
+        return self.total / self.count if self.count else 0.0
+
+    def merge(self, other):
+        """ Adds `other`'s samples (same bucket layout) into this histogram. """
+        counts = self.counts
+        for i, n in enumerate(other.counts):
+            if n:
+                counts[i] += n
+        self.count += other.count
+        self.total += other.total
+        self.min = min(self.min, other.min)
+        self.max = max(self.max, other.max)
+
+class RateWindow:
+    """
+    Achieved rate over a sliding time window, from a ring of
+    (timestamp, cumulative count) samples.
+    """
+    def __init__(self, window=1.0, capacity=4096):
+        self.window = window
+        self.capacity = capacity
+        self.times = array('d', [0.0]) * capacity
+        self.totals = array('Q', bytes(8 * capacity))
+        self.reset()
+
+    def reset(self):
+        self.pos = 0
+        self.filled = 0
+
+    def record(self, timestamp, total):
+        pos = self.pos
+        self.times[pos] = timestamp
+        self.totals[pos] = total
+        pos += 1
+        if pos == self.capacity:
+            pos = 0
+        self.pos = pos
+        if self.filled < self.capacity:
+            self.filled += 1
+
+    def rate(self, now=None):
+        """ Events/second over the last `window` seconds (or the ring's span if shorter). """
+        if self.filled < 2:
+            return 0.0
+        last = (self.pos - 1) % self.capacity
+        t_last = self.times[last]
+        if now is None:
+            now = t_last
+        cutoff = now - self.window
+        oldest = last
+        for step in range(1, self.filled):
+            i = (last - step) % self.capacity
+            if self.times[i] < cutoff:
+                break
+            oldest = i
+        if oldest == last:
+            return 0.0
+        span = t_last - self.times[oldest]
+        if span <= 0:
+            return 0.0
+        return (self.totals[last] - self.totals[oldest]) / span
@@ -23,5 +23,16 @@ def update_icons():
     except Exception as e:
         print(f"Failed to update icons: {e}")
 
+def build_icon_assets(size=32):
+    """
+    Writes icon_32.png, the window icon pre-sized so startup doesn't resize
+    it. Errors propagate: the build bundles this file and must stop here.
+    """
+    target = f"icon_{size}.png"
+    img = Image.open("icon.png")
+    img.resize((size, size), Image.Resampling.LANCZOS).save(target, format="PNG")
+    print(f"Updated {target}")
+
 if __name__ == "__main__":
     update_icons()
+    build_icon_assets()
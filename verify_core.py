@@ -1,9 +1,21 @@
 import time
+import threading
 from clicker_core import HighResClicker
+from multi_clicker import MultiStreamClicker, ClickStream
+from input_backend import RecordingInputBackend
+
+def sink_cps(sink):
+    # CPS measured from the timestamps of the injected events themselves
+    times = sink.press_times()
+    if len(times) < 2:
+        return 0.0
+    return (len(times) - 1) / (times[-1] - times[0])
 
 def test_clicker():
     print("Testing Clicker Core...")
-    clicker = HighResClicker()
+    # Recording sink: measures the real loop without clicking on the desktop
+    sink = RecordingInputBackend()
+    clicker = HighResClicker(sink)
     
     # Test 1: Count Limit
     print("Test 1: 100 clicks at 50 CPS")
@@ -26,9 +38,8 @@ def test_clicker():
         print(f"FAIL: Expected 100 clicks, got {clicker.total_clicks}")
 
     # Test 2: High Speed (simulated)
-    # Note: We can't easily verify actual clicks without a hook, 
-    # but we can verify the loop speed.
     print("\nTest 2: High Speed Loop (500 CPS) for 2 seconds")
+    sink.clear()
     clicker.cps = 500
     clicker.limit_mode = 'time'
     clicker.limit_value = 2.0
@@ -41,6 +52,76 @@ def test_clicker():
     duration = end - start
     print(f"Done. {clicker.total_clicks} clicks in {duration:.4f}s")
     print(f"Actual CPS: {clicker.total_clicks / duration:.2f}")
+    print(f"Sink CPS: {sink_cps(sink):.2f}")
+
+    # Test 2b: same run with the closed-loop rate controller
+    print("\nTest 2b: 500 CPS for 2 seconds, rate_control=True")
+    sink.clear()
+    clicker.rate_control = True
+    clicker.start()
+    clicker.thread.join()
+    clicker.rate_control = False
+    state = clicker.controller_state()
+    print(f"Sink CPS: {sink_cps(sink):.2f}, window {state.achieved_cps:.2f} "
+          f"(error {state.error * 100:+.2f}%, correction x{state.correction:.3f}, burst {state.burst}, "
+          f"{'within' if state.within_tolerance else 'OUTSIDE'} tolerance)")
+
+    # Test 3: Burst mode vs one click per wake-up, above the 1 ms floor
+    for mode in ('off', 'auto'):
+        print(f"\nTest 3: 5000 CPS for 2 seconds, burst_mode={mode}")
+        sink.clear()
+        clicker.cps = 5000
+        clicker.burst_mode = mode
+        clicker.start()
+        clicker.thread.join()
+        report = clicker.burst_report()
+        print(f"Achieved CPS: {report['achieved_cps']:.2f} (sink {sink_cps(sink):.2f})")
+        print(f"Clicks/call: {report['clicks_per_call']:.1f}, "
+              f"per-call overhead: {report['per_call_us']:.2f}us, "
+              f"per-click overhead: {report['per_click_us']:.2f}us")
+
+def test_timing_strategies():
+    # CPU cost vs. remaining timing error for each wait strategy
+    print("\nTest 4: Timing strategies at 500 CPS for 2 seconds")
+    sink = RecordingInputBackend()
+    clicker = HighResClicker(sink)
+    clicker.cps = 500
+    clicker.limit_mode = 'time'
+    clicker.limit_value = 2.0
+    for mode in ('sleep', 'hybrid', 'spin'):
+        sink.clear()
+        clicker.timing_mode = mode
+        clicker.start()
+        clicker.thread.join()
+        r = clicker.timing_report()
+        print(f"{mode:>6}: sink CPS {sink_cps(sink):7.2f}, "
+              f"CPU {r['cpu_fraction'] * 100:5.1f}%, "
+              f"mean error {r['mean_error_us']:7.1f}us, max error {r['max_error_us']:8.1f}us")
+        s = clicker.interval_stats()
+        print(f"        jitter p50 {s['jitter_p50_us']:.1f}us, p99 {s['jitter_p99_us']:.1f}us, "
+              f"p99.9 {s['jitter_p999_us']:.1f}us, max {s['jitter_max_us']:.1f}us, "
+              f"window CPS {s['window_cps']:.2f}")
+
+def test_multi_stream():
+    # One scheduler thread regardless of how many streams it serves
+    print("\nTest 5: Multi-stream scheduler, 100 CPS per stream for 1 second")
+    for n_streams in (1, 5, 20):
+        sink = RecordingInputBackend()
+        sched = MultiStreamClicker(sink)
+        streams = [sched.add_stream(ClickStream(cps=100, limit_mode='time', limit_value=1.0))
+                   for _ in range(n_streams)]
+        threads_before = threading.active_count()
+        sched.start()
+        threads = threading.active_count() - threads_before
+        for stream in streams:
+            stream.finished.wait()
+        report = sched.report()
+        sched.stop()
+        worst_p99 = max(s.interval_stats()['jitter_p99_us'] for s in streams)
+        print(f"{n_streams:>3} streams: {threads} thread(s), {len(sink.press_times())} clicks, "
+              f"{report['clicks_per_batch']:.1f} clicks/batch, worst jitter p99 {worst_p99:.1f}us")
 
 if __name__ == "__main__":
     test_clicker()
+    test_timing_strategies()
+    test_multi_stream()